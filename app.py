@@ -6,18 +6,104 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import subprocess
 import time
-
-# バックエンドの自動起動（デプロイ環境用）
-if "backend_started" not in st.session_state:
-    subprocess.Popen(["uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"])
-    st.session_state.backend_started = True
-    time.sleep(3)
+import sys
+import io
+from backend.models import RoomInput, PlacedFurnitureInput
+from backend.live import LiveLayoutScorer
 
 # FastAPIサーバーのエンドポイントURL
-FASTAPI_URL = "http://127.0.0.1:8000/api/diagnose_layout"
+API_BASE_URL = "http://127.0.0.1:8000"
+FASTAPI_URL = f"{API_BASE_URL}/api/diagnose_layout"
+HEALTH_URL = f"{API_BASE_URL}/api/health"
+JOBS_URL = f"{API_BASE_URL}/api/jobs"
+SESSIONS_URL = f"{API_BASE_URL}/api/sessions"
+BACKEND_STARTUP_TIMEOUT = 30.0  # APIサーバーの起動を待つ最長時間 (秒)
+LIVE_DEBOUNCE = 0.3  # 最後の操作からこの時間 (秒) 入力が止まったらライブ採点する
+LIVE_POLL_INTERVAL = 0.5  # ライブ採点の欄を確認する間隔 (秒)
+PROPOSAL_TIME_BUDGET = 20.0  # 自動提案の探索時間 (秒)
 
 st.set_page_config(page_title="レイアウト診断", layout="wide")
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """接続を使い回すHTTPセッション (全ユーザーで共有)"""
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16))
+    return session
+
+def backend_ready() -> bool:
+    try:
+        return get_http_session().get(HEALTH_URL, timeout=0.5).ok
+    except requests.RequestException:
+        return False
+
+@st.cache_resource
+def start_backend() -> bool:
+    """
+    バックエンドの自動起動（デプロイ環境用）。Streamlitのプロセスにつき1回だけ起動し、
+    固定時間待つ代わりに /api/health が応答するまで待つ (既に起動していればそのまま使う)。
+    """
+    if backend_ready():
+        return True
+    subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"])
+    deadline = time.monotonic() + BACKEND_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if backend_ready():
+            return True
+        time.sleep(0.1)
+    # 例外にしておくと結果がキャッシュされず、次回の操作で再試行される
+    raise RuntimeError("APIサーバーの起動がタイムアウトしました")
+
+def post_diagnosis(diagnosis_request: dict) -> dict:
+    """APIサーバーで診断する。混雑時 (503) は Retry-After を添えたエラーにする"""
+    response = get_http_session().post(FASTAPI_URL, json=diagnosis_request, timeout=10)
+    if response.status_code == 503:
+        raise RuntimeError(f"サーバーが混雑しています。{response.headers.get('Retry-After', '数')}秒後に再度お試しください。")
+    if response.status_code != 200:
+        raise RuntimeError(f"エラーが発生しました: {response.status_code}")
+    return response.json()
+
+def post_live_update(diagnosis_request: dict) -> dict:
+    """
+    ライブ採点 (APIサーバー経由)。サーバー側のセッションに前回からの家具の移動・回転だけを送る。
+    部屋か家具の構成が変わったとき、またはセッションが期限切れのときはセッションを作り直す。
+    """
+    session = get_http_session()
+    previous = st.session_state.get("api_session")
+    furniture = diagnosis_request["placed_furniture_list"]
+    set_key = [(f["name"], f["category"], f["width"], f["depth"], f.get("height")) for f in furniture]
+    if previous and previous["room"] == diagnosis_request["room"] and previous["set_key"] == set_key:
+        ops = [{"op": "move", "index": i, "x": f["x"], "y": f["y"], "rotation": f["rotation"]}
+               for i, (f, old) in enumerate(zip(furniture, previous["poses"])) if (f["x"], f["y"], f["rotation"]) != old]
+        response = session.patch(f"{SESSIONS_URL}/{previous['id']}", json={"ops": ops}, timeout=10)
+    else:
+        response = None
+    if response is None or response.status_code == 404:
+        response = session.post(SESSIONS_URL, json=diagnosis_request, timeout=10)
+    if response.status_code != 200:
+        raise RuntimeError(f"エラーが発生しました: {response.status_code}")
+    result = response.json()
+    st.session_state.api_session = {"id": result["id"], "room": diagnosis_request["room"], "set_key": set_key,
+                                    "poses": [(f["x"], f["y"], f["rotation"]) for f in furniture]}
+    return result
+
+def submit_proposal_job(diagnosis_request: dict) -> str:
+    """レイアウト案の探索をジョブとして投入し、ジョブIDを返す"""
+    response = get_http_session().post(JOBS_URL, json={**diagnosis_request, "time_budget": PROPOSAL_TIME_BUDGET}, timeout=10)
+    if response.status_code != 202:
+        raise RuntimeError(f"エラーが発生しました: {response.status_code}")
+    return response.json()["id"]
+
+def stream_job_events(job_id: str):
+    """ジョブの状態 (SSE) を受け取るたびに (イベント名, 状態) を返す。終了イベントで止まる"""
+    with get_http_session().get(f"{JOBS_URL}/{job_id}/events", stream=True, timeout=(3, 60)) as response:
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+
 st.title("ルームレイアウト診断アドバイザー")
 st.markdown("現在の家具配置を入力すると、動線・ゾーニング・美観の観点からスコアとアドバイスを提供します。")
 
@@ -27,6 +113,13 @@ col_w, col_d = st.columns(2)
 room_width = col_w.slider("部屋の横幅 (Width)", 3.0, 8.0, 4.0, 0.1)
 room_depth = col_d.slider("部屋の奥行 (Depth)", 3.0, 8.0, 5.0, 0.1)
 
+# 採点の方法: アプリ内で直接計算する (起動待ち・通信なし) か、APIサーバーに問い合わせるか
+scoring_mode = st.sidebar.radio("採点の方法", ["アプリ内で計算", "APIサーバー経由"], index=0)
+use_api = scoring_mode == "APIサーバー経由"
+if use_api:
+    with st.spinner("APIサーバーを起動しています..."):
+        start_backend()
+
 st.markdown("🔧 **建具の位置設定** (壁沿いに配置してください)")
 num_doors = st.sidebar.number_input("ドアの数", 1, 3, 1)
 num_windows = st.sidebar.number_input("窓の数", 1, 3, 1)
@@ -53,10 +146,10 @@ col_input, col_preview = st.columns([7, 3])
 
 if 'furniture_list' not in st.session_state:
     st.session_state.furniture_list = [
-        {"name": "ダブルベッド", "category": "Bed", "width": 1.6, "depth": 2.0, "x": 2.0, "y": 1.5, "rotation": 0.0},
-        {"name": "デスク", "category": "Desk", "width": 1.2, "depth": 0.7, "x": 2.0, "y": 3.0, "rotation": 90.0},
-        {"name": "本棚", "category": "Shelf", "width": 0.8, "depth": 0.3, "x": 0.5, "y": 0.5, "rotation": 0.0},
-        {"name": "ソファ", "category": "Sofa", "width": 1.8, "depth": 0.9, "x": 3.5, "y": 4.0, "rotation": 180.0}
+        {"name": "ダブルベッド", "category": "Bed", "width": 1.6, "depth": 2.0, "x": 0.85, "y": 1.8, "rotation": 0.0},
+        {"name": "デスク", "category": "Desk", "width": 1.2, "depth": 0.7, "x": 2.0, "y": 3.1, "rotation": 270.0},
+        {"name": "本棚", "category": "Shelf", "width": 0.8, "depth": 0.3, "x": 3.5, "y": 0.2, "rotation": 0.0},
+        {"name": "ソファ", "category": "Sofa", "width": 1.8, "depth": 0.9, "x": 3.05, "y": 4.5, "rotation": 180.0}
     ]
 
 # 【修正点2】col_input を使用
@@ -77,8 +170,8 @@ with col_input:
             
             col_n, col_c = st.columns(2)
             f['name'] = col_n.text_input("名称", f['name'], key=f"name_{i}")
-            f['category'] = col_c.selectbox("カテゴリ", ['Bed', 'Desk', 'Sofa', 'Shelf', 'Table', 'Other'], 
-                                            index=['Bed', 'Desk', 'Sofa', 'Shelf', 'Table', 'Other'].index(f['category']), 
+            f['category'] = col_c.selectbox("カテゴリ", ['Bed', 'Desk', 'Sofa', 'Shelf', 'Table', 'Chair', 'Other'], 
+                                            index=['Bed', 'Desk', 'Sofa', 'Shelf', 'Table', 'Chair', 'Other'].index(f['category']), 
                                             key=f"cat_{i}")
             
             c1, c2, c3 = st.columns(3)
@@ -97,9 +190,45 @@ with col_input:
             st.session_state.furniture_list.pop(i)
         st.rerun()
 
+# --- 入力をまとめる (ライブ採点と診断ボタンで共用) ---
+diagnosis_request = {
+    "room": {
+        "width": room_width,
+        "depth": room_depth,
+        "door_positions": door_positions,
+        "window_positions": window_positions
+    },
+    "placed_furniture_list": furniture_inputs
+}
+
+def live_scorer() -> LiveLayoutScorer:
+    """部屋・占有グリッドなどの計算状態はセッションごとに保持し、操作のたびに差分だけ更新する"""
+    if "live_scorer" not in st.session_state:
+        st.session_state.live_scorer = LiveLayoutScorer()
+    return st.session_state.live_scorer
+
+def score_in_process(request: dict, detailed: bool = False) -> dict:
+    scorer = live_scorer()
+    result = scorer.update(
+        RoomInput(**request["room"]),
+        [PlacedFurnitureInput(**f) for f in request["placed_furniture_list"]]
+    )
+    return scorer.diagnose() if detailed else result
+
+# 入力が変わった時刻を記録し、ライブ採点は入力が LIVE_DEBOUNCE 秒止まってから行う
+layout_key = json.dumps(diagnosis_request, sort_keys=True)
+if st.session_state.get("live_pending_key") != layout_key:
+    st.session_state.live_pending_key = layout_key
+    st.session_state.live_pending_request = json.loads(layout_key)
+    st.session_state.live_changed_at = time.monotonic()
+
 # --- 右側のプレビュー表示 (占有率30%に収める) ---
-with col_preview:
-    st.subheader("レイアウト図")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_layout_png(layout_json: str) -> bytes:
+    """レイアウト図を描画してPNGにする。同じ配置は描き直さない"""
+    layout = json.loads(layout_json)
+    room_width, room_depth = layout["room"]["width"], layout["room"]["depth"]
     fig, ax = plt.subplots(figsize=(4, 4))
     ax.set_xlim(-0.2, room_width + 0.2)
     ax.set_ylim(-0.2, room_depth + 0.2)
@@ -109,7 +238,7 @@ with col_preview:
     room_rect = patches.Rectangle((0, 0), room_width, room_depth, fill=False, edgecolor='black', lw=3)
     ax.add_patch(room_rect)
 
-    for f in furniture_inputs:
+    for f in layout["placed_furniture_list"]:
         rect = patches.Rectangle(
             (f['x'] - f['width']/2, f['y'] - f['depth']/2), 
             f['width'], f['depth'], 
@@ -120,57 +249,113 @@ with col_preview:
         label_text = f"{f['category']}" # 例: Bed, Desk
         ax.text(f['x'], f['y'], label_text, ha='center', va='center', fontsize=6, fontweight='bold')
 
-    for d in door_positions:
+    for d in layout["room"]["door_positions"]:
         ax.plot(d[0], d[1], 'rs', markersize=10)
-    for w in window_positions:
+    for w in layout["room"]["window_positions"]:
         ax.plot(w[0], w[1], 'gs', markersize=10)
 
-    st.pyplot(fig, use_container_width=True)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=150, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+@st.fragment(run_every=LIVE_POLL_INTERVAL)
+def live_score_panel():
+    """ライブスコア。入力が止まってから採点し、採点済みの配置なら何もしない"""
+    pending_key = st.session_state.live_pending_key
+    settled = time.monotonic() - st.session_state.live_changed_at >= LIVE_DEBOUNCE
+    if pending_key != st.session_state.get("live_scored_key") and settled:
+        try:
+            request = st.session_state.live_pending_request
+            st.session_state.live_result = post_live_update(request) if use_api else score_in_process(request)
+            st.session_state.live_error = None
+        except Exception as e:
+            st.session_state.live_error = str(e)
+        st.session_state.live_scored_key = pending_key
+    elif settled and not use_api and live_scorer().refresh():
+        # 入力が止まっている間に距離場を作り直し、前回の距離場で概算していた動線を最新にする
+        st.session_state.live_result = live_scorer().summary()
+
+    result = st.session_state.get("live_result")
+    if st.session_state.get("live_error"):
+        st.caption(f"ライブスコアを計算できません: {st.session_state.live_error}")
+    elif result is not None:
+        stale = pending_key != st.session_state.get("live_scored_key")
+        st.metric("ライブスコア", f"{result['total_score']}点" + (" (更新中…)" if stale else ""))
+        st.caption(f"動線 {result['details']['circulation']:.2f} / ゾーニング {result['details']['zoning']:.2f} / 美観 {result['details']['aesthetics']:.2f} / 採光 {result['details']['daylight']:.2f}")
+        for warning in result.get("warnings", []):
+            st.caption(f"⚠️ {warning}")
+
+with col_preview:
+    st.subheader("レイアウト図")
+    st.image(render_layout_png(layout_key), use_container_width=True)
     st.caption("🔴:ドア 🟢:窓")
-    st.info("スライダーを動かすと図が更新されます。")
+    live_score_panel()
+    st.info("スライダーを動かすと図とライブスコアが更新されます。")
 
 # 【修正点3】重複していた巨大な図の描画コード（旧2.5）を削除しました
 
 # --- 3. 診断ボタン ---
 st.markdown("---")
 if st.button("このレイアウトを診断する", type="primary"):
-    diagnosis_request = {
-        "room": {
-            "width": room_width,
-            "depth": room_depth,
-            "door_positions": door_positions,
-            "window_positions": window_positions
-        },
-        "placed_furniture_list": furniture_inputs
-    }
-    
     try:
-        response = requests.post(FASTAPI_URL, json=diagnosis_request, timeout=10)
-        if response.status_code == 200:
-            result = response.json()
-            st.success("診断が完了しました！")
+        result = post_diagnosis(diagnosis_request) if use_api else score_in_process(diagnosis_request, detailed=True)
+        st.success("診断が完了しました！")
+        
+        col_score, col_advice = st.columns([1, 2])
+        with col_score:
+            st.metric("総合スコア", f"{result['total_score']}点")
+            st.write(f"動線: {result['details']['circulation']:.2f}")
+            st.write(f"ゾーニング: {result['details']['zoning']:.2f}")
+            st.write(f"美観: {result['details']['aesthetics']:.2f}")
+            st.write(f"採光: {result['details']['daylight']:.2f}")
+
+        with col_advice:
+            st.subheader("アドバイス")
+            st.info(result['advice'])
+            details = result['details']
             
-            col_score, col_advice = st.columns([1, 2])
-            with col_score:
-                st.metric("総合スコア", f"{result['total_score']}点")
-                st.write(f"動線: {result['details']['circulation']:.2f}")
-                st.write(f"ゾーニング: {result['details']['zoning']:.2f}")
-                st.write(f"美観: {result['details']['aesthetics']:.2f}")
-
-            with col_advice:
-                st.subheader("アドバイス")
-                st.info(result['advice'])
-                details = result['details']
-                
-                if details['circulation'] < 0.6:
-                    st.warning("**動線スコアが低いです。** 家具を壁に寄せ、ドアからの経路を確保しましょう。")
-                if details['zoning'] < 0.6:
-                    st.warning("**ゾーニングスコアが低いです。** 寝る場所と働く場所を離しましょう。")
-                if details['aesthetics'] < 0.8:
-                    st.warning("**美観スコアを改善しましょう。** デスクの向きや窓との関係を見直してください。")
-                if not result.get('is_valid', True):
-                    st.error("**物理的な重なりがあります。** 配置を修正してください。")
-        else:
-            st.error(f"エラーが発生しました: {response.status_code}")
+            if details['circulation'] < 0.6:
+                st.warning("**動線スコアが低いです。** 家具を壁に寄せ、ドアからの経路を確保しましょう。")
+            if details['zoning'] < 0.6:
+                st.warning("**ゾーニングスコアが低いです。** 寝る場所と働く場所を離しましょう。")
+            if details['aesthetics'] < 0.8:
+                st.warning("**美観スコアを改善しましょう。** デスクの向きや窓との関係を見直してください。")
+            if details['daylight'] < 0.5:
+                st.warning("**採光スコアが低いです。** 棚などの背の高い家具を窓とデスク・ソファの間に置かないようにしましょう。")
+            if not result.get('is_valid', True):
+                st.error("**物理的な重なりがあります。** 配置を修正してください。")
+    except requests.RequestException as e:
+        st.error(f"サーバーに接続できません: {e}")
+    except Exception as e:
+        st.error(str(e))
+
+# --- 4. レイアウト案の自動提案 (APIサーバーのジョブ) ---
+st.markdown("---")
+st.header("4. レイアウト案の自動提案")
+if not use_api:
+    st.caption("自動提案はAPIサーバーで実行します。サイドバーで「APIサーバー経由」を選んでください。")
+elif st.button("より良い配置を探す"):
+    # 探索は数十秒かかるため、見つかった最良案を届いた順に表示し続ける
+    status_box, score_box, image_box = st.empty(), st.empty(), st.empty()
+    try:
+        job_id = submit_proposal_job(diagnosis_request)
+        for event, job in stream_job_events(job_id):
+            progress = job.get("progress")
+            if progress:
+                best = progress["best"]
+                status_box.caption(f"探索中… {progress['generation']}世代 / {progress['elapsed']:.1f}秒")
+                score_box.metric("これまでの最良案", f"{best['total_score']}点")
+                image_box.image(render_layout_png(json.dumps({"room": diagnosis_request["room"],
+                                                              "placed_furniture_list": best["placed_furniture_list"]}, sort_keys=True)))
+            if event == "done":
+                status_box.success(f"探索が完了しました ({job['result']['generations']}世代)。")
+                for proposal in job["result"]["proposals"]:
+                    with st.expander(f"案{proposal['rank']}: {proposal['total_score']}点"):
+                        st.json(proposal["placed_furniture_list"])
+            elif event in ("cancelled", "failed"):
+                status_box.error(f"探索が中断されました: {job.get('error') or event}")
+    except requests.RequestException as e:
+        st.error(f"サーバーに接続できません: {e}")
     except Exception as e:
-        st.error(f"サーバーに接続できません: {e}")
\ No newline at end of file
+        st.error(str(e))
@@ -0,0 +1,543 @@
+import math
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.scoring import (
+    RESOLUTION,
+    rasterize_item,
+    axis_aligned_extents,
+    item_corners,
+    item_extent,
+    create_door_distance_field,
+    door_cells,
+    lookup_window_distance,
+    weighted_total
+)
+from backend.batch_scoring import FurnitureSet, encode_layout, overlaps_with, score_zoning_batch
+from backend.collision import OVERLAP_TOLERANCE, furniture_corners
+from backend.daylight import DaylightState
+from backend.rules import CLEARANCE_PENALTY, ClearanceState
+from backend.pathfinding import HIERARCHICAL_MIN_CELLS, ClusterGraph, HierarchicalDistanceField
+from backend.optimizer import ROTATIONS, VIOLATION_PENALTY, WALL_MARGIN, describe_layout
+
+# 焼きなまし法による局所探索。
+# 1ステップで家具を1つだけ動かすため、レイアウト全体を採点し直さずに差分だけを更新する。
+
+# --- 家具1つの美観 ---
+# score_desk_aesthetics / score_bed_aesthetics と同じ式。移動のたびに呼ぶので、numpy の小さな配列を作らずに計算する
+
+def _unit(dx: float, dy: float, default: Tuple[float, float] = (0.0, 1.0)) -> Tuple[float, float]:
+    norm = math.sqrt(dx * dx + dy * dy)
+    return (dx / norm, dy / norm) if norm != 0 else default
+
+def _desk_aesthetics(room: Room, x: float, y: float, rotation: float) -> float:
+    """デスク評価 (窓に対して横向き、ドアを背にしない)"""
+    angle = math.radians(rotation)
+    fx, fy = -math.sin(angle), math.cos(angle)  # 正面の向き
+    win_score = 0.0
+    for wx, wy in room.window_positions:
+        ux, uy = _unit(x - wx, y - wy, (0.0, 0.0))
+        win_score = max(win_score, 1.0 - abs(fx * ux + fy * uy))
+    wall_score = 0.0
+    for dx, dy in room.door_positions:
+        ux, uy = _unit(dx - x, dy - y)
+        wall_score = max(wall_score, 1.0 - abs(fx * ux + fy * uy))
+    return 0.5 * win_score + 0.5 * wall_score
+
+def _bed_aesthetics(room: Room, x: float, y: float, rotation: float) -> float:
+    """ベッド評価 (頭の位置からドアが見えるが直線上ではない)"""
+    angle = math.radians(rotation)
+    bx, by = math.sin(angle), -math.cos(angle)  # 正面の逆
+    score = 0.0
+    for dx, dy in room.door_positions:
+        ux, uy = _unit(dx - x, dy - y)
+        score = max(score, 1.0 if bx * ux + by * uy > 0.7 else 0.5)
+    return score
+
+# --- 差分更新できるレイアウト状態 ---
+
+class IncrementalLayoutState:
+    """
+    家具1つの移動・回転ごとに、変化したグリッドのセル・重なり表の行・影響を受けるスコア項だけを更新する。
+    直前の移動は undo() で再計算なしに取り消せる。
+
+    動線の距離場は再計算コストが大きいため、グリッドを変える移動を field_refresh_interval 回
+    確定するごとに作り直す。それまでの間は、動かした家具の参照位置だけを古い距離場で更新する。
+
+    hierarchical が真 (省略時はグリッドが HIERARCHICAL_MIN_CELLS 以上のとき) なら、距離場を
+    クラスタの抽象グラフ (backend.pathfinding) で求め、作り直しでは家具が動いたクラスタだけを更新する。
+    作り直しの間に動く家具が少ないとき (画面操作のライブ採点など) に向く。
+    このとき distance_field は配列ではなく HierarchicalDistanceField になる。
+
+    violations は はみ出し・重なり・ハード制約のクリアランス違反 (ドアの開閉スペース) の合計、
+    soft_violations はソフト制約のクリアランス違反の数 (どちらも evaluate_population の減点と同じ数え方)。
+
+    move(defer=True) は はみ出し・重なり以外の更新 (グリッドとスコア、クリアランスと採光) を後回しにする。
+    settle_next() で1段階ずつ進め、その時点の fitness_bound (適応度の上限) で受理されないと分かった移動は、
+    残りを更新しないまま undo() できる。後回しにした更新は、fitness などの値を読むか commit() したときにも行う。
+
+    採光は総合点に含めないため、track_daylight が偽なら追跡しない (daylight は None になる)。
+    """
+    def __init__(self, room: Room, placed_furniture_list: List[PlacedFurniture],
+                 resolution: float = RESOLUTION, field_refresh_interval: int = 200, hierarchical: Optional[bool] = None,
+                 track_daylight: bool = True):
+        self.room = room
+        self.resolution = resolution
+        self.field_refresh_interval = field_refresh_interval
+        self.furniture_set = FurnitureSet(placed_furniture_list)
+        self.poses = encode_layout(placed_furniture_list)
+        # 呼び出し元の家具を書き換えないよう、内部用の複製を持つ
+        self.items = self.furniture_set.to_placed_furniture(self.poses)
+        self.max_path_len = room.width + room.depth + 1.0
+
+        # 占有グリッド (セルごとに重なっている家具の数を数える)
+        shape = (int(room.depth / resolution), int(room.width / resolution))
+        self.coverage = np.zeros(shape, dtype=np.uint16)
+        self.footprints = [rasterize_item(item, shape, resolution) for item in self.items]
+        for footprint in self.footprints:
+            self._stamp(footprint, 1)
+
+        # ハード制約 (はみ出し・重なりの対称表)
+        # 四隅は4方向でない家具がある場合の重なり判定にしか使わないので、動かした家具の分は必要になるまで計算しない
+        self.corners = furniture_corners(self.items)
+        self._stale_corners = set()
+        self.extents = [item_extent(item) for item in self.items]
+        self.unaligned = sum(axis_aligned_extents(item) is None for item in self.items)  # 4方向でない家具の数
+        self.outside = [not self._inside(k) for k in range(len(self.items))]
+        self.overlaps = np.zeros((len(self.items), len(self.items)), dtype=bool)
+        for k in range(len(self.items)):
+            self.overlaps[k] = self._overlap_row(k)
+        # クリアランス規則 (ラベルグリッドを保持し、動いた家具が関わる領域だけを判定し直す)
+        self.clearance_state = ClearanceState(room, self.furniture_set, self.poses, self.footprints, resolution)
+        self.collisions = sum(self.outside) + int(self.overlaps.sum()) // 2  # はみ出し・重なりの数
+        # 更新を後回しにしている家具 (グリッドとスコア / クリアランスと採光)
+        self._pending_scores: Optional[int] = None
+        self._pending_rules: Optional[int] = None
+
+        # 美観・ゾーニングと動線の対象家具 (カテゴリで決まる)
+        self._index_categories()
+
+        # 採光 (窓から対象家具のセルへの光線の可視性を保持し、光を遮る家具が動いたら影の範囲だけ判定し直す)
+        self.daylight_state = DaylightState(room, self.items) if track_daylight else None
+
+        # 動線 (対象家具ごとのドアからの経路長)
+        self.path_lengths = [np.inf] * len(self.items)
+        self._circulation: Optional[float] = None  # path_lengths から求めた動線スコア (変わったら None に戻す)
+        self.pending_grid_changes = 0
+        if hierarchical is None:
+            hierarchical = self.coverage.size >= HIERARCHICAL_MIN_CELLS
+        self.cluster_graph = ClusterGraph(self.coverage, resolution=resolution) if hierarchical else None
+        self.dirty_regions: List[Tuple[int, int, int, int]] = []  # 前回の作り直し以降に変化したセル範囲
+        self.distance_field = None
+        self.refresh_distance_field()
+
+        self._undo = None
+
+    # --- 内部ユーティリティ ---
+
+    def _stamp(self, footprint: Tuple[int, int, np.ndarray], sign: int):
+        r0, c0, mask = footprint
+        window = self.coverage[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]]
+        if sign > 0:
+            window += mask
+        else:
+            window -= mask
+
+    def _inside(self, k: int) -> bool:
+        """is_inside_room と同じ判定"""
+        x0, x1, y0, y1 = self.extents[k]
+        return 0 <= x0 and x1 <= self.room.width and 0 <= y0 and y1 <= self.room.depth
+
+    def _overlap_row(self, k: int) -> np.ndarray:
+        """
+        家具 k と重なっている家具のマスク (overlaps_with と同じ判定)。
+        全家具が4方向なら分離軸は x, y 軸だけなので、外接矩形の重なりの幅で判定する
+        (重なりの幅 min(x1, b) - max(x0, a) が許容値を超える ⇔ 4通りの差がすべて超える)。
+        """
+        if self.unaligned:
+            self._update_corners()
+            return overlaps_with(self.corners, k)
+        x0, x1, y0, y1 = self.extents[k]
+        tol = OVERLAP_TOLERANCE
+        if x1 - x0 <= tol or y1 - y0 <= tol:
+            return np.zeros(len(self.extents), dtype=bool)
+        row = [x1 - a > tol and b - x0 > tol and b - a > tol and y1 - c > tol and d - y0 > tol and d - c > tol
+               for a, b, c, d in self.extents]
+        row[k] = False
+        return np.array(row)
+
+    def _update_corners(self):
+        """計算を後回しにしていた四隅を求める"""
+        for i in self._stale_corners:
+            self.corners[i] = item_corners(self.items[i])
+        self._stale_corners.clear()
+
+    def _index_categories(self):
+        """カテゴリで決まる採点の対象を作り直す (初期化時と、家具の追加・削除の後)"""
+        fs = self.furniture_set
+        # 美観 (score_aesthetics と同じくデスク→ベッドの順に家具ごとの点数を保持)
+        self.aesthetic_slots = {k: slot for slot, k in enumerate(fs.indices('Desk') + fs.indices('Bed'))}
+        self.aesthetic_scores = [self._item_aesthetics(k) for k in self.aesthetic_slots]
+        self._zoning = self._score_zoning()
+        self.targets = [k for k, c in enumerate(fs.categories) if c in ['Bed', 'Desk', 'Sofa']]
+        self.target_set = set(self.targets)
+
+    def _item_aesthetics(self, k: int) -> float:
+        item = self.items[k]
+        if self.furniture_set.categories[k] == 'Desk':
+            return _desk_aesthetics(self.room, item.x, item.y, item.rotation)
+        return _bed_aesthetics(self.room, item.x, item.y, item.rotation)
+
+    def _score_zoning(self) -> float:
+        """score_zoning と同じ値 (ベッドとデスクの全組の距離を一括で計算する)"""
+        return float(score_zoning_batch(self.furniture_set, self.poses[None])[0])
+
+    @staticmethod
+    def _footprint_bounds(footprint: Tuple[int, int, np.ndarray]) -> Tuple[int, int, int, int]:
+        r0, c0, mask = footprint
+        return r0, r0 + mask.shape[0] - 1, c0, c0 + mask.shape[1] - 1
+
+    def _lookup_path_length(self, k: int) -> float:
+        """家具 k の占有セル範囲の周囲を距離場から参照する"""
+        bounds = self._footprint_bounds(self.footprints[k])
+        if self.cluster_graph is not None:
+            return self.distance_field.window_min(*bounds)
+        return lookup_window_distance(self.distance_field, *bounds)
+
+    def refresh_distance_field(self):
+        """現在のグリッドでドアからの距離場を作り直し、全対象家具の経路長を更新"""
+        self.settle(rules=False)
+        if self.cluster_graph is not None:
+            self.cluster_graph.update(self.dirty_regions)
+            self.dirty_regions = []
+            previous = self.distance_field if isinstance(self.distance_field, HierarchicalDistanceField) else None
+            self.distance_field = HierarchicalDistanceField(
+                self.cluster_graph, door_cells(self.room, self.coverage.shape, self.resolution), previous)
+        else:
+            self.distance_field = create_door_distance_field(self.room, self.coverage, self.resolution)
+        for k in self.targets:
+            self.path_lengths[k] = self._lookup_path_length(k)
+        self._circulation = None
+        self.pending_grid_changes = 0
+
+    # --- 採点 ---
+
+    @property
+    def circulation(self) -> float:
+        self.settle(rules=False)
+        if self._circulation is None:
+            scores = [1.0 - min(max(self.path_lengths[k] / self.max_path_len, 0.0), 1.0)
+                      for k in self.targets if self.path_lengths[k] != np.inf]
+            self._circulation = sum(scores) / len(scores) if scores else 0.5
+        return self._circulation
+
+    @property
+    def zoning(self) -> float:
+        self.settle(rules=False)
+        return self._zoning
+
+    @property
+    def aesthetics(self) -> float:
+        self.settle(rules=False)
+        scores = self.aesthetic_scores
+        return sum(scores) / len(scores) if scores else 0.5
+
+    @property
+    def daylight(self) -> Optional[float]:
+        if self.daylight_state is None:
+            return None
+        self.settle()
+        return self.daylight_state.score
+
+    @property
+    def violations(self) -> int:
+        self.settle()
+        return self.collisions + self.clearance_state.hard
+
+    @property
+    def soft_violations(self) -> int:
+        self.settle()
+        return self.clearance_state.soft
+
+    @property
+    def fitness(self) -> float:
+        return (weighted_total(self.circulation, self.zoning, self.aesthetics)
+                - VIOLATION_PENALTY * self.violations - CLEARANCE_PENALTY * self.soft_violations)
+
+    @property
+    def fitness_bound(self) -> float:
+        """
+        後回しにした更新を行わずに求める適応度の上限。
+        スコアが未更新なら 動線・ゾーニング・美観がすべて満点、クリアランスが未判定なら違反がすべて解消した場合の値。
+        すべて更新済みなら fitness と同じ値。
+        """
+        if self._pending_scores is not None:
+            return weighted_total(1.0, 1.0, 1.0) - VIOLATION_PENALTY * self.collisions
+        if self._pending_rules is not None:
+            return weighted_total(self.circulation, self._zoning, self.aesthetics) - VIOLATION_PENALTY * self.collisions
+        return self.fitness
+
+    # --- 差分更新 ---
+
+    def move(self, k: int, x: float, y: float, rotation: float, defer: bool = False):
+        """家具 k を (x, y, rotation) に置き、変化した部分だけを更新する (defer ならはみ出し・重なり以外は settle() まで待つ)"""
+        self.settle()
+        item = self.items[k]
+        old_row = self.overlaps[k].copy()
+        self._undo = (k, item.x, item.y, item.rotation, self.extents[k], self.footprints[k], self.outside[k], old_row,
+                      self.aesthetic_scores[self.aesthetic_slots[k]] if k in self.aesthetic_slots else None,
+                      self._zoning, self.path_lengths[k], self._circulation, self.collisions)
+
+        item.x, item.y, item.rotation = x, y, rotation
+        self.poses[k] = (x, y, rotation)
+
+        # ハード制約: 家具 k のはみ出しと、重なり表の k 行・k 列だけを更新
+        self.unaligned += (rotation % 90 != 0) - (self._undo[3] % 90 != 0)
+        self._stale_corners.add(k)
+        self.extents[k] = item_extent(item)
+        outside = not self._inside(k)
+        row = self._overlap_row(k)
+        self.overlaps[k] = row
+        self.overlaps[:, k] = row
+        self.collisions += (outside - self.outside[k]) + int(np.count_nonzero(row)) - int(np.count_nonzero(old_row))
+        self.outside[k] = outside
+
+        self._pending_scores = self._pending_rules = k
+        if not defer:
+            self.settle()
+
+    def settle(self, rules: bool = True) -> bool:
+        """
+        後回しにした更新を行う (rules が偽ならグリッドとスコアだけ)。
+        何か更新した場合は True を返す。
+        """
+        k = self._pending_scores
+        if k is not None:
+            self._pending_scores = None
+            # グリッド: 元の位置のセルを外し、新しい位置のセルを加える
+            old_footprint = self.footprints[k]
+            self._stamp(old_footprint, -1)
+            self.footprints[k] = rasterize_item(self.items[k], self.coverage.shape, self.resolution)
+            self._stamp(self.footprints[k], 1)
+            if self.cluster_graph is not None:
+                self.dirty_regions += [self._footprint_bounds(old_footprint), self._footprint_bounds(self.footprints[k])]
+
+            # スコア: 動かした家具が関わる項だけを再計算
+            if k in self.aesthetic_slots:
+                self.aesthetic_scores[self.aesthetic_slots[k]] = self._item_aesthetics(k)
+                self._zoning = self._score_zoning()
+            if k in self.target_set:
+                self.path_lengths[k] = self._lookup_path_length(k)
+                self._circulation = None
+            if not rules:
+                return True
+
+        k = self._pending_rules
+        if k is None or not rules:
+            return False
+        self._pending_rules = None
+        # クリアランス: 家具 k の領域と、k の元の位置・新しい位置に掛かる領域だけを判定し直す
+        self.clearance_state.move(k, self.poses, self.footprints)
+        if self.daylight_state is not None:
+            self.daylight_state.move(k, self.items[k])
+        return True
+
+    def settle_next(self) -> bool:
+        """後回しにした更新を1段階 (グリッドとスコア → クリアランスと採光) だけ進める。何も残っていなければ False"""
+        return self.settle(rules=self._pending_scores is None)
+
+    def undo(self):
+        """直前の move() を取り消す"""
+        k, x, y, rotation, extent, footprint, outside, row, aesthetic, zoning, path_length, circulation, collisions = self._undo
+        item = self.items[k]
+        self.unaligned += (rotation % 90 != 0) - (item.rotation % 90 != 0)
+        item.x, item.y, item.rotation = x, y, rotation
+        self.poses[k] = (x, y, rotation)
+        self._stale_corners.add(k)
+        self.extents[k] = extent
+
+        self.outside[k] = outside
+        self.overlaps[k] = row
+        self.overlaps[:, k] = row
+        self.collisions = collisions
+
+        # 後回しにしたまま取り消す更新は、元に戻す必要もない
+        if self._pending_scores is None:
+            self._stamp(self.footprints[k], -1)
+            self._stamp(footprint, 1)
+            self.footprints[k] = footprint
+            if self.cluster_graph is not None:
+                del self.dirty_regions[-2:]
+            if aesthetic is not None:
+                self.aesthetic_scores[self.aesthetic_slots[k]] = aesthetic
+            self._zoning = zoning
+            self.path_lengths[k] = path_length
+            self._circulation = circulation
+        if self._pending_rules is None:
+            self.clearance_state.undo()
+            if self.daylight_state is not None:
+                self.daylight_state.undo()
+        self._pending_scores = self._pending_rules = None
+        self._undo = None
+
+    def add(self, item: PlacedFurniture) -> int:
+        """家具を追加し、その番号を返す。取り消しはできない (直前の move() も確定する)"""
+        self.settle()
+        item = FurnitureSet([item]).to_placed_furniture(encode_layout([item]))[0]
+        k = len(self.items)
+        self.items.append(item)
+        self.furniture_set = FurnitureSet(self.items)
+        self.poses = np.vstack([self.poses, [[item.x, item.y, item.rotation]]])
+
+        footprint = rasterize_item(item, self.coverage.shape, self.resolution)
+        self.footprints.append(footprint)
+        self._stamp(footprint, 1)
+        if self.cluster_graph is not None:
+            self.dirty_regions.append(self._footprint_bounds(footprint))
+
+        # 重なり表は1行・1列だけ広げて、新しい家具の行を判定する
+        self._update_corners()
+        self.corners = np.concatenate([self.corners, np.array(item.get_corners(), dtype=float).reshape(1, 4, 2)])
+        self.extents.append(item_extent(item))
+        self.unaligned += axis_aligned_extents(item) is None
+        self.outside.append(not self._inside(k))
+        overlaps = np.zeros((k + 1, k + 1), dtype=bool)
+        overlaps[:k, :k] = self.overlaps
+        row = self._overlap_row(k)
+        overlaps[k] = row
+        overlaps[:, k] = row
+        self.overlaps = overlaps
+        self.clearance_state.rebuild(self.furniture_set, self.poses, self.footprints)
+        self.collisions = sum(self.outside) + int(self.overlaps.sum()) // 2
+
+        self._index_categories()
+        self.path_lengths.append(self._lookup_path_length(k) if k in self.target_set else np.inf)
+        self._circulation = None
+        if self.daylight_state is not None:
+            self.daylight_state.add(item)
+        self.pending_grid_changes += 1
+        self._undo = None
+        return k
+
+    def remove(self, k: int):
+        """家具 k を削除する (以降の家具の番号は1つずつ詰まる)。取り消しはできない"""
+        self.settle()
+        self._update_corners()
+        self._stamp(self.footprints[k], -1)
+        if self.cluster_graph is not None:
+            self.dirty_regions.append(self._footprint_bounds(self.footprints[k]))
+        self.unaligned -= axis_aligned_extents(self.items[k]) is None
+        del self.items[k]
+        del self.extents[k]
+        del self.footprints[k]
+        del self.outside[k]
+        del self.path_lengths[k]
+        self._circulation = None
+        self.furniture_set = FurnitureSet(self.items)
+        self.poses = np.delete(self.poses, k, axis=0)
+        self.corners = np.delete(self.corners, k, axis=0)
+        self.overlaps = np.delete(np.delete(self.overlaps, k, axis=0), k, axis=1)
+        self.clearance_state.rebuild(self.furniture_set, self.poses, self.footprints)
+        self.collisions = sum(self.outside) + int(self.overlaps.sum()) // 2
+
+        self._index_categories()
+        if self.daylight_state is not None:
+            self.daylight_state.remove(k)
+        self.pending_grid_changes += 1
+        self._undo = None
+
+    def commit(self) -> bool:
+        """直前の move() を確定する。距離場を作り直した場合は True を返す"""
+        self.settle()
+        self._undo = None
+        self.pending_grid_changes += 1
+        if self.pending_grid_changes >= self.field_refresh_interval:
+            self.refresh_distance_field()
+            return True
+        return False
+
+    def placed_furniture(self) -> List[PlacedFurniture]:
+        return self.furniture_set.to_placed_furniture(self.poses)
+
+# --- 焼きなまし法 ---
+
+class SimulatedAnnealingOptimizer:
+    def __init__(self, room: Room, placed_furniture_list: List[PlacedFurniture], seed: Optional[int] = None,
+                 initial_temperature: float = 0.05, final_temperature: float = 1e-4,
+                 field_refresh_interval: int = 200):
+        # 焼きなましは作り直しまでに多くの家具を動かすため、クラスタの大半を作り直すことになり階層的探索は割に合わない
+        # 採光は総合点に含めないので追跡しない
+        self.state = IncrementalLayoutState(room, placed_furniture_list, field_refresh_interval=field_refresh_interval,
+                                            hierarchical=False, track_daylight=False)
+        self.rng = np.random.default_rng(seed)
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.steps = 0
+        self.accepted = 0
+        self.elapsed = 0.0
+
+    def _propose(self, k: int, kind: float, shift: Tuple[float, float], rotation: float, progress: float) -> Tuple[float, float, float]:
+        """家具 k の移動 (70%) または回転 (30%) を作り、部屋に収まるよう中心を制限する"""
+        item = self.state.items[k]
+        x, y, new_rotation = item.x, item.y, item.rotation
+        if kind < 0.3:
+            new_rotation = rotation
+        else:
+            # 探索が進むほど移動幅を小さくする
+            sigma = (0.05 + 0.45 * (1.0 - progress)) * max(self.state.room.width, self.state.room.depth) / 2
+            x, y = x + shift[0] * sigma, y + shift[1] * sigma
+
+        angle_rad = math.radians(new_rotation)
+        cos_t, sin_t = abs(math.cos(angle_rad)), abs(math.sin(angle_rad))
+        hx = (item.width * cos_t + item.depth * sin_t) / 2 + WALL_MARGIN
+        hy = (item.width * sin_t + item.depth * cos_t) / 2 + WALL_MARGIN
+        room = self.state.room
+        x = room.width / 2 if 2 * hx > room.width else min(max(x, hx), room.width - hx)
+        y = room.depth / 2 if 2 * hy > room.depth else min(max(y, hy), room.depth - hy)
+        return x, y, new_rotation
+
+    def run(self, max_steps: int = 20000, time_budget: Optional[float] = None, block_size: int = 1024) -> Dict:
+        """最大 max_steps 回 (または time_budget 秒) の移動を試し、最良の配置を採点し直して返す"""
+        state = self.state
+        m = len(state.items)
+        best_fitness, best_poses = state.fitness, state.poses.copy()
+        current = best_fitness
+        t_ratio = self.final_temperature / self.initial_temperature
+        start = time.perf_counter()
+
+        while m and self.steps < max_steps:
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+            # 乱数はまとめて生成し、ループ内のオーバーヘッドを減らす
+            n = min(block_size, max_steps - self.steps)
+            ks = self.rng.integers(0, m, size=n).tolist()
+            kinds = self.rng.random(n).tolist()
+            shifts = self.rng.normal(size=(n, 2)).tolist()
+            rotations = self.rng.choice(ROTATIONS, size=n).tolist()
+            accepts = self.rng.random(n).tolist()
+
+            for i in range(n):
+                progress = self.steps / max_steps
+                temperature = self.initial_temperature * t_ratio ** progress
+                k = ks[i]
+                state.move(k, *self._propose(k, kinds[i], shifts[i], rotations[i], progress), defer=True)
+                # 後回しにした更新を1段階ずつ進め、その時点の上限でも受理されない移動 (重なりを作る移動など) は
+                # 残りを更新せずに取り消す (適応度はこの上限以下なので、受理の判定は変わらない)
+                while True:
+                    candidate = state.fitness_bound  # すべて更新し終えた後は fitness と同じ値
+                    delta = candidate - current
+                    accepted = delta >= 0 or accepts[i] < math.exp(delta / temperature)
+                    if not accepted or not state.settle_next():
+                        break
+                if accepted:
+                    current = state.fitness if state.commit() else candidate
+                    self.accepted += 1
+                    if current > best_fitness:
+                        best_fitness, best_poses = current, state.poses.copy()
+                else:
+                    state.undo()
+                self.steps += 1
+
+        self.elapsed = time.perf_counter() - start
+        return describe_layout(state.room, state.furniture_set.to_placed_furniture(best_poses))
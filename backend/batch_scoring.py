@@ -0,0 +1,223 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from backend.models import Room, PlacedFurniture, PlacedFurnitureInput
+from backend.collision import OVERLAP_TOLERANCE, overlapping, penetration_depths
+
+# 母集団 (N個のレイアウト × M個の家具) を一括で採点する。
+# 姿勢配列 poses の形状は (N, M, 3) で、最後の軸は (x, y, rotation[度])。
+# 結果は backend/scoring.py の単体関数と完全に一致させる。
+
+# --- 家具セット (母集団で共有する静的情報) ---
+
+class FurnitureSet:
+    """母集団の全レイアウトで共通の家具情報 (名称・カテゴリ・寸法)"""
+    def __init__(self, placed_furniture_list: List[PlacedFurniture]):
+        self.names = [f.name for f in placed_furniture_list]
+        self.categories = [f.category for f in placed_furniture_list]
+        self.heights = [f.height for f in placed_furniture_list]
+        self.widths = np.array([f.width for f in placed_furniture_list], dtype=float)
+        self.depths = np.array([f.depth for f in placed_furniture_list], dtype=float)
+        # 重なり判定の対象となる家具ペア (i < j の上三角)
+        self.pairs = np.triu_indices(len(placed_furniture_list), k=1)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def indices(self, category: str) -> List[int]:
+        return [i for i, c in enumerate(self.categories) if c == category]
+
+    def to_placed_furniture(self, pose: np.ndarray) -> List[PlacedFurniture]:
+        """1レイアウト分の姿勢 (M, 3) を PlacedFurniture のリストに戻す"""
+        return [
+            PlacedFurniture(PlacedFurnitureInput(
+                name=self.names[i], category=self.categories[i],
+                width=float(self.widths[i]), depth=float(self.depths[i]), height=self.heights[i],
+                x=float(pose[i, 0]), y=float(pose[i, 1]), rotation=float(pose[i, 2])
+            ))
+            for i in range(len(self))
+        ]
+
+def encode_layout(placed_furniture_list: List[PlacedFurniture]) -> np.ndarray:
+    """1レイアウトを姿勢配列 (M, 3) に変換"""
+    return np.array([[f.x, f.y, f.rotation] for f in placed_furniture_list], dtype=float).reshape(-1, 3)
+
+# --- ベクトル化ユーティリティ ---
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """最後の軸に沿った内積。np.dot / np.linalg.norm と同じ丸めになるよう matmul で計算する"""
+    a, b = np.broadcast_arrays(a, b)
+    return (a[..., None, :] @ b[..., :, None])[..., 0, 0]
+
+def _norm(a: np.ndarray) -> np.ndarray:
+    return np.sqrt((a[..., None, :] @ a[..., :, None])[..., 0, 0])
+
+def facing_vectors_batch(rotations: np.ndarray, face: str = 'Front') -> np.ndarray:
+    """get_furniture_facing_vector のベクトル化版。形状 (...,) -> (..., 2)"""
+    base_direction = np.array([0, 1])
+    if face == 'Back': base_direction = np.array([0, -1])
+    if face == 'Right': base_direction = np.array([1, 0])
+    if face == 'Left': base_direction = np.array([-1, 0])
+
+    angle_rad = np.deg2rad(rotations)
+    cos_theta = np.cos(angle_rad)
+    sin_theta = np.sin(angle_rad)
+
+    rx = base_direction[0] * cos_theta - base_direction[1] * sin_theta
+    ry = base_direction[0] * sin_theta + base_direction[1] * cos_theta
+    return np.stack([rx, ry], axis=-1)
+
+def furniture_corners_batch(widths: np.ndarray, depths: np.ndarray, poses: np.ndarray) -> np.ndarray:
+    """PlacedFurniture.get_corners のベクトル化版。形状 (N, M, 4, 2) を返す"""
+    w, d = widths / 2, depths / 2
+    local_x = np.stack([w, -w, -w, w], axis=-1)  # (M, 4)
+    local_y = np.stack([d, d, -d, -d], axis=-1)
+
+    angle_rad = np.deg2rad(poses[..., 2])[..., None]
+    cos_theta = np.cos(angle_rad)
+    sin_theta = np.sin(angle_rad)
+
+    rx = local_x * cos_theta - local_y * sin_theta
+    ry = local_x * sin_theta + local_y * cos_theta
+    return np.stack([poses[..., 0, None] + rx, poses[..., 1, None] + ry], axis=-1)
+
+def rasterize_batch(widths: np.ndarray, depths: np.ndarray, poses: np.ndarray, shape: Tuple[int, int],
+                    resolution: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    rasterize_item のベクトル化版。家具 K 個 (widths, depths: (K,), poses: (K, 3)) の占有セルを
+    (開始行 (K,), 開始列 (K,), マスク (K, H, W)) で返す。窓の大きさは全家具で共通で、各家具の範囲の外は False。
+    """
+    rows, cols = shape
+    corners = furniture_corners_batch(widths, depths, poses[None])[0]
+    # item_cell_bounds と同じく int() (0 方向への切り捨て) でセル番号にする
+    min_c = np.maximum(np.trunc(corners[..., 0].min(axis=1) / resolution).astype(int), 0)
+    max_c = np.minimum(np.trunc(corners[..., 0].max(axis=1) / resolution).astype(int), cols - 1)
+    min_r = np.maximum(np.trunc(corners[..., 1].min(axis=1) / resolution).astype(int), 0)
+    max_r = np.minimum(np.trunc(corners[..., 1].max(axis=1) / resolution).astype(int), rows - 1)
+    height = int(max((max_r - min_r).max(initial=-1) + 1, 0))
+    width = int(max((max_c - min_c).max(initial=-1) + 1, 0))
+    r = min_r[:, None] + np.arange(height)
+    c = min_c[:, None] + np.arange(width)
+
+    # 以降は rasterize_item と同じ式 (同じ順序の演算) で判定する
+    dx = (c + 0.5) * resolution - poses[:, 0, None]
+    dy = (r + 0.5) * resolution - poses[:, 1, None]
+    angle_rad = np.radians(poses[:, 2])
+    cos_theta, sin_theta = np.cos(angle_rad)[:, None], np.sin(angle_rad)[:, None]
+    abs_cos, abs_sin = np.abs(cos_theta), np.abs(sin_theta)
+    half_cell = resolution / 2 - 1e-9
+    reach = (half_cell * (abs_cos + abs_sin))[..., None]
+    along_width = np.abs((dy * sin_theta)[:, :, None] + (dx * cos_theta)[:, None, :]) < (widths / 2)[:, None, None] + reach
+    along_depth = np.abs((dy * cos_theta)[:, :, None] - (dx * sin_theta)[:, None, :]) < (depths / 2)[:, None, None] + reach
+    within_x = np.abs(dx) < (widths[:, None] * abs_cos + depths[:, None] * abs_sin) / 2 + half_cell
+    within_y = np.abs(dy) < (widths[:, None] * abs_sin + depths[:, None] * abs_cos) / 2 + half_cell
+    mask = along_width & along_depth
+    mask &= (within_x & (c <= max_c[:, None]))[:, None, :]
+    mask &= (within_y & (r <= max_r[:, None]))[:, :, None]
+    return min_r, min_c, mask
+
+# --- スコアリング関数 (母集団版) ---
+
+def score_zoning_batch(furniture_set: FurnitureSet, poses: np.ndarray) -> np.ndarray:
+    beds = furniture_set.indices('Bed')
+    desks = furniture_set.indices('Desk')
+    if not beds or not desks:
+        return np.full(poses.shape[0], 0.5)
+
+    diff = poses[:, beds, None, :2] - poses[:, None, desks, :2]  # (N, B, D, 2)
+    min_dist = _norm(diff).reshape(poses.shape[0], -1).min(axis=1)
+    return np.clip(min_dist / 2.0, 0.0, 1.0)
+
+def score_aesthetics_batch(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> np.ndarray:
+    n = poses.shape[0]
+    doors = np.array(room.door_positions, dtype=float).reshape(-1, 2)
+    windows = np.array(room.window_positions, dtype=float).reshape(-1, 2)
+    scores = []
+
+    # デスク評価
+    desks = furniture_set.indices('Desk')
+    if desks:
+        desk_pos = poses[:, desks, None, :2]  # (N, D, 1, 2)
+        facing = facing_vectors_batch(poses[:, desks, 2])[:, :, None, :]
+
+        # 最も条件の良い窓を探す
+        w_dir = desk_pos - windows  # (N, D, W, 2)
+        norm = _norm(facing) * _norm(w_dir)
+        dot = np.divide(_dot(facing, w_dir), norm, out=np.zeros_like(norm), where=norm != 0)
+        win_score = np.max(1.0 - np.abs(dot), axis=-1, initial=0.0)
+
+        # 最も条件の良いドアを探す (背後が壁=ドアから遠い/向きが逆)
+        d_dir = doors - desk_pos  # (N, D, K, 2)
+        d_norm = _norm(d_dir)[..., None]
+        d_dir_u = np.where(d_norm != 0, d_dir / np.where(d_norm != 0, d_norm, 1.0), np.array([0, 1]))
+        wall_score = np.max(1.0 - np.abs(_dot(facing, d_dir_u)), axis=-1, initial=0.0)
+
+        scores.append(0.5 * win_score + 0.5 * wall_score)
+
+    # ベッド評価 (コマンドポジション: ドアが見えるが直線上ではない)
+    beds = furniture_set.indices('Bed')
+    if beds:
+        bed_pos = poses[:, beds, None, :2]
+        facing_back = -facing_vectors_batch(poses[:, beds, 2])[:, :, None, :]
+
+        d_vec = doors - bed_pos
+        d_norm = _norm(d_vec)[..., None]
+        d_vec_u = np.where(d_norm != 0, d_vec / np.where(d_norm != 0, d_norm, 1.0), np.array([0, 1]))
+        dot = _dot(facing_back, d_vec_u)
+        scores.append(np.max(np.where(dot > 0.7, 1.0, 0.5), axis=-1, initial=0.0))
+
+    if not scores:
+        return np.full(n, 0.5)
+    # 行ごとに連続した配列にしてから平均を取る (score_aesthetics の np.mean と同じ順序で足し合わせ、結果をビット単位で一致させる)
+    return np.ascontiguousarray(np.concatenate(scores, axis=1)).mean(axis=1)
+
+def overlaps_with(corners: np.ndarray, index: int) -> np.ndarray:
+    """1レイアウトの四隅 (M, 4, 2) の中で家具 index と重なっている家具のマスク (M,)"""
+    lo, hi = corners.min(axis=1), corners.max(axis=1)
+    overlaps = ((lo < hi[index]) & (lo[index] < hi)).all(axis=1)
+    overlaps[index] = False
+    # 外接矩形が重なる家具だけを分離軸判定する
+    candidates = np.flatnonzero(overlaps)
+    if len(candidates):
+        overlaps[candidates] = penetration_depths(corners[index], corners[candidates]) > OVERLAP_TOLERANCE
+    return overlaps
+
+def check_hard_constraints_batch(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    ハード制約を母集団全体で判定する。
+    戻り値: (is_valid (N,), はみ出し (N, M), 重なり (N, P))。重なりの列は furniture_set.pairs の順。
+    """
+    corners = furniture_corners_batch(furniture_set.widths, furniture_set.depths, poses)
+    x, y = corners[..., 0], corners[..., 1]
+    inside = (0 <= x) & (x <= room.width) & (0 <= y) & (y <= room.depth)
+    out_of_room = ~inside.all(axis=-1)
+
+    # 全ペアの外接矩形を一括で比べ、重なる候補だけを分離軸判定する
+    i, j = furniture_set.pairs
+    overlaps = overlapping(corners[:, i], corners[:, j])
+
+    is_valid = ~(out_of_room.any(axis=1) | overlaps.any(axis=1))
+    return is_valid, out_of_room, overlaps
+
+def hard_constraint_warnings(furniture_set: FurnitureSet, out_of_room: np.ndarray, overlaps: np.ndarray) -> List[str]:
+    """1レイアウト分の判定結果から check_hard_constraints と同じ順序の警告文を生成"""
+    warnings = []
+    names = furniture_set.names
+    pair_i, pair_j = furniture_set.pairs
+    for i in range(len(furniture_set)):
+        if out_of_room[i]:
+            warnings.append(f"{names[i]}が部屋からはみ出しています。")
+        for k in np.flatnonzero((pair_i == i) & overlaps):
+            warnings.append(f"{names[i]}と{names[pair_j[k]]}が重なっています。")
+    return warnings
+
+def score_population(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> Dict[str, np.ndarray]:
+    """動線以外のスコアとハード制約を母集団全体について一括計算"""
+    poses = np.asarray(poses, dtype=float)
+    is_valid, out_of_room, overlaps = check_hard_constraints_batch(room, furniture_set, poses)
+    return {
+        "zoning": score_zoning_batch(furniture_set, poses),
+        "aesthetics": score_aesthetics_batch(room, furniture_set, poses),
+        "is_valid": is_valid,
+        "out_of_room": out_of_room,
+        "overlaps": overlaps,
+    }
@@ -0,0 +1,126 @@
+import math
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.scoring import RESOLUTION, create_occupancy_grid, create_door_distance_field
+from backend.instrumentation import stage
+
+# 診断結果と中間データ (占有グリッド・ドアからの距離場) のキャッシュ。
+# キーは入力を量子化した正規形のハッシュで、家具の並び順には依存しない。
+# 座標はグリッドのセル単位に量子化するため、同じセル内でのスライダーの揺れはキャッシュに当たる。
+
+SIZE_QUANTUM = 0.01  # 寸法の量子化単位 (m)
+ROTATION_QUANTUM = 1.0  # 回転角の量子化単位 (度)
+
+# --- LRUキャッシュ ---
+
+class LRUCache:
+    """容量を超えると最も長く使われていない要素から捨てるキャッシュ (スレッドセーフ)"""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+# --- 正規化キー ---
+
+def _quantize(value: float, quantum: float) -> int:
+    return math.floor(value / quantum)
+
+def room_signature(room: Room, resolution: float = RESOLUTION) -> Tuple:
+    """部屋の量子化した正規形 (ドア・窓の並び順には依存しない)"""
+    return (
+        _quantize(room.width, SIZE_QUANTUM), _quantize(room.depth, SIZE_QUANTUM),
+        tuple(sorted((_quantize(x, resolution), _quantize(y, resolution)) for x, y in room.door_positions)),
+        tuple(sorted((_quantize(x, resolution), _quantize(y, resolution)) for x, y in room.window_positions)),
+    )
+
+def furniture_geometry(item: PlacedFurniture, resolution: float = RESOLUTION) -> Tuple:
+    """家具の寸法と姿勢の量子化した正規形"""
+    return (
+        _quantize(item.width, SIZE_QUANTUM), _quantize(item.depth, SIZE_QUANTUM),
+        _quantize(item.x, resolution), _quantize(item.y, resolution),
+        _quantize(item.rotation % 360.0, ROTATION_QUANTUM),
+    )
+
+def _digest(signature: Tuple) -> str:
+    return hashlib.blake2b(repr(signature).encode('utf-8'), digest_size=16).hexdigest()
+
+def layout_key(room: Room, placed_furniture_list: List[PlacedFurniture], resolution: float = RESOLUTION) -> str:
+    """占有グリッドと距離場を決める要素 (部屋と家具の形状・配置) だけから作るキー"""
+    geometry = sorted(furniture_geometry(f, resolution) for f in placed_furniture_list)
+    return _digest((room_signature(room, resolution), tuple(geometry)))
+
+def diagnosis_key(room: Room, placed_furniture_list: List[PlacedFurniture], resolution: float = RESOLUTION) -> str:
+    """診断結果のキー (家具の名称・カテゴリも含める)"""
+    items = sorted((f.name, f.category, f.height) + furniture_geometry(f, resolution) for f in placed_furniture_list)
+    return _digest((room_signature(room, resolution), tuple(items)))
+
+# --- 診断キャッシュ ---
+
+class DiagnosisCache:
+    def __init__(self, max_results: int = 4096, max_artifacts: int = 256, resolution: float = RESOLUTION):
+        self.resolution = resolution
+        self.results = LRUCache(max_results)
+        self.artifacts = LRUCache(max_artifacts)
+
+    def get_result(self, room: Room, placed_furniture_list: List[PlacedFurniture]) -> Tuple[str, Optional[Dict]]:
+        """(キー, キャッシュ済みの診断結果またはNone) を返す"""
+        key = diagnosis_key(room, placed_furniture_list, self.resolution)
+        result = self.results.get(key)
+        # 呼び出し側が応答に項目を追加しても、キャッシュ内の結果は変わらないようにする
+        return key, (dict(result) if result is not None else None)
+
+    def put_result(self, key: str, result: Dict):
+        self.results.put(key, dict(result))
+
+    def layout_artifacts(self, room: Room, placed_furniture_list: List[PlacedFurniture]) -> Tuple[np.ndarray, np.ndarray]:
+        """占有グリッドとドアからの距離場を取得 (なければ計算して保持する)。返す配列は読み取り専用"""
+        key = layout_key(room, placed_furniture_list, self.resolution)
+        artifacts = self.artifacts.get(key)
+        if artifacts is None:
+            with stage("grid"):
+                grid = create_occupancy_grid(room, placed_furniture_list, self.resolution)
+            with stage("distance_field"):
+                distance_field = create_door_distance_field(room, grid, self.resolution)
+            grid.flags.writeable = False
+            distance_field.flags.writeable = False
+            artifacts = (grid, distance_field)
+            self.artifacts.put(key, artifacts)
+        return artifacts
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"results": self.results.stats(), "artifacts": self.artifacts.stats()}
@@ -0,0 +1,55 @@
+import json
+import threading
+import http.client
+from urllib.parse import urlsplit
+from typing import Dict, Iterable, Iterator
+
+# APIクライアント。一括診断はリクエスト・レスポンスともにストリーミングし、件数によらずメモリ使用量を一定に保つ。
+
+def stream_batch_diagnosis(base_url: str, records: Iterable[Dict], timeout: float = 60.0,
+                           records_per_chunk: int = 64) -> Iterator[Dict]:
+    """
+    /api/diagnose_batch にレコード (部屋だけの行、またはレイアウトの行) を順に送り、診断結果を1件ずつ返す。
+    records はジェネレータでもよい。送信は別スレッドで行い、受信と並行させる
+    (送信を終えてから受信すると、大量の結果がソケットに溜まって双方が待ち状態になるため)。
+    """
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    conn = connection_class(url.hostname, url.port, timeout=timeout)
+    conn.putrequest("POST", url.path.rstrip("/") + "/api/diagnose_batch")
+    conn.putheader("Content-Type", "application/x-ndjson")
+    conn.putheader("Transfer-Encoding", "chunked")
+    conn.endheaders()
+
+    errors = []
+
+    def send_body():
+        try:
+            lines = []
+            for record in records:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                if len(lines) >= records_per_chunk:
+                    data = "".join(lines).encode("utf-8")
+                    conn.send(b"%x\r\n%s\r\n" % (len(data), data))
+                    lines = []
+            if lines:
+                data = "".join(lines).encode("utf-8")
+                conn.send(b"%x\r\n%s\r\n" % (len(data), data))
+            conn.send(b"0\r\n\r\n")
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=send_body, daemon=True)
+    writer.start()
+    try:
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"一括診断に失敗しました: {response.status} {response.read()[:200]!r}")
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+        writer.join()
+        if errors:
+            raise errors[0]
+    finally:
+        conn.close()
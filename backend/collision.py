@@ -0,0 +1,86 @@
+import numpy as np
+from typing import List, NamedTuple, Tuple
+from backend.models import PlacedFurniture
+from backend.instrumentation import count
+
+# 家具同士の衝突判定。
+# ブロードフェーズ (x軸のスイープ&プルーン) で候補ペアを絞り込み、
+# ナローフェーズ (回転した長方形の分離軸判定) で重なりと貫通深さを求める。
+
+OVERLAP_TOLERANCE = 1e-6  # これ以下の貫通深さ (m) は接しているだけとみなす
+
+class OverlapPair(NamedTuple):
+    i: int  # 家具リスト内の位置 (i < j)
+    j: int
+    depth: float  # 貫通深さ (m)。重なりを解消するのに必要な最小移動量
+
+def furniture_corners(placed_furniture_list: List[PlacedFurniture]) -> np.ndarray:
+    """家具ごとの四隅のワールド座標 (M, 4, 2)"""
+    return np.array([item.get_corners() for item in placed_furniture_list], dtype=float).reshape(-1, 4, 2)
+
+# --- ナローフェーズ ---
+
+def penetration_depths(corners_a: np.ndarray, corners_b: np.ndarray) -> np.ndarray:
+    """
+    長方形の組 (..., 4, 2) ごとに分離軸定理で貫通深さ (m) を計算する。重なっていなければ 0。
+    要素ごとの演算だけで計算するため、どの形状で呼んでも同じ組には同じ値を返す (a, b を入れ替えても同じ)。
+    """
+    a, b = np.broadcast_arrays(corners_a, corners_b)
+    # 各長方形の隣り合う2辺の向きが分離軸の候補
+    edges = np.concatenate([a[..., 1:3, :] - a[..., 0:2, :], b[..., 1:3, :] - b[..., 0:2, :]], axis=-2)
+    length = np.sqrt(edges[..., 0] * edges[..., 0] + edges[..., 1] * edges[..., 1])[..., None]
+    axes = np.divide(edges, length, out=np.zeros_like(edges), where=length > 0)
+
+    ax, ay = axes[..., :, None, 0], axes[..., :, None, 1]  # (..., 軸4, 1)
+    proj_a = a[..., None, :, 0] * ax + a[..., None, :, 1] * ay  # (..., 軸4, 頂点4)
+    proj_b = b[..., None, :, 0] * ax + b[..., None, :, 1] * ay
+    overlap = np.minimum(proj_a.max(axis=-1), proj_b.max(axis=-1)) - np.maximum(proj_a.min(axis=-1), proj_b.min(axis=-1))
+    return np.maximum(overlap.min(axis=-1), 0.0)
+
+# --- ブロードフェーズ ---
+
+def bounding_boxes_overlap(corners_a: np.ndarray, corners_b: np.ndarray) -> np.ndarray:
+    """長方形の組 (..., 4, 2) ごとに外接矩形が重なるか (接するだけのものは除く)"""
+    lo_a, hi_a = corners_a.min(axis=-2), corners_a.max(axis=-2)
+    lo_b, hi_b = corners_b.min(axis=-2), corners_b.max(axis=-2)
+    return ((lo_a < hi_b) & (lo_b < hi_a)).all(axis=-1)
+
+def overlapping(corners_a: np.ndarray, corners_b: np.ndarray) -> np.ndarray:
+    """長方形の組 (..., 4, 2) ごとに重なっているか。外接矩形が重なる組だけを分離軸判定する"""
+    a, b = np.broadcast_arrays(corners_a, corners_b)
+    hit = bounding_boxes_overlap(a, b)
+    if hit.ndim == 0:
+        # 1組だけのときは添字で書き換えられないので、そのまま判定する
+        return hit & (penetration_depths(a, b) > OVERLAP_TOLERANCE)
+    if hit.any():
+        hit[hit] = penetration_depths(a[hit], b[hit]) > OVERLAP_TOLERANCE
+    return hit
+
+def broad_phase_pairs(corners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """外接矩形が重なる家具ペア (i < j) をスイープ&プルーンで列挙する"""
+    m = corners.shape[0]
+    lo, hi = corners.min(axis=1), corners.max(axis=1)  # (M, 2)
+
+    # x軸の開始位置でソートし、各家具の x 区間の終わりより手前から始まる家具だけを候補にする
+    order = np.argsort(lo[:, 0], kind='stable')
+    end = np.searchsorted(lo[order, 0], hi[order, 0], side='left')
+    counts = np.maximum(end - np.arange(m) - 1, 0)
+    first = np.repeat(np.arange(m), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    i, j = order[first], order[first + 1 + offset]
+
+    # y軸でも外接矩形が重なるものだけを残す
+    keep = (lo[j, 1] < hi[i, 1]) & (lo[i, 1] < hi[j, 1])
+    i, j = i[keep], j[keep]
+    return np.minimum(i, j), np.maximum(i, j)
+
+# --- 衝突判定 ---
+
+def find_overlaps(corners: np.ndarray) -> List[OverlapPair]:
+    """重なっている家具ペアを (i, j) の順に列挙する。corners は furniture_corners の戻り値"""
+    i, j = broad_phase_pairs(corners)
+    count("pair_checks", len(i))
+    depths = penetration_depths(corners[i], corners[j])
+    hit = depths > OVERLAP_TOLERANCE
+    pairs = [OverlapPair(int(a), int(b), float(d)) for a, b, d in zip(i[hit], j[hit], depths[hit])]
+    return sorted(pairs)
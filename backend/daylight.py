@@ -0,0 +1,444 @@
+import math
+import numpy as np
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.batch_scoring import FurnitureSet, rasterize_batch
+from backend.scoring import furniture_height, rasterize_item
+from backend.rules import WINDOW_SILL_HEIGHT
+
+# 採光の評価 (目的関数の定義.txt: 窓からの光を遮っていないか)。
+# 窓から部屋の全セルの中心へ光線を引き、光線上のセルを窓台より高い家具がふさいでいなければ光が届くとする。
+# 光線上の標本点 (セル番号) は部屋ごとに1回だけ計算してキャッシュし、判定は遮蔽グリッドを一括で引くだけで行う。
+# 点数には評価対象の家具が覆うセルの明るさしか使わないため、単体の採点ではそのセルへの光線だけを判定する。
+# 家具が動いたときは、その家具が窓から見て覆う扇形の範囲の光線だけを判定し直す (DaylightState)。
+
+DAYLIGHT_RESOLUTION = 0.2  # 採光グリッドの解像度 (m)。光の分布はなめらかなので動線のグリッドより粗くてよい
+RAY_STEP = 0.5  # 光線上の標本点の間隔 (採光グリッドの解像度に対する比)
+MAX_RAY_SAMPLES = 1_000_000  # 光線の標本点の数の見積もりの上限。超える広い部屋では採光グリッドを粗くする
+DAYLIGHT_FALLOFF = 2.0  # 窓からこの距離 (m) で明るさが半分になる
+DAYLIGHT_REFERENCE = 0.5  # この明るさ以上の光が届いていれば満点
+DAYLIGHT_CATEGORIES = ('Desk', 'Sofa')  # 採光を評価する家具
+SECTOR_MIN_RAYS = 512  # 対象のセルへの光線がこの本数以下なら、扇形で絞り込まずにすべて判定し直す
+
+def blocks_light(category: str, height: Optional[float]) -> bool:
+    """窓台より高く、窓からの光を遮る家具か"""
+    return furniture_height(category, height) > WINDOW_SILL_HEIGHT
+
+def _inward_normal(room: Room, position: List[float]) -> np.ndarray:
+    """窓がある壁 (最も近い壁) から部屋の内側へ向かう単位ベクトル"""
+    x, y = position
+    walls = [(x, np.array([1.0, 0.0])), (room.width - x, np.array([-1.0, 0.0])),
+             (y, np.array([0.0, 1.0])), (room.depth - y, np.array([0.0, -1.0]))]
+    return min(walls, key=lambda wall: wall[0])[1]
+
+class DaylightField:
+    """
+    部屋ごとの静的な光線の情報。窓 w とセル c の組を光線 p = w * セル数 + c で表す。
+    ray_cells[ray_offsets[p]:ray_offsets[p + 1]] が光線 p 上の標本点のセル番号 (平坦化) 。
+    weights[p] は遮られなかったときにその光線が運ぶ明るさ (窓の向きに対する余弦 / 距離による減衰)。
+    """
+    def __init__(self, room: Room, resolution: float = DAYLIGHT_RESOLUTION):
+        self.room = room
+        self.resolution = resolution
+        self.shape = (max(int(room.depth / resolution), 1), max(int(room.width / resolution), 1))
+        rows, cols = self.shape
+        self.num_cells = rows * cols
+        self.windows = np.array(room.window_positions, dtype=float).reshape(-1, 2)
+
+        centers = np.stack(np.meshgrid((np.arange(cols) + 0.5) * resolution, (np.arange(rows) + 0.5) * resolution), axis=-1).reshape(-1, 2)
+        self.angles = np.zeros((len(self.windows), self.num_cells))  # 窓の正面からの角度 (ラジアン)
+        self.distances = np.zeros((len(self.windows), self.num_cells))
+        weights, lengths, cells = [], [], []
+        for w, window in enumerate(self.windows):
+            normal = _inward_normal(room, window)
+            offset = centers - window
+            distance = np.sqrt((offset ** 2).sum(axis=1))
+            cos_theta = np.divide(offset @ normal, distance, out=np.ones(self.num_cells), where=distance > 0)
+            self.angles[w] = np.arctan2(offset @ np.array([-normal[1], normal[0]]), offset @ normal)
+            self.distances[w] = distance
+            weights.append(np.maximum(cos_theta, 0.0) / (1.0 + (distance / DAYLIGHT_FALLOFF) ** 2))
+
+            # 光線ごとに窓からセルの中心までを等間隔に標本化する (端点は含めない)
+            n = np.maximum(np.ceil(distance / (RAY_STEP * resolution)).astype(int), 1)
+            ray = np.repeat(np.arange(self.num_cells), n)
+            k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            t = (k + 0.5) / n[ray]
+            px, py = window[0] + t * offset[ray, 0], window[1] + t * offset[ray, 1]
+            r = np.clip((py / resolution).astype(int), 0, rows - 1)
+            c = np.clip((px / resolution).astype(int), 0, cols - 1)
+            # 同じ光線の連続する標本点が同じセルに落ちる場合は1つにまとめる (判定の結果は変わらない)
+            ray_cells = r * cols + c
+            keep = np.ones(len(ray_cells), dtype=bool)
+            keep[1:] = (ray_cells[1:] != ray_cells[:-1]) | (ray[1:] != ray[:-1])
+            lengths.append(np.bincount(ray[keep], minlength=self.num_cells))
+            cells.append(ray_cells[keep].astype(np.int32))
+
+        self.weights = np.concatenate(weights) if weights else np.zeros(0)
+        self.ray_cells = np.concatenate(cells) if cells else np.zeros(0, dtype=np.int32)
+        self.ray_offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))]) if lengths else np.zeros(1, dtype=int)
+
+    # --- 遮蔽と光線の判定 ---
+
+    def footprint(self, item: PlacedFurniture) -> Tuple[int, int, np.ndarray]:
+        """採光グリッドでの家具の占有セル (開始行, 開始列, マスク)"""
+        return rasterize_item(item, self.shape, self.resolution)
+
+    def blocking_grid(self, placed_furniture_list: List[PlacedFurniture]) -> np.ndarray:
+        """光を遮る家具が覆うセルの数 (uint16)"""
+        blocking = np.zeros(self.shape, dtype=np.uint16)
+        for item in placed_furniture_list:
+            if blocks_light(item.category, item.height):
+                r0, c0, mask = self.footprint(item)
+                blocking[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] += mask
+        return blocking
+
+    def visible(self, blocking: np.ndarray, rays: Optional[np.ndarray] = None) -> np.ndarray:
+        """光線 (省略時は全光線) が遮られずに届くか"""
+        if rays is None:
+            samples, starts = self.ray_cells, self.ray_offsets[:-1]
+        else:
+            # 選んだ光線の標本点を連結して取り出す
+            first, lengths = self.ray_offsets[rays], self.ray_offsets[rays + 1] - self.ray_offsets[rays]
+            starts = np.cumsum(lengths) - lengths
+            samples = self.ray_cells[np.repeat(first - starts, lengths) + np.arange(lengths.sum())]
+        if len(starts) == 0:
+            return np.ones(0, dtype=bool)
+        # 光線ごとに標本点が1つ以上あるので、reduceat で光線ごとの「どこかで遮られたか」を求められる
+        return ~np.logical_or.reduceat(blocking.ravel()[samples] > 0, starts)
+
+    def illumination(self, visible: np.ndarray) -> np.ndarray:
+        """セルごとの明るさ (全光線の可視性 → (rows, cols))"""
+        light = (visible * self.weights).reshape(len(self.windows), self.num_cells).sum(axis=0)
+        return light.reshape(self.shape)
+
+    def shadow_rays(self, r0: int, r1: int, c0: int, c1: int, cells: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        セル範囲 (r1, c1 を含む) の中の障害物の有無で結果が変わりうる光線 (cells を指定するとそのセルへの光線に限る)。
+        窓から見てその範囲が覆う扇形 (角度の範囲) の中で、範囲より遠いセルへの光線だけを選ぶ。
+        """
+        if len(self.windows) == 0 or r1 < r0 or c1 < c0:
+            return np.zeros(0, dtype=int)
+        if cells is None:
+            cells = np.arange(self.num_cells)
+        res = self.resolution
+        corners = np.array([[c0, r0], [c1 + 1, r0], [c0, r1 + 1], [c1 + 1, r1 + 1]], dtype=float) * res
+        rays = []
+        for w, window in enumerate(self.windows):
+            normal = _inward_normal(self.room, window)
+            offset = corners - window
+            angles = np.arctan2(offset @ np.array([-normal[1], normal[0]]), offset @ normal)
+            nearest = float(np.sqrt(((np.clip(window, corners.min(axis=0), corners.max(axis=0)) - window) ** 2).sum()))
+            inside_x = corners[:, 0].min() <= window[0] <= corners[:, 0].max()
+            inside_y = corners[:, 1].min() <= window[1] <= corners[:, 1].max()
+            if inside_x and inside_y:
+                # 窓の上に障害物がある: 全方向の光線が影響を受けうる
+                hit = np.ones(len(cells), dtype=bool)
+            else:
+                # 角度の範囲を、セル1つ分の見込み角だけ広げて取りこぼしを防ぐ
+                margin = math.atan2(res, max(nearest, res))
+                cell_angles = self.angles[w, cells]
+                hit = (cell_angles >= angles.min() - margin) & (cell_angles <= angles.max() + margin)
+                hit &= self.distances[w, cells] >= nearest - res
+            rays.append(cells[hit] + w * self.num_cells)
+        return np.concatenate(rays)
+
+    # --- 家具ごとの採光 ---
+
+    def footprint_cells(self, item: PlacedFurniture, footprint: Optional[Tuple[int, int, np.ndarray]] = None) -> np.ndarray:
+        """家具が覆うセルの番号 (平坦化)。グリッドより小さく1セルも覆わない場合は中心のセル"""
+        r0, c0, mask = footprint if footprint is not None else self.footprint(item)
+        rows, cols = np.nonzero(mask)
+        if len(rows) == 0:
+            r = min(max(int(item.y / self.resolution), 0), self.shape[0] - 1)
+            c = min(max(int(item.x / self.resolution), 0), self.shape[1] - 1)
+            return np.array([r * self.shape[1] + c])
+        return (rows + r0) * self.shape[1] + (cols + c0)
+
+    def cell_light(self, blocking: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """指定したセルの明るさ。そのセルへの光線だけを判定する"""
+        rays = (np.arange(len(self.windows))[:, None] * self.num_cells + cells).ravel()
+        return (self.visible(blocking, rays) * self.weights[rays]).reshape(len(self.windows), len(cells)).sum(axis=0)
+
+    def item_light(self, light: np.ndarray, item: PlacedFurniture) -> float:
+        """家具が覆うセルの平均の明るさ"""
+        return float(light.ravel()[self.footprint_cells(item)].mean())
+
+def daylight_resolution(room: Room, resolution: float = DAYLIGHT_RESOLUTION) -> float:
+    """
+    部屋に使う採光グリッドの解像度。標本点の数は 窓の数 × セル数 × 窓までの距離 / 解像度 程度で解像度の3乗に反比例するので、
+    見積もりが MAX_RAY_SAMPLES を超える部屋では収まるまで 5cm 単位で粗くする (光線の情報のメモリと構築時間を抑える)
+    """
+    samples = len(room.window_positions) * room.width * room.depth * math.hypot(room.width, room.depth) / 2
+    coarse = (samples / MAX_RAY_SAMPLES) ** (1 / 3)
+    if coarse <= resolution:
+        return resolution
+    return round(math.ceil(coarse / 0.05) * 0.05, 2)
+
+@lru_cache(maxsize=16)
+def _cached_field(width: float, depth: float, windows: Tuple[Tuple[float, float], ...], resolution: float) -> DaylightField:
+    return DaylightField(Room(width, depth, [], [list(w) for w in windows]), resolution)
+
+def get_daylight_field(room: Room, resolution: float = DAYLIGHT_RESOLUTION) -> DaylightField:
+    """部屋の寸法と窓の位置ごとにキャッシュした光線の情報。広い部屋では daylight_resolution で粗くしたグリッドを使う"""
+    windows = tuple((float(x), float(y)) for x, y in room.window_positions)
+    return _cached_field(float(room.width), float(room.depth), windows, daylight_resolution(room, resolution))
+
+def light_score(light: float) -> float:
+    """明るさを 0〜1 の点数に変換"""
+    return min(max(light / DAYLIGHT_REFERENCE, 0.0), 1.0)
+
+def _target_score(field: DaylightField, blocking: np.ndarray, targets: List[PlacedFurniture]) -> float:
+    """対象の家具ごとの点数の平均 (全対象のセルへの光線をまとめて判定する)"""
+    cells = [field.footprint_cells(f) for f in targets]
+    light = field.cell_light(blocking, np.concatenate(cells))
+    bounds = np.cumsum([0] + [len(c) for c in cells])
+    return float(np.mean([light_score(light[a:b].mean()) for a, b in zip(bounds[:-1], bounds[1:])]))
+
+def score_daylight(room: Room, placed_furniture_list: List[PlacedFurniture]) -> float:
+    """デスク・ソファに届く光の評価 (対象の家具か窓がなければ 0.5)"""
+    targets = [f for f in placed_furniture_list if f.category in DAYLIGHT_CATEGORIES]
+    if not targets or not room.window_positions:
+        return 0.5
+    field = get_daylight_field(room)
+    return _target_score(field, field.blocking_grid(placed_furniture_list), targets)
+
+def score_daylight_batch(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> np.ndarray:
+    """
+    score_daylight の母集団版 (N,)。全レイアウトの遮蔽グリッドと対象の家具のセルを一括でラスタライズし、
+    対象のセルへの光線をレイアウトをまたいでまとめて判定する。
+    """
+    targets = [i for i, c in enumerate(furniture_set.categories) if c in DAYLIGHT_CATEGORIES]
+    if not targets or not room.window_positions:
+        return np.full(poses.shape[0], 0.5)
+    field = get_daylight_field(room)
+    count = poses.shape[0]
+    rows, cols = field.shape
+
+    # レイアウトごとの遮蔽グリッド (N, セル数)
+    blocking = np.zeros((count, field.num_cells), dtype=bool)
+    blockers = [i for i, (c, h) in enumerate(zip(furniture_set.categories, furniture_set.heights)) if blocks_light(c, h)]
+    if blockers:
+        r0, c0, masks = rasterize_batch(np.tile(furniture_set.widths[blockers], count), np.tile(furniture_set.depths[blockers], count),
+                                        poses[:, blockers].reshape(-1, 3), field.shape, field.resolution)
+        k, i, j = np.nonzero(masks)
+        blocking[k // len(blockers), (r0[k] + i) * cols + (c0[k] + j)] = True
+
+    # 対象の家具 (N × T 個) が覆うセル。家具の番号順・行優先に並ぶので footprint_cells と同じ順序になる
+    target_poses = poses[:, targets].reshape(-1, 3)
+    r0, c0, masks = rasterize_batch(np.tile(furniture_set.widths[targets], count), np.tile(furniture_set.depths[targets], count),
+                                    target_poses, field.shape, field.resolution)
+    k, i, j = np.nonzero(masks)
+    owners, cells = k, (r0[k] + i) * cols + (c0[k] + j)
+    # 1セルも覆わない家具は中心のセル
+    empty = np.flatnonzero(np.bincount(k, minlength=len(target_poses)) == 0)
+    if len(empty):
+        r = np.clip((target_poses[empty, 1] / field.resolution).astype(int), 0, rows - 1)
+        c = np.clip((target_poses[empty, 0] / field.resolution).astype(int), 0, cols - 1)
+        order = np.argsort(np.concatenate([owners, empty]), kind='stable')
+        owners = np.concatenate([owners, empty])[order]
+        cells = np.concatenate([cells, r * cols + c])[order]
+
+    # 窓ごと・セルごとの光線の標本点を連結し、その光線のレイアウトの遮蔽グリッドを引く
+    layouts = owners // len(targets)
+    rays = (np.arange(len(field.windows))[:, None] * field.num_cells + cells).ravel()
+    ray_layouts = np.tile(layouts, len(field.windows))
+    first, lengths = field.ray_offsets[rays], field.ray_offsets[rays + 1] - field.ray_offsets[rays]
+    starts = np.cumsum(lengths) - lengths
+    samples = field.ray_cells[np.repeat(first - starts, lengths) + np.arange(lengths.sum())]
+    visible = ~np.logical_or.reduceat(blocking.ravel()[np.repeat(ray_layouts * field.num_cells, lengths) + samples], starts)
+
+    # セルの明るさ → 家具ごとの平均 → 点数 → レイアウトごとの平均
+    light = (visible * field.weights[rays]).reshape(len(field.windows), len(cells)).sum(axis=0)
+    sizes = np.bincount(owners, minlength=len(target_poses))
+    mean_light = np.bincount(owners, weights=light, minlength=len(target_poses)) / sizes
+    scores = np.clip(mean_light / DAYLIGHT_REFERENCE, 0.0, 1.0)
+    return scores.reshape(count, len(targets)).mean(axis=1)
+
+# --- 差分更新 ---
+
+class DaylightState:
+    """
+    配置の変化に合わせて明るさを差分更新する。光線の可視性と明るさは、評価対象の家具が覆うセルの分だけ保持する。
+    光を遮る家具が動いたときは、元の位置と新しい位置の扇形に入る対象のセルへの光線だけを判定し直し、
+    対象の家具が動いたときは新しいセルへの光線だけを判定する。どちらでもない家具の移動では何もしない。
+    直前の更新は undo() で取り消せる。
+    """
+    def __init__(self, room: Room, placed_furniture_list: List[PlacedFurniture]):
+        self.field = get_daylight_field(room)
+        self.enabled = bool(room.window_positions)
+        self.blockers = [blocks_light(f.category, f.height) for f in placed_furniture_list]
+        # 占有セルは光を遮る家具と対象の家具の分だけ保持する (それ以外は None)
+        self.footprints = [self.field.footprint(f) if self._tracked(k, f) else None for k, f in enumerate(placed_furniture_list)]
+        self.blocking = self.field.blocking_grid(placed_furniture_list)
+        self.target_cells = {k: self.field.footprint_cells(f, self.footprints[k])
+                             for k, f in enumerate(placed_furniture_list) if f.category in DAYLIGHT_CATEGORIES}
+        # 窓のセルと、対象の家具ごとに光線の標本点が落ちうるセル範囲 (窓と対象のセルを囲む範囲)
+        rows, cols = self.field.shape
+        self.window_cells = [(min(max(int(y / self.field.resolution), 0), rows - 1), min(max(int(x / self.field.resolution), 0), cols - 1))
+                             for x, y in self.field.windows.tolist()]
+        self.ray_bounds = {k: self._ray_bounds(cells) for k, cells in self.target_cells.items()}
+        # 光線の可視性 (窓 × セル) とセルの明るさ。対象のセル以外の値は使わない
+        self.visible = np.zeros(len(self.field.windows) * self.field.num_cells, dtype=bool)
+        self.light = np.zeros(self.field.shape)
+        self.rays_checked = 0
+        if self.enabled and self.target_cells:
+            self._recheck(self._cell_rays(np.concatenate(list(self.target_cells.values()))))
+        self._score: Optional[float] = None
+        self._undo = None
+
+    def _tracked(self, k: int, item: PlacedFurniture) -> bool:
+        return self.blockers[k] or item.category in DAYLIGHT_CATEGORIES
+
+    def _stamp(self, footprint: Tuple[int, int, np.ndarray], sign: int):
+        r0, c0, mask = footprint
+        window = self.blocking[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]]
+        if sign > 0:
+            window += mask
+        else:
+            window -= mask
+
+    @staticmethod
+    def _bounds(footprint: Tuple[int, int, np.ndarray]) -> Tuple[int, int, int, int]:
+        r0, c0, mask = footprint
+        return r0, r0 + mask.shape[0] - 1, c0, c0 + mask.shape[1] - 1
+
+    def _ray_bounds(self, cells: np.ndarray) -> Tuple[int, int, int, int]:
+        """
+        セルへの全窓からの光線の標本点が落ちうるセル範囲 (r1, c1 を含む)。
+        標本点は窓とセルの中心を結ぶ線分上にあり、セル番号への変換は単調なので、窓とセルを囲む範囲に収まる
+        """
+        rows, cols = np.divmod(cells, self.field.shape[1])
+        rows = [int(rows.min()), int(rows.max())] + [r for r, _ in self.window_cells]
+        cols = [int(cols.min()), int(cols.max())] + [c for _, c in self.window_cells]
+        return min(rows), max(rows), min(cols), max(cols)
+
+    def _shades_targets(self, footprint: Tuple[int, int, np.ndarray]) -> bool:
+        """占有セルの範囲が、対象のセルへの光線が通りうる範囲に掛かるか"""
+        r0, r1, c0, c1 = self._bounds(footprint)
+        return any(br0 <= r1 and br1 >= r0 and bc0 <= c1 and bc1 >= c0 for br0, br1, bc0, bc1 in self.ray_bounds.values())
+
+    @property
+    def score(self) -> float:
+        """score_daylight と同じ点数"""
+        if not self.target_cells or not self.enabled:
+            return 0.5
+        if self._score is None:
+            light = self.light.reshape(-1)
+            self._score = float(np.mean([light_score(light[cells].mean()) for cells in self.target_cells.values()]))
+        return self._score
+
+    # --- 光線の判定 ---
+
+    def _cell_rays(self, cells: np.ndarray) -> np.ndarray:
+        """セルへの全窓からの光線"""
+        return (np.arange(len(self.field.windows))[:, None] * self.field.num_cells + np.unique(cells)).ravel()
+
+    def _shadow_rays(self, footprints: List[Tuple[int, int, np.ndarray]]) -> np.ndarray:
+        """占有セルの変化した範囲の影になりうる、対象のセルへの光線"""
+        if not self.target_cells:
+            return np.zeros(0, dtype=int)
+        cells = np.unique(np.concatenate(list(self.target_cells.values())))
+        if len(cells) * len(self.field.windows) <= SECTOR_MIN_RAYS:
+            # 光線が少なければ、扇形で絞り込むより全部判定し直すほうが速い
+            return self._cell_rays(cells)
+        return np.unique(np.concatenate([self.field.shadow_rays(*self._bounds(f), cells=cells) for f in footprints]))
+
+    def _recheck(self, rays: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        光線 (重複なし) を判定し直し、その終点のセルの明るさを計算し直す。
+        戻り値は取り消し用の (光線, 元の可視性, 明るさを計算し直したセル, 元の明るさ)。
+        """
+        field = self.field
+        previous = self.visible[rays]
+        self.visible[rays] = field.visible(self.blocking, rays)
+        self.rays_checked += len(rays)
+
+        # 明るさは全窓の光線から計算し直す (score_daylight と同じ順序で足すので結果も一致する)
+        cells = np.unique(rays % field.num_cells)
+        light = self.light.reshape(-1)
+        saved = light[cells]
+        all_rays = self._cell_rays(cells)
+        light[cells] = (self.visible[all_rays] * field.weights[all_rays]).reshape(len(field.windows), len(cells)).sum(axis=0)
+        return rays, previous, cells, saved
+
+    # --- 差分更新 ---
+
+    def move(self, k: int, item: PlacedFurniture):
+        """家具 k を item の位置に動かす"""
+        target = k in self.target_cells
+        if not self.enabled or not (self.blockers[k] or target):
+            # 光を遮らず評価対象でもない家具 (窓がない部屋ではすべての家具) は点数に影響しない
+            self._undo = None
+            return
+        old = self.footprints[k]
+        new = self.field.footprint(item)
+        self.footprints[k] = new
+        old_cells, old_ray_bounds = self.target_cells.get(k), self.ray_bounds.get(k)
+        rays = []
+        if target:
+            self.target_cells[k] = self.field.footprint_cells(item, new)
+            self.ray_bounds[k] = self._ray_bounds(self.target_cells[k])
+            rays.append(self._cell_rays(self.target_cells[k]))
+        if self.blockers[k]:
+            self._stamp(old, -1)
+            self._stamp(new, 1)
+            # 元の位置にも新しい位置にも対象への光線が通らなければ、可視性は変わらない
+            if self._shades_targets(old) or self._shades_targets(new):
+                rays.append(self._shadow_rays([old, new]))
+        if not rays:
+            self._undo = (k, old, old_cells, old_ray_bounds, None)
+            return
+        self._score = None
+        self._undo = (k, old, old_cells, old_ray_bounds, self._recheck(np.unique(np.concatenate(rays)) if len(rays) > 1 else rays[0]))
+
+    def add(self, item: PlacedFurniture):
+        """家具を末尾に追加する (取り消しはできない)"""
+        k = len(self.footprints)
+        self.blockers.append(blocks_light(item.category, item.height))
+        footprint = self.field.footprint(item) if self._tracked(k, item) else None
+        self.footprints.append(footprint)
+        rays = [np.zeros(0, dtype=int)]
+        if item.category in DAYLIGHT_CATEGORIES:
+            self.target_cells[k] = self.field.footprint_cells(item, footprint)
+            self.ray_bounds[k] = self._ray_bounds(self.target_cells[k])
+            rays.append(self._cell_rays(self.target_cells[k]))
+        if self.blockers[k]:
+            self._stamp(footprint, 1)
+            rays.append(self._shadow_rays([footprint]))
+        if self.enabled:
+            self._recheck(np.unique(np.concatenate(rays)))
+        self._score = None
+        self._undo = None
+
+    def remove(self, k: int):
+        """家具 k を削除する (以降の家具の番号は1つずつ詰まる。取り消しはできない)"""
+        footprint = self.footprints.pop(k)
+        blocker = self.blockers.pop(k)
+        self.target_cells = {i - (i > k): cells for i, cells in self.target_cells.items() if i != k}
+        self.ray_bounds = {i - (i > k): bounds for i, bounds in self.ray_bounds.items() if i != k}
+        if blocker:
+            self._stamp(footprint, -1)
+            if self.enabled:
+                self._recheck(self._shadow_rays([footprint]))
+        self._score = None
+        self._undo = None
+
+    def undo(self):
+        """直前の move() を取り消す"""
+        if self._undo is None:
+            return
+        k, old, old_cells, old_ray_bounds, recheck = self._undo
+        if self.blockers[k]:
+            self._stamp(self.footprints[k], -1)
+            self._stamp(old, 1)
+        if recheck is not None:
+            rays, previous, cells, saved = recheck
+            self.visible[rays] = previous
+            self.light.reshape(-1)[cells] = saved
+            self._score = None
+        self.footprints[k] = old
+        if old_cells is not None:
+            self.target_cells[k] = old_cells
+            self.ray_bounds[k] = old_ray_bounds
+        self._undo = None
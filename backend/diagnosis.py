@@ -0,0 +1,158 @@
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from backend.models import RoomInput, PlacedFurnitureInput, Room, PlacedFurniture
+from backend.scoring import (
+    RESOLUTION,
+    create_occupancy_grid,
+    score_circulation,
+    score_zoning,
+    score_aesthetics,
+    check_hard_constraints,
+    weighted_total
+)
+from backend.rules import CLEARANCE_PENALTY, get_rules
+from backend.daylight import score_daylight
+from backend.instrumentation import stage
+
+# レイアウト診断の本体。API (main.py) や一括診断から共通で使う。
+
+def build_room(room_input: RoomInput) -> Room:
+    """入力データを内部モデルに変換"""
+    return Room(
+        width=room_input.width,
+        depth=room_input.depth,
+        door_positions=room_input.door_positions,   # リストを渡す
+        window_positions=room_input.window_positions # リストを渡す
+    )
+
+def run_diagnosis(room: Room, placed_items: List[PlacedFurniture],
+                  grid: Optional[np.ndarray] = None, distance_field: Optional[np.ndarray] = None,
+                  resolution: float = RESOLUTION) -> Dict:
+    """
+    レイアウトを診断し、APIの応答形式で返す。
+    grid / distance_field に計算済みの占有グリッドとドアからの距離場を渡すと再利用する。
+    resolution は動線評価に使うグリッドの解像度 (m)。
+    """
+    # 1. 【重要】ハード制約チェックを実行し、is_validとwarningsを定義
+    with stage("constraints"):
+        is_valid, warnings = check_hard_constraints(room, placed_items)
+    # 知見テーブルのクリアランス規則: ドアの開閉スペースはハード制約、人間工学的な最小距離などは減点だけのソフト制約
+    with stage("clearance"):
+        clearance_warnings, soft_warnings, soft_violations = get_rules().check(room, placed_items)
+    warnings += clearance_warnings
+    is_valid = is_valid and not clearance_warnings
+    
+    # 2. スコアリング（採点）の実行 (段階ごとの所要時間を計測する)
+    if grid is None:
+        with stage("grid"):
+            grid = create_occupancy_grid(room, placed_items, resolution)
+    
+    with stage("circulation"):
+        circulation_score = score_circulation(room, placed_items, grid, distance_field, resolution)
+    with stage("zoning"):
+        zoning_score = score_zoning(placed_items)
+    with stage("aesthetics"):
+        aesthetics_score = score_aesthetics(room, placed_items)
+    with stage("daylight"):
+        daylight_score = score_daylight(room, placed_items)
+    
+    # 総合点 (重み付け)
+    total_score = weighted_total(circulation_score, zoning_score, aesthetics_score) - CLEARANCE_PENALTY * soft_violations
+    total_score_100 = round(max(total_score, 0.0) * 100, 1)
+
+    # 3. 診断コメントの生成 (LLMの代わりとなるロジック)
+    advice = ["診断結果です。"]
+    
+    # 【重要】物理的な重なりがある場合の処理を最優先
+    if not is_valid:
+         advice.insert(0, f"【重大】物理的制約違反が{len(warnings)}件あります: {'; '.join(warnings)}")
+         total_score_100 = 10.0 # 物理エラー時はスコアを10点に固定
+    else:
+         # is_validな場合のみ、点数に基づいた評価を行う
+         if total_score_100 < 50:
+             advice.append("全体的に再配置が必要です。主要家具間の距離を見直しましょう。")
+         elif total_score_100 < 75:
+             advice.append("合格点ですが、微調整で快適性が向上します。")
+         else:
+             advice.append("非常に優れた配置です！快適な空間が実現されています。")
+
+         # 個別スコアに基づいたアドバイスもここで追加 (以前のロジック)
+         if circulation_score < 0.5:
+             advice.append("動線が悪いです。家具が部屋の移動を妨げています。")
+         
+         if zoning_score < 0.5:
+             advice.append("ゾーンが分離されていません。仕事場と休息の場をもう少し離しましょう。")
+             
+         if aesthetics_score < 0.5:
+             advice.append("家具の向きを見直しましょう。机は窓に背を向けず、ベッドからはドアが見える位置が理想です。")
+
+         if daylight_score < 0.5:
+             advice.append("デスクやソファに窓の光が届いていません。背の高い家具で窓をふさがないようにしましょう。")
+
+         if soft_warnings:
+             advice.append(f"使いやすさのためのスペースが足りない箇所があります: {' '.join(soft_warnings)}")
+
+    # 4. 結果を返す
+    return {
+        "total_score": total_score_100,
+        "details": {
+            "circulation": round(circulation_score, 2),
+            "zoning": round(zoning_score, 2),
+            "aesthetics": round(aesthetics_score, 2),
+            "daylight": round(daylight_score, 2)
+        },
+        "is_valid": is_valid, 
+        "warnings": warnings + soft_warnings, 
+        "advice": " ".join(advice)
+    }
+
+# --- 一括診断 (NDJSON) ---
+
+class BatchLineError(Exception):
+    """一括診断の行が読めない。index はその行の結果に付ける番号"""
+    def __init__(self, index: int, error: Exception):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.index = index
+
+class BatchDiagnoser:
+    """
+    NDJSON の一括診断の入力を1行ずつ読む。
+    {"room": {...}} だけの行は以降のレイアウトで共有する部屋を設定し、
+    {"placed_furniture_list": [...]} の行はその部屋で診断する (行に "room" があればその部屋に切り替える)。
+    同じ部屋が続く間は部屋のモデルを使い回す。診断そのものは呼び出し側で (受け付け制御つきの実行器を通して) 行う。
+    """
+    def __init__(self):
+        self.index = 0
+        self._room_raw = None
+        self._room = None
+
+    def _use_room(self, room_raw: Dict) -> Room:
+        if room_raw != self._room_raw:
+            self._room = build_room(RoomInput(**room_raw))
+            self._room_raw = room_raw
+        return self._room
+
+    def read_line(self, line: bytes) -> Optional[Tuple[int, Room, List[PlacedFurniture]]]:
+        """1行を読み、(結果の番号, 部屋, 家具) を返す (部屋だけの行は None)。読めない行は BatchLineError"""
+        try:
+            record = json.loads(line)
+            if "placed_furniture_list" not in record and "room" in record:
+                self._use_room(record["room"])
+                return None
+        except Exception as e:
+            record, error = None, e
+
+        index = self.index
+        self.index += 1
+        try:
+            if record is None:
+                raise error
+            if "room" in record:
+                self._use_room(record["room"])
+            if self._room is None:
+                raise ValueError("部屋の情報がありません")
+            placed_items = [PlacedFurniture(PlacedFurnitureInput(**item)) for item in record["placed_furniture_list"]]
+        except Exception as e:
+            raise BatchLineError(index, e)
+        return index, self._room, placed_items
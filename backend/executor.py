@@ -0,0 +1,201 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.diagnosis import run_diagnosis
+from backend.cache import DiagnosisCache
+from backend.instrumentation import recording
+from backend.rules import get_rules, set_rules
+
+# CPU負荷の高い採点処理をイベントループの外 (全コアのプロセスプール) で実行する。
+# 受け付ける処理の数に上限を設け、溢れた分は待たせずに 503 + Retry-After で断る。
+# 処理ごとに締め切りを設け、間に合わなければ呼び出し側で粗い結果に切り替える。
+
+DEFAULT_DEADLINE = 2.0  # 1リクエストの計算に使える時間 (秒)
+QUEUE_PER_WORKER = 4  # ワーカー1つあたりに待たせてよい処理の数
+COARSE_RESOLUTION = 0.5  # 締め切りに間に合わなかったときの動線評価のグリッド解像度 (m)
+FALLBACK_PER_WORKER = 1  # ワーカー1つあたりに同時に実行してよい粗い診断の数 (本体プロセスのスレッドで実行する)
+
+class Overloaded(Exception):
+    """受け付け上限に達している"""
+    def __init__(self, retry_after: int):
+        super().__init__(f"混雑しています。{retry_after}秒後に再試行してください。")
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """締め切りまでに計算が終わらなかった"""
+
+# --- 共有プロセスプール ---
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_rules = None  # プールのワーカーに渡したクリアランス規則
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    全コアを使う共有プロセスプールを取得 (初回呼び出し時に生成)。
+    クリアランス規則はワーカーの起動時に initializer で渡す (fork 以外の起動方式でも同じ規則で採点する)。
+    規則が入れ替わっていれば、実行中の処理を待たずにプールを作り直す。
+    """
+    global _process_pool, _pool_rules
+    rules = get_rules()
+    if _process_pool is not None and _pool_rules is not rules:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, initializer=set_rules, initargs=(rules,))
+        _pool_rules = rules
+    return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+# --- ワーカーで実行する処理 ---
+
+# ワーカープロセスごとの中間データ (占有グリッド・距離場) のキャッシュ
+_worker_cache: Optional[DiagnosisCache] = None
+
+def _noop() -> int:
+    return os.getpid()
+
+def diagnose_in_worker(room: Room, placed_items: List[PlacedFurniture]) -> Tuple[Dict, Dict]:
+    """ワーカープロセスでレイアウトを診断する。戻り値: (診断結果, 段階ごとの計測値)"""
+    global _worker_cache
+    if _worker_cache is None:
+        _worker_cache = DiagnosisCache()
+    with recording() as recorder:
+        grid, distance_field = _worker_cache.layout_artifacts(room, placed_items)
+        result = run_diagnosis(room, placed_items, grid, distance_field)
+    return result, recorder.snapshot()
+
+def diagnose_coarse(room: Room, placed_items: List[PlacedFurniture]) -> Tuple[Dict, Dict]:
+    """粗いグリッドで動線を概算した診断結果 (締め切り超過時の代替)。戻り値は diagnose_in_worker と同じ"""
+    with recording() as recorder:
+        result = run_diagnosis(room, placed_items, resolution=COARSE_RESOLUTION)
+    result["degraded"] = True
+    result["advice"] += " 計算が時間内に終わらなかったため、動線は粗いグリッドで概算しています。"
+    return result, recorder.snapshot()
+
+# --- 受け付け制御つきの実行器 ---
+
+class ScoringExecutor:
+    """
+    プロセスプールへの投入口。実行中と待機中の処理の合計が capacity を超えると Overloaded を送出する。
+    締め切りを過ぎた処理も、ワーカーで実行中の間は枠を占有し続ける (ワーカーの実際の負荷を超えて受け付けない)。
+    締め切り超過時の代替処理 (run_fallback) は本体プロセスのスレッドで実行し、同時に fallback_capacity 件までに制限する。
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 default_deadline: float = DEFAULT_DEADLINE, fallback_capacity: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue if max_queue is not None else QUEUE_PER_WORKER * self.max_workers
+        self.capacity = self.max_workers + self.max_queue
+        self.default_deadline = default_deadline
+        self.in_flight = 0
+        self.finished = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.fallback_capacity = fallback_capacity if fallback_capacity is not None else FALLBACK_PER_WORKER * self.max_workers
+        self.fallback_in_flight = 0
+        self.fallback_rejected = 0
+        self.mean_service_time = 0.05  # 1処理あたりの所要時間の移動平均 (秒)。Retry-After の見積もりに使う
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        return get_process_pool()
+
+    def warm_up(self):
+        """ワーカープロセスを先に起動しておく (最初のリクエストが起動待ちで締め切りを過ぎないように)"""
+        for future in [self.pool.submit(_noop) for _ in range(self.max_workers)]:
+            future.result()
+
+    def retry_after(self) -> int:
+        """待機中の処理がはけるまでの見積もり秒数"""
+        return max(1, math.ceil(self.in_flight / self.max_workers * self.mean_service_time))
+
+    def _acquire(self):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+            self.in_flight += 1
+
+    def check_capacity(self):
+        """受け付け上限に達していれば Overloaded。枠は確保しない (ストリーミング応答を始める前の判定用)"""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+
+    def _release(self, started: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.finished += 1
+            self.mean_service_time += 0.1 * ((time.perf_counter() - started) - self.mean_service_time)
+
+    @contextmanager
+    def slot(self):
+        """呼び出し側のスレッドで実行する処理 (内部でプールを使うものなど) に1枠を割り当てる"""
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    async def run(self, fn: Callable, *args: Any, deadline: Optional[float] = None) -> Any:
+        """fn(*args) をプロセスプールで実行し、締め切りまで待つ。過ぎたら DeadlineExceeded"""
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            future: Future = self.pool.submit(fn, *args)
+        except Exception:
+            self._release(started)
+            raise
+        future.add_done_callback(lambda _: self._release(started))
+
+        timeout = self.default_deadline if deadline is None else deadline
+        try:
+            # 待ちを打ち切ると、まだ始まっていない処理は取り消される
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise DeadlineExceeded(f"{timeout}秒以内に計算が終わりませんでした。")
+
+    async def run_fallback(self, fn: Callable, *args: Any) -> Any:
+        """
+        締め切りに間に合わなかった処理の代替 fn(*args) をスレッドで実行する。
+        代替処理もプロセスプールの枠の外で CPU を使うため、fallback_capacity 件を超えると Overloaded を送出する。
+        """
+        with self._lock:
+            if self.fallback_in_flight >= self.fallback_capacity:
+                self.fallback_rejected += 1
+                raise Overloaded(self.retry_after())
+            self.fallback_in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        finally:
+            with self._lock:
+                self.fallback_in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.max_workers,
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "finished": self.finished,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "fallback_capacity": self.fallback_capacity,
+            "fallback_in_flight": self.fallback_in_flight,
+            "fallback_rejected": self.fallback_rejected,
+            "mean_service_time": round(self.mean_service_time, 4),
+        }
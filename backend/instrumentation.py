@@ -0,0 +1,166 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 診断処理の計測。段階 (グリッド生成・動線・制約判定など) ごとの所要時間と、
+# 仕事量のカウンタ (探索したノード数・ヒープへの追加回数・グリッドのセル数・判定したペア数) を集める。
+# 記録中でないときの stage() / count() はコンテキスト変数を1回読むだけなので、本番でも常時有効にできる。
+# 集計は Prometheus のテキスト形式で /metrics から公開する。
+
+# --- 1回の診断の記録 ---
+
+class StageRecorder:
+    """1回の診断の段階ごとの所要時間 (秒) とカウンタ"""
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """プロセス間で受け渡しできる形 (dict) に変換"""
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+
+_current_recorder: ContextVar[Optional[StageRecorder]] = ContextVar("stage_recorder", default=None)
+
+@contextmanager
+def recording() -> Iterator[StageRecorder]:
+    """このブロック内で実行された stage() / count() を記録する"""
+    recorder = StageRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """段階の所要時間を記録 (記録中でなければ何もしない)"""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name):
+        yield
+
+def count(name: str, n: int = 1):
+    """仕事量のカウンタを加算 (記録中でなければ何もしない)"""
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.count(name, n)
+
+def server_timing(snapshot: Dict[str, Dict], total: Optional[float] = None) -> str:
+    """記録を Server-Timing ヘッダの値 (ミリ秒) に変換"""
+    entries = [f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in snapshot["stages"].items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000.0:.2f}")
+    return ", ".join(entries)
+
+def debug_info(snapshot: Dict[str, Dict], total: Optional[float] = None) -> Dict:
+    """記録を応答の debug フィールドの形式に変換"""
+    info = {
+        "stages_ms": {name: round(seconds * 1000.0, 3) for name, seconds in snapshot["stages"].items()},
+        "counters": snapshot["counters"],
+    }
+    if total is not None:
+        info["total_ms"] = round(total * 1000.0, 3)
+    return info
+
+# --- 集計 (Prometheus形式) ---
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WORK_BUCKETS = tuple(float(4 ** k) for k in range(2, 13))  # 16 〜 約1700万
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == math.inf else repr(float(value))
+
+class Histogram:
+    """ラベルの組ごとの累積ヒストグラム"""
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: Dict[Tuple[Tuple[str, str], ...], List] = {}  # ラベル -> [バケットごとの件数, 合計, 件数]
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return lines
+
+class Counter:
+    """ラベルの組ごとの単調増加カウンタ"""
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, n: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + n
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in sorted(self._series.items())]
+        return lines
+
+class DiagnosisMetrics:
+    """診断APIの集計値 (APIプロセス内で共有、スレッドセーフ)"""
+    def __init__(self):
+        self.requests = Counter("layout_diagnosis_requests_total", "診断リクエスト数 (結果の種類別)")
+        self.latency = Histogram("layout_diagnosis_request_seconds", "診断リクエストの応答時間", TIME_BUCKETS)
+        self.stages = Histogram("layout_diagnosis_stage_seconds", "診断の段階ごとの所要時間", TIME_BUCKETS)
+        self.work = Histogram("layout_diagnosis_work", "診断1回あたりの仕事量 (ノード数・セル数・ペア数など)", WORK_BUCKETS)
+        self._lock = threading.Lock()
+
+    def observe(self, outcome: str, total: float, snapshot: Optional[Dict[str, Dict]] = None):
+        with self._lock:
+            self.requests.inc(outcome=outcome)
+            self.latency.observe(total, outcome=outcome)
+            if snapshot is not None:
+                for name, seconds in snapshot["stages"].items():
+                    self.stages.observe(seconds, stage=name)
+                for name, n in snapshot["counters"].items():
+                    self.work.observe(n, counter=name)
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus のテキスト形式。gauges は出力時点の値 (プロセスプールの状態など)"""
+        with self._lock:
+            lines = self.requests.render() + self.latency.render() + self.stages.render() + self.work.render()
+        for name, value in (gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import uuid
+import queue
+import pickle
+import threading
+import multiprocessing
+from typing import Dict, List, Optional
+from backend.models import OptimizationJobRequest, PlacedFurniture
+from backend.diagnosis import build_room
+from backend.optimizer import GeneticLayoutOptimizer
+from backend.rules import ClearanceRules, get_rules, set_rules
+
+# 時間のかかるレイアウト探索 (遺伝的アルゴリズム) を、HTTPリクエストから切り離したジョブとして実行する。
+# ジョブは本体プロセス内のキューに積み、専用のワーカープロセスで1件ずつ実行する (外部のブローカーは使わない)。
+# 途中経過 (その時点の最良案) はワーカーからキューで受け取り、/api/jobs/{id}/events が SSE で配信する。
+# 探索の状態は一定間隔でディスクに保存し、サーバーを再起動すると未完了のジョブは保存した世代から再開する。
+
+DEFAULT_JOB_DIR = "layout_jobs"
+MAX_JOB_WORKERS = 1  # 同時に実行するジョブの数 (診断用のプロセスプールの邪魔をしないよう少なくする)
+PROGRESS_INTERVAL = 0.5  # 途中経過を送る最短の間隔 (秒)。最良案が改善したときだけ送る
+CHECKPOINT_INTERVAL = 5.0  # 探索の状態をディスクに保存する間隔 (秒)
+STOP_GRACE = 5.0  # 取り消し・停止を指示してから、応答しないワーカーを強制終了するまでの時間 (秒)
+MAX_FINISHED_JOBS = 100  # 保持する終了済みジョブの数 (古いものから削除する)
+
+# ワーカープロセスは spawn で起動する (スレッドを持つ uvicorn のプロセスを fork すると、ロックを持ったまま複製されうる)
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "cancelled", "failed")
+
+# --- ワーカープロセスで実行する処理 ---
+
+def _save_pickle(path: str, data: Dict):
+    """書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える"""
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+def _run_job(request_json: str, checkpoint_path: str, rules: ClearanceRules,
+             messages: multiprocessing.Queue, cancel: multiprocessing.Event, stop: multiprocessing.Event):
+    """
+    探索を実行し、(種類, 内容) をキューに送る。
+    progress: 最良案が改善した / done: 探索が終わった / cancelled: 取り消された /
+    suspended: サーバーの停止に合わせて状態を保存した / failed: 例外が発生した
+    """
+    try:
+        set_rules(rules)
+        request = OptimizationJobRequest.model_validate_json(request_json)
+        room = build_room(request.room)
+        items = [PlacedFurniture(item) for item in request.placed_furniture_list]
+
+        saved = None
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "rb") as f:
+                saved = pickle.load(f)
+        # 適応度の評価はこのプロセス内で行う (本体のプロセスプールはワーカーから使えない)
+        optimizer = GeneticLayoutOptimizer(room, items, population_size=request.population_size, seed=request.seed,
+                                           workers=1, checkpoint=saved["optimizer"] if saved else None)
+        # 経過時間は再開前の分も含めて time_budget と比べる
+        started = time.perf_counter() - (saved["elapsed"] if saved else 0.0)
+
+        def elapsed() -> float:
+            return time.perf_counter() - started
+
+        def checkpoint():
+            _save_pickle(checkpoint_path, {"optimizer": optimizer.checkpoint(), "elapsed": elapsed()})
+
+        best = -float("inf")
+        def report():
+            nonlocal best
+            if optimizer.archive_fitness[0] > best:
+                best = optimizer.archive_fitness[0]
+                messages.put(("progress", {
+                    "generation": optimizer.generation,
+                    "evaluations": optimizer.evaluations,
+                    "elapsed": round(elapsed(), 2),
+                    "best": optimizer.proposals(1)[0],
+                }))
+
+        # 初期集団 (現在の配置を含む) の最良案をすぐに返し、以降は改善のたびに送る
+        report()
+        last_report = last_checkpoint = time.perf_counter()
+        while optimizer.generation < request.max_generations and elapsed() < request.time_budget:
+            if cancel.is_set():
+                messages.put(("cancelled", None))
+                return
+            if stop.is_set():
+                checkpoint()
+                messages.put(("suspended", None))
+                return
+            optimizer.step()
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                report()
+                last_report = now
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                checkpoint()
+                last_checkpoint = now
+
+        report()
+        messages.put(("done", {
+            "proposals": optimizer.proposals(request.num_proposals),
+            "generations": optimizer.generation,
+            "evaluations": optimizer.evaluations,
+        }))
+    except Exception as e:
+        messages.put(("failed", f"{type(e).__name__}: {e}"))
+
+# --- ジョブ ---
+
+class Job:
+    """
+    1件の探索ジョブの状態。status は queued → running → done / cancelled / failed と進む。
+    version は状態が変わるたびに増え、SSE の配信側が変化の有無を知るのに使う。
+    """
+    def __init__(self, job_id: str, request_json: str, created: Optional[float] = None):
+        self.id = job_id
+        self.request_json = request_json
+        self.created = created if created is not None else time.time()
+        self.status = "queued"
+        self.progress: Optional[Dict] = None  # 最新の途中経過 (最良案を含む)
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.resumed = 0  # サーバーの再起動後に再開した回数
+        self.version = 0
+        self.cancel_requested = False
+
+    def to_dict(self, include_request: bool = False) -> Dict:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "resumed": self.resumed,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+        if include_request:
+            data["request"] = json.loads(self.request_json)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Job":
+        job = cls(data["id"], json.dumps(data["request"]), data["created"])
+        job.status, job.resumed = data["status"], data["resumed"]
+        job.progress, job.result, job.error = data["progress"], data["result"], data["error"]
+        return job
+
+# --- ジョブの管理 (本体プロセス) ---
+
+class JobManager:
+    """
+    ジョブの受け付け・実行・取り消しと、ディスクへの保存を行う。
+    ジョブごとに <id>.json (リクエストと状態) と <id>.ckpt (探索の途中状態) を directory に置く。
+    start() で未完了のジョブを読み込んで再開し、stop() で実行中のジョブの状態を保存して止める。
+    """
+    def __init__(self, directory: str = DEFAULT_JOB_DIR, max_workers: int = MAX_JOB_WORKERS):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.jobs: Dict[str, Job] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, Dict] = {}  # 実行中のジョブの cancel / stop イベントと取り消しの時刻
+        self._stopping = False
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.{suffix}")
+
+    def _save(self, job: Job):
+        path = self._path(job.id, "json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(include_request=True), f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _changed(self, job: Job):
+        """状態が変わったことを記録し、ディスクに保存する"""
+        job.version += 1
+        self._save(job)
+
+    # --- 起動と停止 ---
+
+    def start(self):
+        """保存済みのジョブを読み込み、未完了のものを作成順に再開してワーカーを起動する"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping = False
+        restored = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            self.jobs[job.id] = job
+            if job.status in ACTIVE:
+                restored.append(job)
+        for job in sorted(restored, key=lambda j: j.created):
+            if job.status == "running":
+                job.resumed += 1
+            job.status = "queued"
+            self._changed(job)
+            self._queue.put(job.id)
+
+        for _ in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """実行中のジョブに状態の保存と終了を指示する。保存したジョブは次回の start() で再開する"""
+        self._stopping = True
+        with self._lock:
+            for running in self._running.values():
+                running["stop"].set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=STOP_GRACE + 1.0)
+        self._threads = []
+
+    # --- 受け付け・取り消し ---
+
+    def submit(self, request: OptimizationJobRequest) -> Job:
+        job = Job(uuid.uuid4().hex, request.model_dump_json())
+        with self._lock:
+            self.jobs[job.id] = job
+        self._changed(job)
+        self._queue.put(job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """新しい順のジョブの一覧 (状態のみ)"""
+        jobs = sorted(list(self.jobs.values()), key=lambda j: j.created, reverse=True)
+        return [{"id": j.id, "status": j.status, "created": j.created} for j in jobs]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """ジョブを取り消す。待機中ならその場で、実行中ならワーカーが次の世代の前に止まる"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        with self._lock:
+            job.cancel_requested = True
+            running = self._running.get(job_id)
+            if running is not None:
+                running["cancel"].set()
+                running["cancelled_at"] = time.monotonic()
+            elif job.status == "queued":
+                self._finish(job, "cancelled")
+        return job
+
+    # --- 実行 ---
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None or self._stopping:
+                return
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                self._finish(job, "failed", error=f"{type(e).__name__}: {e}")
+
+    def _execute(self, job: Job):
+        messages = _MP_CONTEXT.Queue()
+        running = {"cancel": _MP_CONTEXT.Event(), "stop": _MP_CONTEXT.Event(), "cancelled_at": None}
+        process = _MP_CONTEXT.Process(
+            target=_run_job,
+            args=(job.request_json, self._path(job.id, "ckpt"), get_rules(), messages, running["cancel"], running["stop"]),
+            daemon=True
+        )
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, "cancelled")
+                return
+            self._running[job.id] = running
+            job.status = "running"
+            self._changed(job)
+        process.start()
+        stop_requested_at = None
+
+        try:
+            while True:
+                try:
+                    kind, payload = messages.get(timeout=0.2)
+                except queue.Empty:
+                    if not process.is_alive():
+                        # 最後の通知を送らずに終了した (強制終了・異常終了)
+                        if self._stopping:
+                            return  # 保存済みの状態から次回再開する
+                        if job.cancel_requested:
+                            self._finish(job, "cancelled")
+                        else:
+                            self._finish(job, "failed", error=f"ワーカープロセスが異常終了しました (終了コード {process.exitcode})")
+                        return
+                    # 取り消し・停止の指示に応答しないワーカーは強制終了する
+                    if self._stopping and stop_requested_at is None:
+                        stop_requested_at = time.monotonic()
+                    deadline_from = running["cancelled_at"] or stop_requested_at
+                    if deadline_from is not None and time.monotonic() - deadline_from > STOP_GRACE:
+                        process.terminate()
+                    continue
+
+                if kind == "progress":
+                    job.progress = payload
+                    self._changed(job)
+                elif kind == "done":
+                    self._finish(job, "done", result=payload)
+                    return
+                elif kind == "cancelled":
+                    self._finish(job, "cancelled")
+                    return
+                elif kind == "failed":
+                    self._finish(job, "failed", error=payload)
+                    return
+                elif kind == "suspended":
+                    return
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+            process.join(timeout=STOP_GRACE)
+            if process.is_alive():
+                process.terminate()
+
+    def _finish(self, job: Job, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        job.status, job.result, job.error = status, result, error
+        self._changed(job)
+        # 終了したジョブは再開しないので途中状態を消す
+        try:
+            os.remove(self._path(job.id, "ckpt"))
+        except FileNotFoundError:
+            pass
+        self._prune()
+
+    def _prune(self):
+        """終了済みのジョブが MAX_FINISHED_JOBS を超えたら古いものから削除する"""
+        finished = sorted((j for j in list(self.jobs.values()) if j.status in FINISHED), key=lambda j: j.created)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            self.jobs.pop(job.id, None)
+            try:
+                os.remove(self._path(job.id, "json"))
+            except FileNotFoundError:
+                pass
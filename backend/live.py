@@ -0,0 +1,100 @@
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from backend.models import RoomInput, PlacedFurnitureInput, PlacedFurniture
+from backend.diagnosis import build_room, run_diagnosis
+from backend.annealing import IncrementalLayoutState
+from backend.batch_scoring import hard_constraint_warnings
+from backend.scoring import weighted_total
+from backend.rules import CLEARANCE_PENALTY
+
+# 画面上のスライダー操作に合わせたライブ採点 (APIサーバーを介さずアプリ内で計算する)。
+# 部屋と家具の構成が変わらない間は差分更新できるレイアウト状態を保持し、動いた家具の分だけ採点し直す。
+# ドアからの距離場の作り直しは操作ごとには行わず、一定間隔か、入力が止まったとき・詳しい診断のときにまとめて行う。
+
+LIVE_REFRESH_INTERVAL = 2.0  # 操作中に距離場を作り直す最短の間隔 (秒)。間の操作では前回の距離場で動線を概算する
+
+class LiveLayoutScorer:
+    """
+    1ユーザー (Streamlit のセッション) につき1つ保持する。
+    部屋か家具の構成 (名称・カテゴリ・寸法) が変わったときだけ状態を作り直し、
+    位置・向きの変更は IncrementalLayoutState.move で反映する。
+    距離場は refresh_interval 秒おきか、refresh() を呼んだときだけ作り直す。
+    """
+    def __init__(self, refresh_interval: float = LIVE_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = time.monotonic()
+        self.state: Optional[IncrementalLayoutState] = None
+        self._room_key: Optional[str] = None
+        self._set_key: Optional[Tuple] = None
+        self.rebuilds = 0
+        self.last_moved: List[int] = []
+
+    def update(self, room_input: RoomInput, furniture_inputs: List[PlacedFurnitureInput]) -> Dict:
+        """最新の入力を反映し、ライブ採点の結果を返す"""
+        room_key = room_input.model_dump_json()
+        set_key = tuple((f.name, f.category, f.width, f.depth, f.height) for f in furniture_inputs)
+        if self.state is None or room_key != self._room_key or set_key != self._set_key:
+            self.state = IncrementalLayoutState(build_room(room_input), [PlacedFurniture(f) for f in furniture_inputs])
+            self._room_key, self._set_key = room_key, set_key
+            self.rebuilds += 1
+            self.refreshed_at = time.monotonic()
+            self.last_moved = list(range(len(furniture_inputs)))
+            return self.summary()
+
+        state = self.state
+        self.last_moved = [k for k, f in enumerate(furniture_inputs) if (f.x, f.y, f.rotation) != tuple(state.poses[k])]
+        for k in self.last_moved:
+            f = furniture_inputs[k]
+            state.move(k, f.x, f.y, f.rotation)
+            state.commit()
+        if self.last_moved and time.monotonic() - self.refreshed_at >= self.refresh_interval:
+            self.refresh()
+        return self.summary()
+
+    def refresh(self) -> bool:
+        """前回の作り直し以降にグリッドが変わっていれば距離場を作り直す。作り直したら True"""
+        self.refreshed_at = time.monotonic()
+        if self.state is None or not self.state.pending_grid_changes:
+            return False
+        self.state.refresh_distance_field()
+        return True
+
+    def summary(self) -> Dict:
+        """現在の状態の採点結果 (/api/diagnose_layout と同じ点数・警告の形式)"""
+        return summarize_state(self.state)
+
+    def diagnose(self) -> Dict:
+        """詳しい診断 (アドバイス付き)。距離場を最新にしてから行う"""
+        self.refresh()
+        return diagnose_state(self.state)
+
+# --- レイアウト状態の採点 (レイアウトセッション backend/sessions.py と共用) ---
+
+def summarize_state(state: IncrementalLayoutState) -> Dict:
+    """差分更新しているレイアウト状態の採点結果 (クリアランス違反も状態が保持しているものを使う)"""
+    fs = state.furniture_set
+    circulation, zoning, aesthetics, daylight = float(state.circulation), float(state.zoning), float(state.aesthetics), float(state.daylight)
+    pair_i, pair_j = fs.pairs
+    warnings = hard_constraint_warnings(fs, state.outside, state.overlaps[pair_i, pair_j])
+    clearance_warnings, soft_warnings = state.clearance_state.clearance.warnings(*state.clearance_state.hits())
+    warnings += clearance_warnings
+    is_valid = not warnings
+    total = weighted_total(circulation, zoning, aesthetics) - CLEARANCE_PENALTY * state.soft_violations
+    return {
+        "total_score": round(max(total, 0.0) * 100, 1) if is_valid else 10.0,
+        "details": {
+            "circulation": round(circulation, 2),
+            "zoning": round(zoning, 2),
+            "aesthetics": round(aesthetics, 2),
+            "daylight": round(daylight, 2)
+        },
+        "is_valid": is_valid,
+        "warnings": warnings + soft_warnings,
+    }
+
+def diagnose_state(state: IncrementalLayoutState) -> Dict:
+    """保持している占有グリッドと距離場を使って、詳しい診断 (アドバイス付き) を行う"""
+    # 階層的な距離場 (広い間取り) は run_diagnosis の距離場として使えないため、その場合は診断側で作り直す
+    distance_field = state.distance_field if isinstance(state.distance_field, np.ndarray) else None
+    return run_diagnosis(state.room, state.placed_furniture(), state.coverage, distance_field)
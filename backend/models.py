@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Tuple
 import numpy as np
 
 # --- 1. Pydantic入力モデル (ユーザーからのリクエストボディ) ---
@@ -25,6 +25,82 @@ class DiagnosisRequest(BaseModel):
     room: RoomInput
     placed_furniture_list: List[PlacedFurnitureInput]
 
+class OptimizationRequest(BaseModel):
+    """HTTPの応答を待つ同期の探索。ワーカーの枠を占有し続けないよう、探索の規模に上限を設ける"""
+    room: RoomInput
+    placed_furniture_list: List[PlacedFurnitureInput]
+    num_proposals: int = Field(3, ge=1, le=10)
+    population_size: int = Field(60, ge=4, le=200)
+    max_generations: int = Field(100, ge=1, le=500)
+    time_budget: float = Field(5.0, gt=0, le=30.0) # 計算時間の上限（秒）
+    seed: Optional[int] = None # 同じseedなら同じ結果を再現できる（世代数の上限で終了した場合）
+
+class OptimizationJobRequest(OptimizationRequest):
+    """非同期の探索ジョブ (backend/jobs.py)。HTTPの応答を待たないため、既定の探索を長めにとり、上限も同期の探索より大きくする"""
+    population_size: int = Field(60, ge=4, le=1000)
+    max_generations: int = Field(2000, ge=1, le=20000)
+    time_budget: float = Field(60.0, gt=0, le=600.0)
+
+class SpotSuggestionRequest(BaseModel):
+    """家具1つの置き場所の提案 (backend/placement.py)。他の家具は動かさない"""
+    room: RoomInput
+    placed_furniture_list: List[PlacedFurnitureInput]
+    index: int # 置き場所を探す家具 (家具リスト内の位置)
+    num_spots: int = 5
+
+# --- レイアウトセッションの差分 (backend/sessions.py) ---
+
+class SessionOperation(BaseModel):
+    op: Literal["move", "add", "remove"]
+    index: Optional[int] = None # move / remove の対象 (家具リスト内の位置)
+    x: Optional[float] = None # move で省略した値は変えない
+    y: Optional[float] = None
+    rotation: Optional[float] = None
+    item: Optional[PlacedFurnitureInput] = None # add で末尾に追加する家具
+
+class SessionPatchRequest(BaseModel):
+    ops: List[SessionOperation] # 先頭から順に適用する (1つでも不正なら何も適用しない)
+
+# --- 保存済みの部屋・家具を使うリクエスト (backend/storage.py) ---
+
+class RoomCreateRequest(RoomInput):
+    user_id: Optional[int] = None
+    name: Optional[str] = None
+    height: Optional[float] = None
+
+class FurnitureCreateRequest(BaseModel):
+    user_id: Optional[int] = None
+    name: str
+    category: str
+    width: float
+    depth: float
+    height: Optional[float] = None
+    is_fixed: bool = False # 動かしにくい家具か
+
+class FurniturePlacement(BaseModel):
+    furniture_id: int # 登録済みの家具のID
+    x: float
+    y: float
+    rotation: float = 0.0
+
+class StoredDiagnosisRequest(BaseModel):
+    placements: List[FurniturePlacement]
+    save: bool = False # 診断結果をレイアウト案として保存するか
+
+class StoredOptimizationRequest(BaseModel):
+    """保存済みの部屋での同期の探索。上限は OptimizationRequest と同じ"""
+    placements: List[FurniturePlacement]
+    num_proposals: int = Field(3, ge=1, le=10)
+    population_size: int = Field(60, ge=4, le=200)
+    max_generations: int = Field(100, ge=1, le=500)
+    time_budget: float = Field(5.0, gt=0, le=30.0)
+    seed: Optional[int] = None
+
+class ProposalInput(BaseModel):
+    placed_furniture_list: List[PlacedFurnitureInput]
+    score: float
+    reasoning: Optional[str] = None
+
 # --- 2. 内部クラス (計算ロジック用) ---
 
 class Room:
@@ -0,0 +1,381 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.scoring import create_occupancy_grid, score_circulation, score_zoning, score_aesthetics, check_hard_constraints, weighted_total
+from backend.batch_scoring import (FurnitureSet, encode_layout, score_population, score_zoning_batch, score_aesthetics_batch,
+                                   check_hard_constraints_batch)
+from backend.rules import CLEARANCE_PENALTY, CompiledClearance, get_rules, create_label_grid
+from backend.daylight import score_daylight, score_daylight_batch
+from backend.placement import PlacementMap, FootprintGrid
+from backend.executor import get_process_pool
+
+# 遺伝的アルゴリズムによるレイアウト最適化。
+# 遺伝子は家具ごとの (x, y, rotation) で、furniture_id は家具リスト内の位置で表す。
+
+ROTATIONS = np.array([0.0, 90.0, 180.0, 270.0])  # 4方向のみを許容
+VIOLATION_PENALTY = 1.0  # 制約違反1件あたりの減点 (違反のある配置は常に違反のない配置より下位になる)
+WALL_MARGIN = 0.01  # 壁との最小の隙間 (m)。座標の丸めや三角関数の誤差で部屋からはみ出さないようにする
+REPAIR_RATE = 0.5  # はみ出し・重なりのある子のうち修復する割合 (残りは違反したまま評価して多様性を保つ)
+
+# --- 適応度評価 (プロセスプールのワーカーで実行) ---
+
+def evaluate_population(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    母集団の適応度を計算する。
+    戻り値: (fitness (N,), スコア (N, 3) = 動線・ゾーニング・美観)
+    クリアランス規則はグリッドが必要なため、はみ出し・重なりのない個体についてのみ評価する。
+    動線は距離場の計算が必要なため、ハード制約をすべて満たす個体についてのみ評価する
+    (ソフト制約のクリアランス違反は CLEARANCE_PENALTY の減点だけで、動線は評価する)。
+    """
+    result = score_population(room, furniture_set, poses)
+    circulation = np.zeros(poses.shape[0])
+    clearance_violations = np.zeros(poses.shape[0], dtype=int)
+    soft_violations = np.zeros(poses.shape[0], dtype=int)
+    clearance = get_rules().compile(room, furniture_set)
+    labels = None
+    for n in np.flatnonzero(result["is_valid"]):
+        items = furniture_set.to_placed_furniture(poses[n])
+        # 家具番号つきの占有グリッドを動線とクリアランスの両方に使う (領域は個体間で使い回す)
+        labels = create_label_grid(room, items, out=labels)
+        clearance_violations[n], soft_violations[n] = clearance.count(poses[n], labels)
+        if clearance_violations[n] == 0:
+            circulation[n] = score_circulation(room, items, labels)
+
+    violations = result["out_of_room"].sum(axis=1) + result["overlaps"].sum(axis=1) + clearance_violations
+    fitness = (weighted_total(circulation, result["zoning"], result["aesthetics"])
+               - VIOLATION_PENALTY * violations - CLEARANCE_PENALTY * soft_violations)
+    return fitness, np.stack([circulation, result["zoning"], result["aesthetics"]], axis=1)
+
+def _evaluate_chunk(args: Tuple[Room, FurnitureSet, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    return evaluate_population(*args)
+
+# --- 遺伝子の修復 ---
+
+def half_extents(furniture_set: FurnitureSet, rotations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """4方向に回転した家具の半幅 (x方向, y方向)"""
+    upright = (np.round(rotations / 90.0).astype(int) % 2) == 0
+    hx = np.where(upright, furniture_set.widths / 2, furniture_set.depths / 2)
+    hy = np.where(upright, furniture_set.depths / 2, furniture_set.widths / 2)
+    return hx, hy
+
+def clamp_to_room(room: Room, furniture_set: FurnitureSet, poses: np.ndarray) -> np.ndarray:
+    """家具が部屋に収まるよう中心座標を制限する (部屋より大きい家具は中央に置く)。poses をその場で書き換える"""
+    hx, hy = half_extents(furniture_set, poses[..., 2])
+    hx, hy = hx + WALL_MARGIN, hy + WALL_MARGIN
+    poses[..., 0] = np.clip(poses[..., 0], hx, np.maximum(hx, room.width - hx))
+    poses[..., 1] = np.clip(poses[..., 1], hy, np.maximum(hy, room.depth - hy))
+    poses[..., 0] = np.where(2 * hx > room.width, room.width / 2, poses[..., 0])
+    poses[..., 1] = np.where(2 * hy > room.depth, room.depth / 2, poses[..., 1])
+    return poses
+
+def snap_rotations(poses: np.ndarray) -> np.ndarray:
+    """回転角を最も近い4方向に丸める"""
+    poses = poses.copy()
+    poses[..., 2] = ROTATIONS[np.round(poses[..., 2] / 90.0).astype(int) % 4]
+    return poses
+
+# --- 家具の置き場所の提案 ---
+
+SPOT_SHORTLIST = 8  # 動線以外の点数で絞り込む候補の数 (返す件数に対する倍率)。残った候補だけを動線まで含めて採点する
+SPOT_MIN_DISTANCE = 0.3  # 提案する置き場所どうしの最小の距離 (m)。向きが違う位置は近くても別の案とする
+
+def _spread_out(candidates: np.ndarray, order: np.ndarray, count: int) -> np.ndarray:
+    """order の順に、既に選んだ候補と同じ向きで SPOT_MIN_DISTANCE 以上離れた候補を count 件まで選ぶ"""
+    chosen = []
+    for n in order:
+        picked = candidates[chosen]
+        near = (picked[:, 2] == candidates[n, 2]) & (np.hypot(*(picked[:, :2] - candidates[n, :2]).T) < SPOT_MIN_DISTANCE)
+        if not near.any():
+            chosen.append(n)
+            if len(chosen) == count:
+                break
+    return np.array(chosen, dtype=int)
+
+def suggest_spots(room: Room, furniture_set: FurnitureSet, pose: np.ndarray, index: int, num_spots: int = 5,
+                  clearance: Optional[CompiledClearance] = None, occupied: Optional[np.ndarray] = None) -> List[Dict]:
+    """
+    他の家具をそのままにして家具 index を置ける位置を配置可能マップで求め、総合点の高い順に num_spots 件返す。
+    全候補をゾーニング・美観でまとめて採点して絞り込み、残った候補を動線・採光まで含めて採点し直す。
+    点数は describe_layout と同じ (他の家具どうしの違反が残っていれば total_score は 10.0)。
+    """
+    clearance = clearance if clearance is not None else get_rules().compile(room, furniture_set)
+    candidates = PlacementMap(room, furniture_set, pose, index, ROTATIONS, clearance, occupied).candidates()
+    if len(candidates) == 0:
+        return []
+    poses = np.repeat(pose[None], len(candidates), axis=0)
+    poses[:, index] = candidates
+    # 重なりは配置可能マップで除いてあるので、絞り込みにはハード制約の判定を含まない採点関数を使う
+    partial = weighted_total(0.0, score_zoning_batch(furniture_set, poses), score_aesthetics_batch(room, furniture_set, poses))
+    shortlist = _spread_out(candidates, np.argsort(-partial, kind='stable'), num_spots * SPOT_SHORTLIST)
+    poses = poses[shortlist]
+
+    # 違反の有無は候補によらない (この家具自身は違反しない位置だけが候補) ので、
+    # evaluate_population と違って違反があっても動線を採点し、減点なしの総合点で順位を付ける
+    result = score_population(room, furniture_set, poses)
+    daylight = score_daylight_batch(room, furniture_set, poses)
+    circulation = np.zeros(len(poses))
+    is_valid = result["is_valid"].copy()
+    soft_violations = np.zeros(len(poses), dtype=int)
+    labels = None
+    for n in range(len(poses)):
+        items = furniture_set.to_placed_furniture(poses[n])
+        labels = create_label_grid(room, items, out=labels)
+        hard, soft_violations[n] = clearance.count(poses[n], labels)
+        is_valid[n] &= hard == 0
+        circulation[n] = score_circulation(room, items, labels)
+    scores = np.stack([circulation, result["zoning"], result["aesthetics"], daylight], axis=1)
+    total = weighted_total(circulation, result["zoning"], result["aesthetics"])
+    penalized = total - CLEARANCE_PENALTY * soft_violations
+
+    spots = []
+    for n in _spread_out(candidates[shortlist], np.argsort(-total, kind='stable'), num_spots):
+        x, y, rotation = candidates[shortlist[n]]
+        spots.append({
+            # 座標は丸めない (丸めるとセルの境界からずれ、他の家具と重なることがある)
+            "x": float(x), "y": float(y), "rotation": float(rotation),
+            "total_score": round(max(float(penalized[n]), 0.0) * 100, 1) if is_valid[n] else 10.0,
+            "details": dict(zip(("circulation", "zoning", "aesthetics", "daylight"), np.round(scores[n], 2).tolist())),
+            "is_valid": bool(is_valid[n]),
+        })
+    return spots
+
+# --- 遺伝的アルゴリズム本体 ---
+
+class GeneticLayoutOptimizer:
+    def __init__(self, room: Room, placed_furniture_list: List[PlacedFurniture],
+                 population_size: int = 60, elite_size: int = 4, mutation_rate: float = 0.2,
+                 seed: Optional[int] = None, executor: Optional[Executor] = None, workers: Optional[int] = None,
+                 checkpoint: Optional[Dict] = None):
+        self.room = room
+        self.furniture_set = FurnitureSet(placed_furniture_list)
+        self.population_size = max(population_size, elite_size + 2, 4)
+        self.elite_size = elite_size
+        self.mutation_rate = mutation_rate
+        self.rng = np.random.default_rng(seed)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.executor = executor
+        # 配置可能マップ (突然変異・修復) で使うクリアランス規則
+        self.clearance = get_rules().compile(room, self.furniture_set)
+
+        if checkpoint is not None:
+            # checkpoint() で保存した状態から再開する (初期集団の生成・評価は行わない)
+            self.restore(checkpoint)
+            return
+        self.generation = 0
+        self.evaluations = 0
+        self.population = self._initial_population(encode_layout(placed_furniture_list))
+        self.fitness, self.scores = self._evaluate(self.population)
+        # 世代をまたいで優秀な個体を保持するアーカイブ (多様な上位案の選択に使う)
+        self.archive_poses = np.empty((0,) + self.population.shape[1:])
+        self.archive_fitness = np.empty(0)
+        self._update_archive(self.population, self.fitness)
+
+    # --- 中断と再開 ---
+
+    def checkpoint(self) -> Dict:
+        """探索を途中から再開するための状態 (pickle できる辞書)。乱数の状態も含むので再開後の探索も再現できる"""
+        return {
+            "generation": self.generation,
+            "evaluations": self.evaluations,
+            "population": self.population.copy(),
+            "fitness": self.fitness.copy(),
+            "scores": self.scores.copy(),
+            "archive_poses": self.archive_poses.copy(),
+            "archive_fitness": self.archive_fitness.copy(),
+            "rng": self.rng.bit_generator.state,
+        }
+
+    def restore(self, state: Dict):
+        """checkpoint() の状態に戻す (家具の構成と母集団の大きさは同じでなければならない)"""
+        if state["population"].shape != (self.population_size, len(self.furniture_set), 3):
+            raise ValueError("チェックポイントの母集団の形が家具の構成と一致しません。")
+        self.generation = state["generation"]
+        self.evaluations = state["evaluations"]
+        self.population = state["population"].copy()
+        self.fitness = state["fitness"].copy()
+        self.scores = state["scores"].copy()
+        self.archive_poses = state["archive_poses"].copy()
+        self.archive_fitness = state["archive_fitness"].copy()
+        self.rng.bit_generator.state = state["rng"]
+
+    # --- 遺伝子の生成 ---
+
+    def _random_poses(self, count: int) -> np.ndarray:
+        m = len(self.furniture_set)
+        poses = np.empty((count, m, 3))
+        poses[..., 2] = self.rng.choice(ROTATIONS, size=(count, m))
+        poses[..., 0] = self.rng.uniform(0.0, self.room.width, size=(count, m))
+        poses[..., 1] = self.rng.uniform(0.0, self.room.depth, size=(count, m))
+        return clamp_to_room(self.room, self.furniture_set, poses)
+
+    def _initial_population(self, current: np.ndarray) -> np.ndarray:
+        """現在の配置 (回転を4方向に丸めたもの) とランダムな配置から初期集団を作る"""
+        population = self._random_poses(self.population_size)
+        population[0] = clamp_to_room(self.room, self.furniture_set, snap_rotations(current))
+        return population
+
+    # --- 評価 ---
+
+    def _evaluate(self, poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        self.evaluations += poses.shape[0]
+        if self.workers <= 1:
+            return evaluate_population(self.room, self.furniture_set, poses)
+
+        executor = self.executor or get_process_pool()
+        chunks = np.array_split(poses, self.workers)
+        results = list(executor.map(_evaluate_chunk, [(self.room, self.furniture_set, c) for c in chunks if len(c)]))
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def _update_archive(self, poses: np.ndarray, fitness: np.ndarray, size: int = 50):
+        all_poses = np.concatenate([self.archive_poses, poses])
+        all_fitness = np.concatenate([self.archive_fitness, fitness])
+        # 同一個体の重複を除き、適応度の高い順に保持
+        _, unique = np.unique(np.round(all_poses, 6).reshape(len(all_poses), -1), axis=0, return_index=True)
+        order = unique[np.argsort(-all_fitness[unique], kind='stable')][:size]
+        self.archive_poses, self.archive_fitness = all_poses[order], all_fitness[order]
+
+    # --- 遺伝的操作 ---
+
+    def _select(self, count: int, tournament_size: int = 3) -> np.ndarray:
+        """トーナメント選択"""
+        candidates = self.rng.integers(0, len(self.population), size=(count, tournament_size))
+        winners = np.argmax(self.fitness[candidates], axis=1)
+        return candidates[np.arange(count), winners]
+
+    def _crossover(self, parents_a: np.ndarray, parents_b: np.ndarray) -> np.ndarray:
+        """一様交叉 (家具単位で親の遺伝子を受け継ぐ)"""
+        mask = self.rng.random(parents_a.shape[:2]) < 0.5
+        return np.where(mask[..., None], parents_a, parents_b)
+
+    def _mutate(self, poses: np.ndarray) -> np.ndarray:
+        count, m = poses.shape[:2]
+        mutate = self.rng.random((count, m)) < self.mutation_rate
+        kind = self.rng.integers(0, 3, size=(count, m))
+
+        # 0: 小さな移動, 1: 回転の変更, 2: 部屋内の別の位置へ移動
+        sigma = 0.1 * max(self.room.width, self.room.depth)
+        shift = self.rng.normal(0.0, sigma, size=(count, m, 2))
+        poses[..., :2] += np.where((mutate & (kind == 0))[..., None], shift, 0.0)
+
+        rotations = self.rng.choice(ROTATIONS, size=(count, m))
+        poses[..., 2] = np.where(mutate & (kind == 1), rotations, poses[..., 2])
+
+        poses = clamp_to_room(self.room, self.furniture_set, poses)
+        self._relocate(poses, mutate & (kind == 2))
+        return poses
+
+    def _relocate(self, poses: np.ndarray, targets: np.ndarray):
+        """
+        targets (N, M) の家具を、配置可能マップから一様に選んだ置ける位置 (向きを含む) へ移す。
+        置ける位置がない家具は部屋内のランダムな位置へ移す。poses をその場で書き換える
+        """
+        fallback = self._random_poses(len(poses))
+        for n in np.flatnonzero(targets.any(axis=1)):
+            grid = FootprintGrid(self.room, self.furniture_set, poses[n])
+            for i in np.flatnonzero(targets[n]):
+                spot = grid.placement_map(i, ROTATIONS, self.clearance).sample(self.rng)
+                grid.move(i, spot if spot is not None else fallback[n, i])
+
+    def _repair(self, poses: np.ndarray) -> np.ndarray:
+        """
+        はみ出し・重なりのある個体の一部 (REPAIR_RATE) について、違反している家具を1つ選び、
+        配置可能マップで最も近い置ける位置へ移す。poses をその場で書き換える
+        """
+        _, out_of_room, overlaps = check_hard_constraints_batch(self.room, self.furniture_set, poses)
+        _, pair_j = self.furniture_set.pairs
+        broken = out_of_room.any(axis=1) | overlaps.any(axis=1)
+        for n in np.flatnonzero(broken & (self.rng.random(len(poses)) < REPAIR_RATE)):
+            violating = out_of_room[n].copy()
+            violating[pair_j[overlaps[n]]] = True
+            i = self.rng.choice(np.flatnonzero(violating))
+            placement = FootprintGrid(self.room, self.furniture_set, poses[n]).placement_map(i, ROTATIONS, self.clearance)
+            spot = placement.nearest(*poses[n, i, :2])
+            if spot is not None:
+                poses[n, i] = spot
+        return poses
+
+    def step(self):
+        """1世代分の進化 (エリート保存 + 選択・交叉・突然変異)"""
+        n_children = self.population_size - self.elite_size
+        elite = np.argsort(-self.fitness, kind='stable')[:self.elite_size]
+
+        parents_a = self.population[self._select(n_children)]
+        parents_b = self.population[self._select(n_children)]
+        children = self._repair(self._mutate(self._crossover(parents_a, parents_b)))
+        child_fitness, child_scores = self._evaluate(children)
+
+        self.population = np.concatenate([self.population[elite], children])
+        self.fitness = np.concatenate([self.fitness[elite], child_fitness])
+        self.scores = np.concatenate([self.scores[elite], child_scores])
+        self._update_archive(children, child_fitness)
+        self.generation += 1
+
+    def run(self, max_generations: int = 100, time_budget: Optional[float] = None, num_proposals: int = 3) -> List[Dict]:
+        """世代数または時間 (秒) の上限まで進化させ、多様な上位案を返す"""
+        start = time.perf_counter()
+        while self.generation < max_generations:
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+            self.step()
+        return self.proposals(num_proposals)
+
+    # --- 結果の取り出し ---
+
+    def _pick_diverse(self, num_proposals: int, min_distance: float) -> List[np.ndarray]:
+        """適応度の高い順に、既に選んだ案と十分に異なる配置を選ぶ"""
+        chosen = []
+        for pose in self.archive_poses:
+            if all(self._layout_distance(pose, c) >= min_distance for c in chosen):
+                chosen.append(pose)
+            if len(chosen) == num_proposals:
+                break
+        return chosen
+
+    @staticmethod
+    def _layout_distance(a: np.ndarray, b: np.ndarray) -> float:
+        """家具の平均移動距離 (m)。向きが異なる家具は0.5m分の差として数える"""
+        moved = np.linalg.norm(a[:, :2] - b[:, :2], axis=1)
+        turned = (a[:, 2] != b[:, 2]) * 0.5
+        return float(np.mean(moved + turned)) if len(a) else 0.0
+
+    def proposals(self, num_proposals: int = 3, min_distance: float = 0.5) -> List[Dict]:
+        results = []
+        for rank, pose in enumerate(self._pick_diverse(num_proposals, min_distance), start=1):
+            # 座標は丸めずに返す。配置可能マップの格子は家具の端をセルの境界にぎりぎりで揃えるため、
+            # 丸めると隣のセルや壁に掛かって違反になることがある
+            items = self.furniture_set.to_placed_furniture(pose)
+            results.append({"rank": rank, **describe_layout(self.room, items)})
+        return results
+
+def describe_layout(room: Room, placed_items: List[PlacedFurniture]) -> Dict:
+    """単体の採点関数で配置を採点し直し、APIの応答形式にまとめる"""
+    is_valid, warnings = check_hard_constraints(room, placed_items)
+    clearance_warnings, soft_warnings, soft_violations = get_rules().check(room, placed_items)
+    warnings += clearance_warnings + soft_warnings
+    is_valid = is_valid and not clearance_warnings
+    grid = create_occupancy_grid(room, placed_items)
+    circulation_score = score_circulation(room, placed_items, grid)
+    zoning_score = score_zoning(placed_items)
+    aesthetics_score = score_aesthetics(room, placed_items)
+    daylight_score = score_daylight(room, placed_items)
+    total_score = weighted_total(circulation_score, zoning_score, aesthetics_score) - CLEARANCE_PENALTY * soft_violations
+
+    return {
+        "total_score": round(max(total_score, 0.0) * 100, 1) if is_valid else 10.0,
+        "details": {
+            "circulation": round(circulation_score, 2),
+            "zoning": round(zoning_score, 2),
+            "aesthetics": round(aesthetics_score, 2),
+            "daylight": round(daylight_score, 2)
+        },
+        "is_valid": is_valid,
+        "warnings": warnings,
+        "placed_furniture_list": [
+            {"name": f.name, "category": f.category, "width": f.width, "depth": f.depth, "height": f.height,
+             "x": f.x, "y": f.y, "rotation": f.rotation}
+            for f in placed_items
+        ]
+    }
@@ -0,0 +1,321 @@
+import heapq
+import math
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from backend.scoring import RESOLUTION, DIAGONAL_COST, calculate_distance_field
+
+# 階層的な経路探索 (HPA* 方式)。
+# 占有グリッドを一辺 cluster_size セルのクラスタに分け、隣り合うクラスタの境界で通れる区間ごとに
+# 出入口 (ノード) を置く。クラスタ内のノード間の距離を前計算した抽象グラフ上で経路を探し、
+# 始点・終点の周り (それぞれのクラスタ内) だけを細かいグリッドで探索する。
+# 求まる経路長は実在する経路の長さなので、平坦なグリッド全体の探索の結果以上になる (誤差は出入口の位置による)。
+# 家具が動いたときは、変化したセルを含むクラスタとその境界だけを作り直す。
+
+DEFAULT_CLUSTER_SIZE = 16  # クラスタの一辺 (セル)
+ENTRANCE_SPACING = 6  # 幅の広い出入口はこの間隔 (セル) でノードを置く (中央1点だけだと遠回りの誤差が大きい)
+HIERARCHICAL_MIN_CELLS = 40000  # これ以上のセル数のグリッドで階層的探索を使う (小さな部屋では全体探索の方が速い)
+
+Cell = Tuple[int, int]
+Cluster = Tuple[int, int]
+
+def octile_distance(a: Cell, b: Cell) -> float:
+    """障害物がないときの8近傍の最短経路長 (セル単位)"""
+    dr, dc = abs(a[0] - b[0]), abs(a[1] - b[1])
+    return max(dr, dc) + (DIAGONAL_COST - 1.0) * min(dr, dc)
+
+class ClusterGraph:
+    """
+    占有グリッド (0=通行可能) の抽象グラフ。grid は参照を保持するので、
+    呼び出し側がグリッドを書き換えたら、変化した範囲を update() に渡す。
+    距離はすべてセル単位で保持し、返すときに resolution を掛けて m にする。
+    """
+    def __init__(self, grid: np.ndarray, cluster_size: int = DEFAULT_CLUSTER_SIZE, resolution: float = RESOLUTION):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.resolution = resolution
+        rows, cols = grid.shape
+        self.cluster_shape = (math.ceil(rows / cluster_size), math.ceil(cols / cluster_size))
+
+        # 境界 (左または上のクラスタ, 右または下のクラスタ) ごとの出入口 [(a側のセル, b側のセル), ...]
+        self.borders: Dict[Tuple[Cluster, Cluster], List[Tuple[Cell, Cell]]] = {}
+        # クラスタごとのノード間距離 {ノード: {同じクラスタのノード: 距離}}
+        self.intra: Dict[Cluster, Dict[Cell, Dict[Cell, float]]] = {}
+        self._node_edges: Dict[Cell, Dict[Cell, float]] = {}  # intra をノードから直接引くための索引
+        # 境界をまたぐ辺 {ノード: [向かい側のノード, ...]} (距離は直進1セル)
+        self.inter: Dict[Cell, List[Cell]] = {}
+
+        clusters = [(cr, cc) for cr in range(self.cluster_shape[0]) for cc in range(self.cluster_shape[1])]
+        for a in clusters:
+            for b in self._forward_neighbours(a):
+                self.borders[(a, b)] = self._scan_border(a, b)
+        self._rebuild_inter()
+        for cluster in clusters:
+            self._build_intra(cluster)
+
+    # --- クラスタの幾何 ---
+
+    def cluster_of(self, cell: Cell) -> Cluster:
+        return cell[0] // self.cluster_size, cell[1] // self.cluster_size
+
+    def cluster_bounds(self, cluster: Cluster) -> Tuple[int, int, int, int]:
+        """クラスタのセル範囲 (r0, r1, c0, c1)。r1, c1 は含まない"""
+        rows, cols = self.grid.shape
+        r0, c0 = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return r0, min(r0 + self.cluster_size, rows), c0, min(c0 + self.cluster_size, cols)
+
+    def _forward_neighbours(self, cluster: Cluster) -> List[Cluster]:
+        """右と下の隣接クラスタ (境界を1回ずつ数えるため)"""
+        cr, cc = cluster
+        neighbours = []
+        if cc + 1 < self.cluster_shape[1]:
+            neighbours.append((cr, cc + 1))
+        if cr + 1 < self.cluster_shape[0]:
+            neighbours.append((cr + 1, cc))
+        return neighbours
+
+    def _borders_of(self, cluster: Cluster) -> List[Tuple[Cluster, Cluster]]:
+        cr, cc = cluster
+        borders = [(cluster, b) for b in self._forward_neighbours(cluster)]
+        if cc > 0:
+            borders.append(((cr, cc - 1), cluster))
+        if cr > 0:
+            borders.append(((cr - 1, cc), cluster))
+        return borders
+
+    # --- 抽象グラフの構築 ---
+
+    def _scan_border(self, a: Cluster, b: Cluster) -> List[Tuple[Cell, Cell]]:
+        """境界の両側が通行可能な区間を探し、区間ごとに出入口を置く"""
+        r0, r1, c0, c1 = self.cluster_bounds(a)
+        if b[1] > a[1]:
+            # 右隣: a の右端の列と b の左端の列
+            ca, cb = c1 - 1, c1
+            free = (self.grid[r0:r1, ca] == 0) & (self.grid[r0:r1, cb] == 0)
+            cells = lambda i: ((r0 + i, ca), (r0 + i, cb))
+        else:
+            # 下隣: a の下端の行と b の上端の行
+            ra, rb = r1 - 1, r1
+            free = (self.grid[ra, c0:c1] == 0) & (self.grid[rb, c0:c1] == 0)
+            cells = lambda i: ((ra, c0 + i), (rb, c0 + i))
+
+        edges = np.diff(np.concatenate([[0], free.astype(np.int8), [0]]))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        transitions = []
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            if e - s > ENTRANCE_SPACING:
+                positions = list(range(s, e - 1, ENTRANCE_SPACING)) + [e - 1]
+                transitions += [cells(i) for i in positions]
+            else:
+                transitions.append(cells((s + e - 1) // 2))
+        return transitions
+
+    def _rebuild_inter(self):
+        self.inter = {}
+        for transitions in self.borders.values():
+            for cell_a, cell_b in transitions:
+                self.inter.setdefault(cell_a, []).append(cell_b)
+                self.inter.setdefault(cell_b, []).append(cell_a)
+
+    def cluster_nodes(self, cluster: Cluster) -> List[Cell]:
+        nodes = []
+        for a, b in self._borders_of(cluster):
+            side = 0 if a == cluster else 1
+            nodes += [transition[side] for transition in self.borders[(a, b)]]
+        return list(dict.fromkeys(nodes))
+
+    def local_distances(self, cluster: Cluster, sources: List[Cell], initial: Optional[List[float]] = None) -> np.ndarray:
+        """クラスタ内だけを通る、始点群からの距離場 (セル単位, クラスタの部分グリッドの形状)"""
+        r0, r1, c0, c1 = self.cluster_bounds(cluster)
+        local = [(r - r0, c - c0) for r, c in sources]
+        return calculate_distance_field(self.grid[r0:r1, c0:c1], local, 1.0, initial)
+
+    def _build_intra(self, cluster: Cluster):
+        r0, r1, c0, c1 = self.cluster_bounds(cluster)
+        nodes = self.cluster_nodes(cluster)
+        for node in self.intra.get(cluster, {}):
+            self._node_edges.pop(node, None)
+        if not self.grid[r0:r1, c0:c1].any():
+            # 障害物のないクラスタでは8近傍の最短経路長は octile 距離そのもの
+            edges = {node: {other: octile_distance(node, other) for other in nodes if other != node} for node in nodes}
+        else:
+            edges = self._search_intra(cluster, nodes)
+        self.intra[cluster] = edges
+        self._node_edges.update(edges)
+
+    def _search_intra(self, cluster: Cluster, nodes: List[Cell]) -> Dict[Cell, Dict[Cell, float]]:
+        r0, _, c0, _ = self.cluster_bounds(cluster)
+        edges = {}
+        for node in nodes:
+            field = self.local_distances(cluster, [node])
+            edges[node] = {}
+            for other in nodes:
+                if other != node:
+                    d = field[other[0] - r0, other[1] - c0]
+                    if d != np.inf:
+                        edges[node][other] = float(d)
+        return edges
+
+    def update(self, regions: Iterable[Tuple[int, int, int, int]]):
+        """
+        グリッドの変化した範囲 (min_r, max_r, min_c, max_c) (両端を含む) の一覧を受け取り、
+        その範囲に接するクラスタの境界とノード間距離を作り直す。
+        """
+        rows, cols = self.grid.shape
+        touched: Set[Cluster] = set()
+        for min_r, max_r, min_c, max_c in regions:
+            # 境界の判定は隣のクラスタのセルも見るため、1セル広げる
+            cr0, cr1 = max(min_r - 1, 0) // self.cluster_size, min(max_r + 1, rows - 1) // self.cluster_size
+            cc0, cc1 = max(min_c - 1, 0) // self.cluster_size, min(max_c + 1, cols - 1) // self.cluster_size
+            touched.update((cr, cc) for cr in range(cr0, cr1 + 1) for cc in range(cc0, cc1 + 1))
+        if not touched:
+            return
+
+        rebuild = set(touched)
+        for cluster in touched:
+            for border in self._borders_of(cluster):
+                transitions = self._scan_border(*border)
+                if transitions != self.borders[border]:
+                    self.borders[border] = transitions
+                    rebuild.update(border)
+        self._rebuild_inter()
+        for cluster in rebuild:
+            self._build_intra(cluster)
+
+    # --- 探索 ---
+
+    def _attach(self, cell: Cell) -> Dict[Cell, float]:
+        """セルから同じクラスタ内のノードまでの距離 (通行できないセルなら空)"""
+        if self.grid[cell] != 0:
+            return {}
+        cluster = self.cluster_of(cell)
+        r0, _, c0, _ = self.cluster_bounds(cluster)
+        field = self.local_distances(cluster, [cell])
+        distances = {}
+        for node in self.cluster_nodes(cluster):
+            d = field[node[0] - r0, node[1] - c0]
+            if d != np.inf:
+                distances[node] = float(d)
+        return distances
+
+    def _neighbours(self, node: Cell) -> Iterable[Tuple[Cell, float]]:
+        yield from self._node_edges.get(node, {}).items()
+        for other in self.inter.get(node, ()):
+            yield other, 1.0
+
+    def node_distances(self, sources: List[Cell]) -> Dict[Cell, float]:
+        """始点群から全ノードまでの抽象グラフ上の距離 (セル単位)"""
+        dist: Dict[Cell, float] = {}
+        open_list = []
+        for source in sources:
+            for node, d in self._attach(source).items():
+                if d < dist.get(node, np.inf):
+                    dist[node] = d
+                    open_list.append((d, node))
+        heapq.heapify(open_list)
+        # 抽象グラフ全体をたどるため、_neighbours を使わずに展開する (呼び出しのコストを省く)
+        node_edges, inter, inf = self._node_edges, self.inter, math.inf
+        while open_list:
+            d, node = heapq.heappop(open_list)
+            if d > dist[node]:
+                continue
+            for other, cost in node_edges.get(node, {}).items():
+                new_d = d + cost
+                if new_d < dist.get(other, inf):
+                    dist[other] = new_d
+                    heapq.heappush(open_list, (new_d, other))
+            new_d = d + 1.0
+            for other in inter.get(node, ()):
+                if new_d < dist.get(other, inf):
+                    dist[other] = new_d
+                    heapq.heappush(open_list, (new_d, other))
+        return dist
+
+    def path_length(self, start: Cell, end: Cell) -> float:
+        """start から end までの経路長 (m)。抽象グラフ上をA*で探し、両端のクラスタ内だけを細かく探索する"""
+        if self.grid[start] != 0 or self.grid[end] != 0:
+            return np.inf
+        end_cluster = self.cluster_of(end)
+        to_end = self._attach(end)  # 終点のクラスタのノード → 終点 (距離は対称)
+
+        best = np.inf
+        if self.cluster_of(start) == end_cluster:
+            # 同じクラスタ内で完結する経路
+            r0, _, c0, _ = self.cluster_bounds(end_cluster)
+            best = float(self.local_distances(end_cluster, [start])[end[0] - r0, end[1] - c0])
+
+        dist: Dict[Cell, float] = {}
+        open_list = []
+        for node, d in self._attach(start).items():
+            dist[node] = d
+            open_list.append((d + octile_distance(node, end), d, node))
+        heapq.heapify(open_list)
+        while open_list:
+            f, d, node = heapq.heappop(open_list)
+            if f >= best:
+                break
+            if d > dist[node]:
+                continue
+            if node in to_end:
+                best = min(best, d + to_end[node])
+            for other, cost in self._neighbours(node):
+                new_d = d + cost
+                if new_d < dist.get(other, np.inf):
+                    dist[other] = new_d
+                    heapq.heappush(open_list, (new_d + octile_distance(other, end), new_d, other))
+        return best * self.resolution
+
+class HierarchicalDistanceField:
+    """
+    ドアなどの始点群からの距離場を、抽象グラフで近似して必要なクラスタの分だけ求める。
+    lookup_window_distance と同じ規約 (セル範囲の外周1マスまで) で参照する。
+    作成時点のグリッドを複製して使うため、その後にグリッドが変わっても値は変わらない (配列の距離場と同じ扱い)。
+    previous に作り直す前の距離場を渡すと、グリッドとノードの距離が変わっていないクラスタの距離場を使い回す。
+    """
+    def __init__(self, graph: ClusterGraph, sources: List[Cell], previous: Optional["HierarchicalDistanceField"] = None):
+        self.graph = graph
+        self.grid = graph.grid.copy()
+        self.sources = [s for s in sources if self.grid[s] == 0]
+        self.node_distances = graph.node_distances(self.sources)
+        self._cluster_fields: Dict[Cluster, Tuple[List[Tuple[Cell, float]], np.ndarray]] = {}
+        self._previous = previous
+        if previous is not None:
+            previous._previous = None  # 古い距離場を連鎖して保持しない
+
+    def cluster_field(self, cluster: Cluster) -> np.ndarray:
+        """クラスタ内の距離場 (m)。クラスタのノードを抽象グラフ上の距離から、始点を0から始めて広げる"""
+        cached = self._cluster_fields.get(cluster)
+        if cached is not None:
+            return cached[1]
+
+        seeds = [(node, self.node_distances[node]) for node in self.graph.cluster_nodes(cluster) if node in self.node_distances]
+        seeds += [(s, 0.0) for s in self.sources if self.graph.cluster_of(s) == cluster]
+        r0, r1, c0, c1 = self.graph.cluster_bounds(cluster)
+        previous = self._previous._cluster_fields.get(cluster) if self._previous is not None else None
+        if previous is not None and previous[0] == seeds and np.array_equal(self._previous.grid[r0:r1, c0:c1], self.grid[r0:r1, c0:c1]):
+            field = previous[1]
+        elif seeds:
+            cells, initial = zip(*seeds)
+            local = [(r - r0, c - c0) for r, c in cells]
+            field = calculate_distance_field(self.grid[r0:r1, c0:c1], local, 1.0, list(initial)) * self.graph.resolution
+        else:
+            field = np.full((r1 - r0, c1 - c0), np.inf)
+        self._cluster_fields[cluster] = (seeds, field)
+        return field
+
+    def window_min(self, min_y: int, max_y: int, min_x: int, max_x: int) -> float:
+        """セル範囲の外周1マス以内で最も近い通行可能セルまでの距離 (m)"""
+        rows, cols = self.grid.shape
+        r0, r1 = max(min_y - 1, 0), min(max_y + 1, rows - 1)
+        c0, c1 = max(min_x - 1, 0), min(max_x + 1, cols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.inf
+        size = self.graph.cluster_size
+        best = np.inf
+        for cr in range(r0 // size, r1 // size + 1):
+            for cc in range(c0 // size, c1 // size + 1):
+                cr0, cr1, cc0, cc1 = self.graph.cluster_bounds((cr, cc))
+                window = self.cluster_field((cr, cc))[max(r0, cr0) - cr0 : min(r1 + 1, cr1) - cr0,
+                                                      max(c0, cc0) - cc0 : min(c1 + 1, cc1) - cc0]
+                if window.size:
+                    best = min(best, float(window.min()))
+        return best
@@ -0,0 +1,208 @@
+import math
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from backend.models import Room
+from backend.scoring import RESOLUTION, rasterize_item
+from backend.batch_scoring import FurnitureSet
+from backend.rules import DIRECTIONS, CompiledClearance, get_rules
+
+# 配置可能マップ。
+# 他の家具の占有グリッドの累積和 (summed-area table) を作っておき、家具を4方向それぞれに置いたときに
+# 本体やクリアランス領域が他の家具・壁・他の家具のクリアランス領域に掛からない中心位置を、候補すべてについて一括で求める。
+# 矩形に含まれる占有セルの数は累積和の4隅から O(1) で求まるので、候補ごとに四隅の計算や重なり判定を行わずに済む。
+#
+# 候補の中心位置は、家具の左端・下端がセルの境界に揃う格子 (間隔 resolution) に取る。
+# こうすると家具の本体が占めるセルは rasterize_item と一致し、マップで置けるとした位置は
+# check_hard_constraints とクリアランス規則の判定でも (その家具に関しては) 違反にならない。
+
+EDGE_GAP = 1e-10  # 家具の端をセルの境界からずらす量 (m)。三角関数の誤差で壁の外に出ないようにする
+CELL_EPS = 1e-9  # 矩形がセルとこれ以下しか重ならないときは、そのセルに掛からないとみなす (rasterize_item と同じ)
+
+def summed_area_table(grid: np.ndarray) -> np.ndarray:
+    """grid (rows, cols) の累積和 (rows + 1, cols + 1)。先頭の行と列は0"""
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(grid, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    return table
+
+def box_counts(table: np.ndarray, x0: np.ndarray, x1: np.ndarray, y0: np.ndarray, y1: np.ndarray,
+               resolution: float = RESOLUTION) -> np.ndarray:
+    """
+    矩形 [x0, x1] × [y0, y1] (m) と重なるセルのうち、値が立っているセルの数。
+    x0, x1 は (nx,)、y0, y1 は (ny,) の配列で、結果は全組み合わせの (ny, nx)。グリッドの外の部分は数えない。
+    """
+    rows, cols = table.shape[0] - 1, table.shape[1] - 1
+    c0 = np.minimum(np.maximum(np.floor((x0 + CELL_EPS) / resolution).astype(int), 0), cols)
+    c1 = np.minimum(np.maximum(np.ceil((x1 - CELL_EPS) / resolution).astype(int), c0), cols)
+    r0 = np.minimum(np.maximum(np.floor((y0 + CELL_EPS) / resolution).astype(int), 0), rows)[:, None]
+    r1 = np.minimum(np.maximum(np.ceil((y1 - CELL_EPS) / resolution).astype(int)[:, None], r0), rows)
+    # 平坦化した番号で4隅を引く (2次元の添字で引くより速い)
+    stride = cols + 1
+    r0, r1 = r0 * stride, r1 * stride
+    flat = table.ravel()
+    return flat.take(r1 + c1) - flat.take(r0 + c1) - flat.take(r1 + c0) + flat.take(r0 + c0)
+
+def _rotated_box(x0: float, x1: float, y0: float, y1: float, rotation: float) -> Tuple[float, float, float, float]:
+    """家具のローカル座標の矩形を、4方向のいずれかに回転したときの中心からの範囲 (x0, x1, y0, y1)"""
+    quarter = int(round(rotation / 90.0)) % 4
+    for _ in range(quarter):
+        # 90度回転: (x, y) -> (-y, x)
+        x0, x1, y0, y1 = -y1, -y0, x0, x1
+    return x0, x1, y0, y1
+
+class PlacementMap:
+    """
+    1つのレイアウトで家具 index だけを動かすときの配置可能マップ。
+    feasible[r] は rotations[r] の向きで中心を (xs[r][c], ys[r][j]) に置けるかを (ny, nx) の真偽で持つ。
+    occupied に他の家具の占有グリッドを渡すと、他の家具のラスタライズを省く。
+    """
+    def __init__(self, room: Room, furniture_set: FurnitureSet, pose: np.ndarray, index: int, rotations: Sequence[float],
+                 clearance: Optional[CompiledClearance] = None, occupied: Optional[np.ndarray] = None,
+                 resolution: float = RESOLUTION):
+        self.room = room
+        self.index = index
+        self.resolution = resolution
+        self.rotations = np.asarray(rotations, dtype=float)
+        clearance = clearance if clearance is not None else get_rules().compile(room, furniture_set, resolution)
+        rows, cols = clearance.shape
+
+        if occupied is None:
+            occupied = FootprintGrid(room, furniture_set, pose, resolution).without(index)
+        # 家具の本体が入ってはいけないセル: 他の家具、他の家具のクリアランス領域の標本点
+        # (この家具が入ってよい領域 (COMPANIONS) を除く)、対象となるドア・窓の領域
+        reserved = occupied.copy()
+        cells, outside = clearance.point_cells(pose)
+        reserved.ravel()[cells[clearance.blocks[clearance.point_owners, index + 1] & ~outside]] = True
+        applies = clearance.fixed_applies[clearance.fixed_cell_zones, index] if len(clearance.fixed_cells) else np.zeros(0, dtype=bool)
+        reserved.ravel()[clearance.fixed_cells[applies]] = True
+        # 自分のクリアランス領域に入ってよい家具 (デスクの前の椅子など) は、領域の判定では数えない
+        # (その家具が他の家具と重なっているセルも空きとみなすが、その配置には重なりの違反が残る)
+        companions = np.flatnonzero(~clearance.blocks[index, 1:])
+        companions = companions[companions != index]
+        if len(companions):
+            occupied = occupied.copy()
+            placed = furniture_set.to_placed_furniture(pose)
+            for j in companions:
+                r0, c0, mask = rasterize_item(placed[j], occupied.shape, resolution)
+                occupied[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] &= ~mask
+        occupied_table, reserved_table = summed_area_table(occupied), summed_area_table(reserved)
+
+        w, d = furniture_set.widths[index] / 2, furniture_set.depths[index] / 2
+        item_clearances = clearance.clearances[index]
+        self.xs: List[np.ndarray] = []
+        self.ys: List[np.ndarray] = []
+        feasible = []
+        for rotation in self.rotations:
+            bx0, bx1, by0, by1 = _rotated_box(-w, w, -d, d, rotation)
+            # 端が部屋に収まる範囲で、左端・下端がセルの境界に揃う中心位置
+            xs = np.arange(np.floor((room.width - (bx1 - bx0)) / resolution + 1e-6) + 1) * resolution - bx0 + EDGE_GAP
+            ys = np.arange(np.floor((room.depth - (by1 - by0)) / resolution + 1e-6) + 1) * resolution - by0 + EDGE_GAP
+            xs, ys = xs[xs + bx1 <= room.width], ys[ys + by1 <= room.depth]
+            ok = box_counts(reserved_table, xs + bx0, xs + bx1, ys + by0, ys + by1, resolution) == 0
+
+            # 自分のクリアランス領域: 部屋に収まり、他の家具が掛からないこと
+            for k, distance in enumerate(item_clearances):
+                if distance <= 0:
+                    continue
+                local = {
+                    'Front': (-w, w, d, d + distance),
+                    'Back': (-w, w, -d - distance, -d),
+                    'Left': (-w - distance, -w, -d, d),
+                    'Right': (w, w + distance, -d, d),
+                }[DIRECTIONS[k]]
+                zx0, zx1, zy0, zy1 = _rotated_box(*local, rotation)
+                inside = ((xs + zx0 >= 0) & (xs + zx1 <= room.width))[None, :] & ((ys + zy0 >= 0) & (ys + zy1 <= room.depth))[:, None]
+                ok &= inside & (box_counts(occupied_table, xs + zx0, xs + zx1, ys + zy0, ys + zy1, resolution) == 0)
+
+            self.xs.append(xs)
+            self.ys.append(ys)
+            feasible.append(ok)
+        self.feasible = feasible
+
+    def count(self) -> int:
+        return int(sum(ok.sum() for ok in self.feasible))
+
+    def candidates(self) -> np.ndarray:
+        """置ける姿勢 (x, y, rotation) をすべて並べた (K, 3)"""
+        poses = [np.zeros((0, 3))]
+        for rotation, xs, ys, ok in zip(self.rotations, self.xs, self.ys, self.feasible):
+            rows, cols = np.nonzero(ok)
+            poses.append(np.stack([xs[cols], ys[rows], np.full(len(rows), rotation)], axis=1))
+        return np.concatenate(poses)
+
+    def sample(self, rng: np.random.Generator) -> Optional[np.ndarray]:
+        """置ける姿勢から一様に1つ選ぶ。置ける位置がなければ None"""
+        counts = np.array([ok.sum() for ok in self.feasible])
+        if counts.sum() == 0:
+            return None
+        n = int(rng.integers(counts.sum()))
+        r = int(np.searchsorted(np.cumsum(counts), n, side='right'))
+        row, col = np.argwhere(self.feasible[r])[n - counts[:r].sum()]
+        return np.array([self.xs[r][col], self.ys[r][row], self.rotations[r]])
+
+    def nearest(self, x: float, y: float) -> Optional[np.ndarray]:
+        """(x, y) に最も近い置ける姿勢。置ける位置がなければ None"""
+        best, best_distance = None, np.inf
+        for rotation, xs, ys, ok in zip(self.rotations, self.xs, self.ys, self.feasible):
+            distance = np.where(ok, np.add.outer((ys - y) ** 2, (xs - x) ** 2), np.inf)
+            if distance.size == 0:
+                continue
+            row, col = np.unravel_index(np.argmin(distance), distance.shape)
+            if distance[row, col] < best_distance:
+                best, best_distance = np.array([xs[col], ys[row], rotation]), distance[row, col]
+        return best
+
+class FootprintGrid:
+    """
+    1レイアウトの家具ごとの占有セルと、セルごとの家具の数。
+    家具を1つずつ動かしながら配置可能マップを作る (突然変異・修復) ときに、他の家具を毎回ラスタライズし直さないために使う。
+    4方向に回転した家具は外接矩形がそのまま占有セルになるので、rasterize_item を使わずに求める。
+    """
+    def __init__(self, room: Room, furniture_set: FurnitureSet, pose: np.ndarray, resolution: float = RESOLUTION):
+        self.room = room
+        self.furniture_set = furniture_set
+        self.pose = pose
+        self.resolution = resolution
+        self.shape = (int(room.depth / resolution), int(room.width / resolution))
+        self.counts = np.zeros(self.shape, dtype=np.int16)
+        self.footprints = [self._footprint(i) for i in range(len(furniture_set))]
+        for footprint in self.footprints:
+            self._add(footprint, 1)
+
+    def _footprint(self, index: int) -> Tuple[int, int, np.ndarray]:
+        """家具 index の占有セル (開始行, 開始列, マスク)。rasterize_item と同じセルになる"""
+        x, y, rotation = (float(v) for v in self.pose[index])
+        quarter = rotation / 90.0
+        if abs(quarter - round(quarter)) > 1e-9:
+            return rasterize_item(self.furniture_set.to_placed_furniture(self.pose)[index], self.shape, self.resolution)
+        hx, hy = self.furniture_set.widths[index] / 2, self.furniture_set.depths[index] / 2
+        if round(quarter) % 2:
+            hx, hy = hy, hx
+        rows, cols = self.shape
+        res = self.resolution
+        c0 = min(max(math.floor((x - hx + CELL_EPS) / res), 0), cols)
+        c1 = min(max(math.ceil((x + hx - CELL_EPS) / res), c0), cols)
+        r0 = min(max(math.floor((y - hy + CELL_EPS) / res), 0), rows)
+        r1 = min(max(math.ceil((y + hy - CELL_EPS) / res), r0), rows)
+        return r0, c0, np.ones((r1 - r0, c1 - c0), dtype=bool)
+
+    def _add(self, footprint: Tuple[int, int, np.ndarray], sign: int):
+        r0, c0, mask = footprint
+        self.counts[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] += sign * mask
+
+    def without(self, index: int) -> np.ndarray:
+        """家具 index 以外の家具が占めるセル"""
+        r0, c0, mask = self.footprints[index]
+        counts = self.counts.copy()
+        counts[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] -= mask
+        return counts > 0
+
+    def placement_map(self, index: int, rotations: Sequence[float], clearance: Optional[CompiledClearance] = None) -> PlacementMap:
+        return PlacementMap(self.room, self.furniture_set, self.pose, index, rotations, clearance,
+                            occupied=self.without(index), resolution=self.resolution)
+
+    def move(self, index: int, spot: np.ndarray):
+        """家具 index を姿勢 spot (x, y, rotation) に動かす。pose をその場で書き換える"""
+        self.pose[index] = spot
+        self._add(self.footprints[index], -1)
+        self.footprints[index] = self._footprint(index)
+        self._add(self.footprints[index], 1)
@@ -0,0 +1,490 @@
+import math
+import logging
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from backend.models import Room, PlacedFurniture
+from backend.scoring import RESOLUTION, furniture_height, rasterize_item
+from backend.batch_scoring import FurnitureSet, encode_layout
+
+# 知見テーブル (知見テーブル.txt) のクリアランス規則によるハード制約 (制約条件の定義.txt)。
+# 規則は起動時に1回読み込み、家具セットごとに「家具のローカル座標でのクリアランス領域の標本点」に変換しておく。
+# 判定は、全家具の標本点を姿勢で一括変換し、家具番号を書いたラベルグリッドを引くだけで行う
+# (規則や家具の数だけ Python のループを回さない)。ドア・窓の前の領域は部屋ごとに固定のセル集合として持つ。
+# 判定はグリッドの解像度の範囲で行うため、領域の境界から1マス以内の家具は重なっているとみなすことがある。
+#
+# ハード制約 (違反すると is_valid が偽になる) として扱うのはドアの開閉スペースだけで、
+# 窓の前と家具ごとの人間工学的なスペースは違反1件ごとに CLEARANCE_PENALTY を引くソフト制約とする。
+# デスクの前の椅子のように一緒に使う家具 (COMPANIONS) は、その家具の領域に入っていてよい。
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ('Front', 'Back', 'Left', 'Right')  # 家具のローカル座標で +y, -y, -x, +x (get_furniture_facing_vector と同じ)
+DIRECTION_LABELS = {'Front': '前', 'Back': '後ろ', 'Left': '左', 'Right': '右'}
+DIRECTION_ALIASES = {
+    'front': 'Front', 'back': 'Back', 'left': 'Left', 'right': 'Right',
+    '前': 'Front', '前方': 'Front', '後': 'Back', '後ろ': 'Back', '後方': 'Back',
+    '左': 'Left', '左側': 'Left', '右': 'Right', '右側': 'Right',
+}
+ALL_DIRECTIONS = {'', 'all', 'around', '全方向', '周囲'}  # 4方向すべてに同じ距離を求める指定
+
+DOOR_CATEGORY = 'Door'  # 知見テーブルでドアの開閉スペースを表すカテゴリ
+WINDOW_CATEGORY = 'Window'  # 窓の前のスペース (窓台より高い家具だけが対象)
+WINDOW_SILL_HEIGHT = 0.9  # 窓台の高さ (m)。これより低い家具は窓の前に置いてよい
+SAMPLE_SPACING = 0.5  # クリアランス領域の標本点の間隔 (グリッドの解像度に対する比)
+CLEARANCE_PENALTY = 0.05  # ソフト制約 (窓の前・人間工学的なスペース) の違反1件あたりの減点 (総合点 0〜1 に対して)
+COMPANIONS = {'Desk': ('Chair',), 'Table': ('Chair',)}  # カテゴリ -> その家具の領域に入ってよいカテゴリ
+
+# 知見テーブルが空のときに使う規則
+DEFAULT_RULES = [
+    {"category": DOOR_CATEGORY, "clearance_type": "開閉スペース", "min_distance": 0.75, "direction": None,
+     "justification": "開き戸が開閉できるよう、扉の幅の範囲に家具を置かない"},
+    {"category": WINDOW_CATEGORY, "clearance_type": "開閉スペース", "min_distance": 0.3, "direction": None,
+     "justification": "窓の開閉と換気のため、腰高より高い家具で窓の前をふさがない"},
+    {"category": "Desk", "clearance_type": "人間工学", "min_distance": 0.6, "direction": "Front",
+     "justification": "椅子を引いて座るためのスペース"},
+    {"category": "Shelf", "clearance_type": "人間工学", "min_distance": 0.5, "direction": "Front",
+     "justification": "扉・引き出しの開閉と物の出し入れのスペース"},
+    {"category": "Sofa", "clearance_type": "人間工学", "min_distance": 0.3, "direction": "Front",
+     "justification": "座ったときの足元のスペース"},
+]
+
+def create_label_grid(room: Room, placed_furniture_list: List[PlacedFurniture],
+                      resolution: float = RESOLUTION, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    家具の番号 + 1 を書いた占有グリッド (int32, 0=空き)。重なっているセルには後の家具の番号が入る。
+    out に同じ形状の int32 配列を渡すと、新たに確保せずそこへ書き込む。
+    """
+    rows, cols = int(room.depth / resolution), int(room.width / resolution)
+    if out is None:
+        labels = np.zeros((rows, cols), dtype=np.int32)
+    else:
+        if out.shape != (rows, cols) or out.dtype != np.int32:
+            raise ValueError(f"out は形状 {(rows, cols)} の int32 配列である必要があります")
+        labels = out
+        labels.fill(0)
+    for i, item in enumerate(placed_furniture_list):
+        r0, c0, mask = rasterize_item(item, labels.shape, resolution)
+        window = labels[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]]
+        window[mask] = i + 1
+    return labels
+
+# --- 規則の読み込み ---
+
+class ClearanceRules:
+    """
+    知見テーブルの行 (category, clearance_type, min_distance, direction, justification) の集合。
+    同じカテゴリ・方向の規則が複数あれば、最も大きい距離だけを残す。
+    解釈できない行 (距離が数値でない・負、方向が不明など) はログに残して読み飛ばす (サーバーの起動を止めない)。
+    """
+    def __init__(self, rules: Iterable[Dict]):
+        self.rules: List[Dict] = []
+        self.item_clearances: Dict[str, np.ndarray] = {}  # カテゴリ -> 方向ごとの必要距離 (4,)
+        self.door_clearance = 0.0
+        self.window_clearance = 0.0
+        for rule in rules:
+            try:
+                category = str(rule["category"])
+                distance = float(rule["min_distance"])
+                if not math.isfinite(distance) or distance < 0:
+                    raise ValueError(f"距離 {rule['min_distance']} は0以上の数値である必要があります")
+                directions = self._parse_directions(rule.get("direction"))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("知見テーブルの規則を読み飛ばします: %s (%s)", rule, e)
+                continue
+            self.rules.append(rule)
+            if category == DOOR_CATEGORY:
+                self.door_clearance = max(self.door_clearance, distance)
+            elif category == WINDOW_CATEGORY:
+                self.window_clearance = max(self.window_clearance, distance)
+            else:
+                clearances = self.item_clearances.setdefault(category, np.zeros(len(DIRECTIONS)))
+                for direction in directions:
+                    k = DIRECTIONS.index(direction)
+                    clearances[k] = max(clearances[k], distance)
+
+    @staticmethod
+    def _parse_directions(direction: Optional[str]) -> Tuple[str, ...]:
+        key = str(direction or '').strip()
+        if key.lower() in ALL_DIRECTIONS:
+            return DIRECTIONS
+        if key.lower() in DIRECTION_ALIASES:
+            return (DIRECTION_ALIASES[key.lower()],)
+        raise ValueError(f"知見テーブルの方向 '{direction}' を解釈できません (Front/Back/Left/Right/All のいずれか)")
+
+    @classmethod
+    def from_storage(cls, storage) -> "ClearanceRules":
+        """知見テーブルから読み込む (空なら DEFAULT_RULES)"""
+        return cls(storage.list_knowledge() or DEFAULT_RULES)
+
+    def compile(self, room: Room, furniture_set: FurnitureSet, resolution: float = RESOLUTION) -> "CompiledClearance":
+        return CompiledClearance(self, room, furniture_set, resolution)
+
+    def check(self, room: Room, placed_furniture_list: List[PlacedFurniture],
+              resolution: float = RESOLUTION) -> Tuple[List[str], List[str], int]:
+        """
+        1レイアウトのクリアランス違反。
+        戻り値: (ハード制約の警告文, ソフト制約の警告文, 違反しているソフト制約の領域の数 (減点の件数))
+        """
+        if not placed_furniture_list:
+            return [], [], 0
+        compiled = self.compile(room, FurnitureSet(placed_furniture_list), resolution)
+        labels = create_label_grid(room, placed_furniture_list, resolution)
+        zones, blockers = compiled.evaluate(encode_layout(placed_furniture_list), labels)
+        hard, soft = compiled.warnings(zones, blockers)
+        return hard, soft, compiled.violations(zones)[1]
+
+# --- 家具セットごとに変換した規則 ---
+
+class CompiledClearance:
+    """
+    1つの部屋と家具セットに対して変換済みの規則。
+    家具のクリアランス領域は、家具のローカル座標での標本点 (K, 2) と、その領域の番号 (家具 × 4 + 方向) で持つ。
+    ドア・窓の領域は部屋のグリッド上の固定のセル (平坦化した番号) と、その領域の番号で持つ。
+    blocks[i, j + 1] は家具 j が家具 i の領域をふさぐか (自分自身と COMPANIONS の家具は偽、列0は空きセル)。
+    """
+    def __init__(self, rules: ClearanceRules, room: Room, furniture_set: FurnitureSet, resolution: float = RESOLUTION):
+        self.room = room
+        self.furniture_set = furniture_set
+        self.resolution = resolution
+        self.shape = (int(room.depth / resolution), int(room.width / resolution))
+        m = len(furniture_set)
+
+        # 家具ごと・方向ごとの必要距離 (M, 4)
+        self.clearances = np.array([rules.item_clearances.get(c, np.zeros(len(DIRECTIONS))) for c in furniture_set.categories],
+                                   dtype=float).reshape(m, len(DIRECTIONS))
+        self.points, self.point_zones = self._item_samples()
+        self.point_owners = self.point_zones // len(DIRECTIONS)
+        self.point_ranges = np.searchsorted(self.point_owners, np.arange(m + 1)).tolist()  # 家具ごとの標本点の範囲
+
+        # 家具 i の領域をふさぐ家具 j (ラベルグリッドの値 j + 1 で引けるよう、列0に空きセルの分を置く)
+        categories = furniture_set.categories
+        self.blocks = np.zeros((m, m + 1), dtype=bool)
+        for i in range(m):
+            companions = COMPANIONS.get(categories[i], ())
+            self.blocks[i, 1:] = [j != i and c not in companions for j, c in enumerate(categories)]
+        self.point_block_base = self.point_owners * (m + 1)  # 標本点ごとの blocks の行の先頭 (平坦化した番号)
+
+        # ドア・窓の前の領域 (部屋の中の半円)。窓の領域は窓台より高い家具だけが対象
+        tall = np.array([furniture_height(c, h) > WINDOW_SILL_HEIGHT for c, h in zip(furniture_set.categories, furniture_set.heights)],
+                        dtype=bool).reshape(m)
+        self.fixed_zones: List[Tuple[str, int, float]] = []  # (種類, 何番目のドア/窓か, 必要距離)
+        self.fixed_applies = np.zeros((0, m), dtype=bool)  # 領域ごとに対象となる家具
+        cells, zones, applies = [], [], []
+        for kind, positions, distance, targets in (('door', room.door_positions, rules.door_clearance, np.ones(m, dtype=bool)),
+                                                   ('window', room.window_positions, rules.window_clearance, tall)):
+            if distance <= 0:
+                continue
+            for n, position in enumerate(positions):
+                zone_cells = self._disc_cells(position, distance)
+                cells.append(zone_cells)
+                zones.append(np.full(len(zone_cells), len(self.fixed_zones)))
+                applies.append(targets)
+                self.fixed_zones.append((kind, n, distance))
+        self.fixed_cells = np.concatenate(cells) if cells else np.zeros(0, dtype=int)
+        self.fixed_cell_zones = np.concatenate(zones) if zones else np.zeros(0, dtype=int)
+        if applies:
+            self.fixed_applies = np.array(applies)
+        self.fixed_hard = np.array([kind == 'door' for kind, _, _ in self.fixed_zones], dtype=bool)  # ハード制約の領域
+
+    def _item_samples(self) -> Tuple[np.ndarray, np.ndarray]:
+        """クリアランス領域 (家具の辺に接する長方形) を間隔 SAMPLE_SPACING * resolution の標本点にする"""
+        step = SAMPLE_SPACING * self.resolution
+        points, zones = [np.zeros((0, 2))], [np.zeros(0, dtype=int)]
+        for i, k in zip(*np.nonzero(self.clearances > 0)):
+            w, d, c = self.furniture_set.widths[i] / 2, self.furniture_set.depths[i] / 2, self.clearances[i, k]
+            x0, x1, y0, y1 = {
+                'Front': (-w, w, d, d + c),
+                'Back': (-w, w, -d - c, -d),
+                'Left': (-w - c, -w, -d, d),
+                'Right': (w, w + c, -d, d),
+            }[DIRECTIONS[k]]
+            # 各小区画の中心を標本点にする (領域の境界上の点は隣の家具と接しているだけなので含めない)
+            nx, ny = max(math.ceil((x1 - x0) / step), 1), max(math.ceil((y1 - y0) / step), 1)
+            xs = x0 + (np.arange(nx) + 0.5) * (x1 - x0) / nx
+            ys = y0 + (np.arange(ny) + 0.5) * (y1 - y0) / ny
+            grid_x, grid_y = np.meshgrid(xs, ys)
+            points.append(np.stack([grid_x.ravel(), grid_y.ravel()], axis=1))
+            zones.append(np.full(grid_x.size, i * len(DIRECTIONS) + k))
+        return np.concatenate(points), np.concatenate(zones)
+
+    def _disc_cells(self, position: List[float], radius: float) -> np.ndarray:
+        """中心が position から radius 未満のセル (平坦化した番号)"""
+        rows, cols = self.shape
+        centers_y = (np.arange(rows) + 0.5) * self.resolution
+        centers_x = (np.arange(cols) + 0.5) * self.resolution
+        inside = np.add.outer((centers_y - position[1]) ** 2, (centers_x - position[0]) ** 2) < radius ** 2
+        return np.flatnonzero(inside)
+
+    # --- 判定 ---
+
+    def evaluate(self, pose: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        1レイアウトの姿勢 (M, 3) と create_label_grid のラベルグリッドから、違反を一括で判定する。
+        戻り値: (領域の番号, ふさいでいる家具の番号 (-1 は壁)) の組の配列。
+        家具の領域の番号は 家具 × 4 + 方向、ドア・窓の領域は -(fixed_zones の位置 + 1)。
+        """
+        return self.evaluate_points(*self.point_cells(pose), labels)
+
+    def point_cells(self, pose: np.ndarray, owner: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        家具の領域の標本点が落ちるセル (平坦化した番号) と、部屋の外に出ているか。
+        owner を指定するとその家具の標本点だけを計算する (標本点は家具の番号順に並んでいる)。
+        """
+        if owner is None:
+            points, owners = slice(None), self.point_owners
+        else:
+            # 1家具分なら姿勢は (1,) のまま標本点に掛ければよい
+            points, owners = self.owner_points(owner), slice(owner, owner + 1)
+        angle = np.deg2rad(pose[owners, 2])
+        cos_theta, sin_theta = np.cos(angle), np.sin(angle)
+        lx, ly = self.points[points, 0], self.points[points, 1]
+        wx = pose[owners, 0] + lx * cos_theta - ly * sin_theta
+        wy = pose[owners, 1] + lx * sin_theta + ly * cos_theta
+
+        rows, cols = self.shape
+        outside = (wx < 0) | (wx > self.room.width) | (wy < 0) | (wy > self.room.depth)
+        r = np.minimum(np.maximum((wy / self.resolution).astype(int), 0), rows - 1)
+        c = np.minimum(np.maximum((wx / self.resolution).astype(int), 0), cols - 1)
+        return r * cols + c, outside
+
+    def owner_points(self, owner: int) -> slice:
+        """家具 owner の領域の標本点の範囲"""
+        return slice(self.point_ranges[owner], self.point_ranges[owner + 1])
+
+    def evaluate_points(self, cells: np.ndarray, outside: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """point_cells の結果 (配置が変わっていない家具の分は使い回せる) で evaluate と同じ判定を行う"""
+        # 家具の領域: 標本点のセルのラベルを引く
+        found = labels.ravel()[cells]
+        blocked = outside | self.blocks.ravel()[self.point_block_base + found]
+        item_hits = (self.point_zones[blocked], np.where(outside, -1, found - 1)[blocked])
+
+        # ドア・窓の領域: 固定のセルのラベルを引き、対象の家具だけを残す
+        found = labels.ravel()[self.fixed_cells] - 1
+        zones = self.fixed_cell_zones
+        blocked = found >= 0
+        blocked[blocked] = self.fixed_applies[zones[blocked], found[blocked]]
+        fixed_hits = (-(zones[blocked] + 1), found[blocked])
+
+        # (領域, 家具) の組を1つの整数にして重複を除く
+        base = len(self.furniture_set) + 1
+        keys = np.unique(np.concatenate([item_hits[0] * base + item_hits[1] + 1, fixed_hits[0] * base + fixed_hits[1] + 1]))
+        zones, blockers = np.divmod(keys, base)
+        return zones, blockers - 1
+
+    def is_hard(self, zones: np.ndarray) -> np.ndarray:
+        """evaluate の領域の番号ごとに、ハード制約 (ドアの開閉スペース) の領域か"""
+        zones = np.asarray(zones, dtype=int)
+        hard = np.zeros(zones.shape, dtype=bool)
+        fixed = zones < 0
+        hard[fixed] = self.fixed_hard[-zones[fixed] - 1]
+        return hard
+
+    def violations(self, zones: np.ndarray) -> Tuple[int, int]:
+        """evaluate の結果から、違反している (ハード制約, ソフト制約) の領域の数"""
+        zones = np.unique(zones)
+        hard = int(np.count_nonzero(self.is_hard(zones)))
+        return hard, len(zones) - hard
+
+    def count(self, pose: np.ndarray, labels: np.ndarray) -> Tuple[int, int]:
+        """違反している (ハード制約, ソフト制約) の領域の数 (最適化の減点用)"""
+        zones, _ = self.evaluate(pose, labels)
+        return self.violations(zones)
+
+    def warnings(self, zones: np.ndarray, blockers: np.ndarray) -> Tuple[List[str], List[str]]:
+        """evaluate の結果の警告文 (ハード制約, ソフト制約)"""
+        names = self.furniture_set.names
+        hard, soft = [], []
+        for zone, blocker in zip(zones.tolist(), blockers.tolist()):
+            if zone < 0:
+                kind, n, distance = self.fixed_zones[-zone - 1]
+                if kind == 'door':
+                    hard.append(f"{names[blocker]}がドア{n + 1}の開閉スペース (半径{distance}m) に入っています。")
+                else:
+                    soft.append(f"{names[blocker]}が窓{n + 1}の前 ({distance}m以内) をふさいでいます。")
+            else:
+                i, k = divmod(zone, len(DIRECTIONS))
+                obstacle = "壁" if blocker < 0 else names[blocker]
+                soft.append(f"{names[i]}の{DIRECTION_LABELS[DIRECTIONS[k]]}に必要なスペース ({self.clearances[i, k]}m) を"
+                            f"{obstacle}がふさいでいます。")
+        return hard, soft
+
+# --- 差分更新 ---
+
+Footprint = Tuple[int, int, np.ndarray]
+
+class ClearanceState:
+    """
+    家具を1つずつ動かしながらクリアランス違反の数を差分更新する (IncrementalLayoutState 用)。
+    ラベルグリッド・標本点のセル・領域ごとのふさがれた標本点 (ドア・窓はセル) の数を保持し、家具が動いたときは
+    ラベルは元の位置と新しい位置の範囲だけ、標本点のセルはその家具の分だけ計算し直す。
+    判定はラベルを引き直すだけで済むので、結果が変わった標本点・セルの分だけ領域ごとの数を増減する
+    (ドア・窓のセルは、ラベルが変わった範囲がその領域に掛かるときだけ引き直す)。
+    違反の数 (hard / soft) と evaluate の結果は compile した規則で1レイアウトを判定した場合と一致する。
+    直前の移動は undo() で取り消せる。
+    """
+    def __init__(self, room: Room, furniture_set: FurnitureSet, pose: np.ndarray, footprints: List[Footprint],
+                 resolution: float = RESOLUTION, rules: Optional[ClearanceRules] = None):
+        self.room = room
+        self.resolution = resolution
+        self.rules = rules if rules is not None else get_rules()
+        self.rebuild(furniture_set, pose, footprints)
+
+    def rebuild(self, furniture_set: FurnitureSet, pose: np.ndarray, footprints: List[Footprint]):
+        """家具の構成が変わったとき (追加・削除) に規則を当てはめ直し、すべて判定し直す"""
+        self.clearance = compiled = self.rules.compile(self.room, furniture_set, self.resolution)
+        self.labels = np.zeros(compiled.shape, dtype=np.int32)
+        self.bounds = [self._bounds(f) for f in footprints]
+        for i, footprint in enumerate(footprints):
+            self._paint(i, self.bounds[i], footprint)
+        self.point_cells, self.point_outside = compiled.point_cells(pose)
+        # 家具の領域 (家具 × 4 + 方向) に続けてドア・窓の領域を並べ、領域ごとにふさがれた標本点・セルを数える
+        self.fixed_zone_index = len(furniture_set) * len(DIRECTIONS) + compiled.fixed_cell_zones
+        rows, cols = np.divmod(compiled.fixed_cells, compiled.shape[1])
+        self.fixed_bounds = [(rows[z].min(), rows[z].max(), cols[z].min(), cols[z].max())
+                             for z in (compiled.fixed_cell_zones == n for n in range(len(compiled.fixed_zones))) if z.any()]
+        self.zone_hits = [0] * (len(furniture_set) * len(DIRECTIONS) + len(compiled.fixed_zones))
+        self.zone_hard = [False] * (len(furniture_set) * len(DIRECTIONS)) + compiled.fixed_hard.tolist()
+        self.hard = self.soft = 0
+        self.point_blocked = self._points_blocked()
+        self.fixed_blocked = self._fixed_blocked()
+        self._add_hits(compiled.point_zones, self.point_blocked, np.zeros_like(self.point_blocked))
+        self._add_hits(self.fixed_zone_index, self.fixed_blocked, np.zeros_like(self.fixed_blocked))
+        self._undo = None
+
+    @staticmethod
+    def _bounds(footprint: Footprint) -> Tuple[int, int, int, int]:
+        r0, c0, mask = footprint
+        return r0, r0 + mask.shape[0] - 1, c0, c0 + mask.shape[1] - 1
+
+    def _paint(self, i: int, bounds: Tuple[int, int, int, int], footprint: Footprint):
+        """
+        家具 i の占有セルのうちセル範囲 (r1, c1 を含む) に入る分に i + 1 を書く。ただし後の家具の番号が入っているセルは
+        そのままにするので、どの順序で書いても create_label_grid と同じく重なったセルには後の家具の番号が入る。
+        """
+        fr0, fc0, mask = footprint
+        r0, r1, c0, c1 = bounds
+        top, bottom = max(r0, fr0), min(r1 + 1, fr0 + mask.shape[0])
+        left, right = max(c0, fc0), min(c1 + 1, fc0 + mask.shape[1])
+        if top >= bottom or left >= right:
+            return
+        window = self.labels[top:bottom, left:right]
+        window[mask[top - fr0 : bottom - fr0, left - fc0 : right - fc0] & (window < i + 1)] = i + 1
+
+    def _erase(self, k: int, bounds: Tuple[int, int, int, int], footprints: List[Footprint]):
+        """
+        セル範囲にある家具 k の番号を消し、その下に重なっていた家具の番号を書き戻す
+        (k の番号が入っていたセルに重なりうるのは、番号が k より前の家具だけ)
+        """
+        r0, r1, c0, c1 = bounds
+        window = self.labels[r0 : r1 + 1, c0 : c1 + 1]
+        erased = window == k + 1
+        if not erased.any():
+            return
+        window[erased] = 0
+        for i, (br0, br1, bc0, bc1) in enumerate(self.bounds[:k]):
+            if br0 <= r1 and br1 >= r0 and bc0 <= c1 and bc1 >= c0:
+                self._paint(i, bounds, footprints[i])
+
+    def _points_blocked(self) -> np.ndarray:
+        """標本点ごとに、壁の外か、持ち主の領域をふさぐ家具のセルに落ちているか"""
+        found = self.labels.ravel()[self.point_cells]
+        return self.point_outside | self.clearance.blocks.ravel()[self.clearance.point_block_base + found]
+
+    def _fixed_blocked(self) -> np.ndarray:
+        """ドア・窓の領域のセルごとに、その領域の対象の家具があるか"""
+        found = self.labels.ravel()[self.clearance.fixed_cells] - 1
+        blocked = found >= 0
+        blocked[blocked] = self.clearance.fixed_applies[self.clearance.fixed_cell_zones[blocked], found[blocked]]
+        return blocked
+
+    def _touches_fixed(self, bounds: Tuple[int, int, int, int]) -> bool:
+        """セル範囲がドア・窓の領域 (の外接矩形) に掛かるか"""
+        r0, r1, c0, c1 = bounds
+        return any(br0 <= r1 and br1 >= r0 and bc0 <= c1 and bc1 >= c0 for br0, br1, bc0, bc1 in self.fixed_bounds)
+
+    def hits(self) -> Tuple[np.ndarray, np.ndarray]:
+        """現在の配置での CompiledClearance.evaluate の結果 (警告文の作成用)"""
+        return self.clearance.evaluate_points(self.point_cells, self.point_outside, self.labels)
+
+    def move(self, k: int, pose: np.ndarray, footprints: List[Footprint]):
+        """家具 k が pose[k] (占有セルは footprints[k]) に動いた後に呼ぶ"""
+        compiled = self.clearance
+        old, new = self.bounds[k], self._bounds(footprints[k])
+        own = compiled.owner_points(k)
+        # 取り消し用に、書き換える前のラベルの範囲を保存する
+        saved = [(bounds, self.labels[bounds[0] : bounds[1] + 1, bounds[2] : bounds[3] + 1].copy())
+                 for bounds in (old, new) if bounds[0] <= bounds[1] and bounds[2] <= bounds[3]]
+        self._undo = (k, old, own, self.point_cells[own].copy(), self.point_outside[own].copy(), saved,
+                      self.point_blocked, self.fixed_blocked, list(self.zone_hits), self.hard, self.soft)
+
+        # ラベル: 元の位置の範囲から k を消し、新しい位置に書く
+        self.bounds[k] = new
+        self._erase(k, old, footprints)
+        self._paint(k, new, footprints[k])
+        # 標本点: 家具 k の分だけ計算し直す
+        if own.start < own.stop:
+            self.point_cells[own], self.point_outside[own] = compiled.point_cells(pose, k)
+
+        # 標本点の判定はラベルを引くだけなので全体を引き直し、変わった分だけ領域ごとの数を増減する
+        blocked = self._points_blocked()
+        self._add_hits(compiled.point_zones, blocked, self.point_blocked)
+        self.point_blocked = blocked
+        # ドア・窓の領域のセルは、ラベルが変わった範囲が掛かるときだけ引き直す
+        if self._touches_fixed(old) or self._touches_fixed(new):
+            blocked = self._fixed_blocked()
+            self._add_hits(self.fixed_zone_index, blocked, self.fixed_blocked)
+            self.fixed_blocked = blocked
+
+    def _add_hits(self, zones: np.ndarray, blocked: np.ndarray, previous: np.ndarray):
+        """
+        判定が変わった標本点・セルの分だけ領域ごとのふさがれた数を増減し、
+        違反している領域の数 (hard: ドアの開閉スペース, soft: それ以外) を更新する
+        """
+        changed = np.flatnonzero(blocked != previous)
+        if not len(changed):
+            return
+        hits, zone_hard = self.zone_hits, self.zone_hard
+        for zone, now in zip(zones[changed].tolist(), blocked[changed].tolist()):
+            before = hits[zone] > 0
+            hits[zone] += 1 if now else -1
+            if (hits[zone] > 0) != before:
+                # 0 と 1 以上の間を行き来したときだけ違反の数が変わる
+                delta = -1 if before else 1
+                if zone_hard[zone]:
+                    self.hard += delta
+                else:
+                    self.soft += delta
+
+    def undo(self):
+        """直前の move() を取り消す"""
+        if self._undo is None:
+            return
+        k, old, own, cells, outside, saved, point_blocked, fixed_blocked, zone_hits, hard, soft = self._undo
+        self.bounds[k] = old
+        for (r0, r1, c0, c1), labels in reversed(saved):
+            self.labels[r0 : r1 + 1, c0 : c1 + 1] = labels
+        self.point_cells[own], self.point_outside[own] = cells, outside
+        self.point_blocked, self.fixed_blocked, self.zone_hits = point_blocked, fixed_blocked, zone_hits
+        self.hard, self.soft = hard, soft
+        self._undo = None
+
+# --- 実行中のプロセスで使う規則 ---
+
+_active_rules: Optional[ClearanceRules] = None
+
+def get_rules() -> ClearanceRules:
+    """現在の規則 (load_rules / set_rules の前は DEFAULT_RULES)"""
+    global _active_rules
+    if _active_rules is None:
+        _active_rules = ClearanceRules(DEFAULT_RULES)
+    return _active_rules
+
+def set_rules(rules: ClearanceRules):
+    global _active_rules
+    _active_rules = rules
+
+def load_rules(storage) -> ClearanceRules:
+    """知見テーブルから規則を読み込んで現在の規則にする (プロセスプールのワーカーには get_process_pool が渡す)"""
+    rules = ClearanceRules.from_storage(storage)
+    set_rules(rules)
+    return rules
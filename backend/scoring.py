@@ -1,13 +1,27 @@
+import math
 import numpy as np
 import heapq
-from typing import List, Tuple
+from functools import lru_cache
+from typing import List, Optional, Tuple
 from backend.models import Room, PlacedFurniture
+from backend.collision import OVERLAP_TOLERANCE, furniture_corners, penetration_depths, find_overlaps
+from backend.instrumentation import count
 
-RESOLUTION = 0.1  # グリッドの解像度 (10cm/マス)
+RESOLUTION = 0.1  # グリッドの既定の解像度 (10cm/マス)。各関数の resolution 引数で変更できる
 DIAGONAL_COST = np.sqrt(2)
 
+# 高さが入力されていない家具のカテゴリごとの標準的な高さ (m)。一覧にないカテゴリは高い家具として扱う
+CATEGORY_HEIGHTS = {"Bed": 0.5, "Desk": 0.7, "Table": 0.7, "Sofa": 0.8, "Chair": 0.9, "Shelf": 1.8}
+UNKNOWN_HEIGHT = 2.0
+
 # --- ユーティリティ関数 ---
 
+def furniture_height(category: str, height: Optional[float]) -> float:
+    """家具の高さ (m)。未入力ならカテゴリの標準的な高さ"""
+    if height is not None:
+        return height
+    return CATEGORY_HEIGHTS.get(category, UNKNOWN_HEIGHT)
+
 def get_furniture_facing_vector(furniture: PlacedFurniture, face: str = 'Front') -> np.ndarray:
     """家具の指定された面の方向ベクトルを取得"""
     base_direction = np.array([0, 1])
@@ -41,11 +55,15 @@ def calculate_astar_path(grid: np.ndarray, start: Tuple[int, int], end: Tuple[in
     open_list = [(0.0, start_r, start_c)]
     g_cost = np.full((rows, cols), np.inf)
     g_cost[start_r, start_c] = 0.0
+    path_length = np.inf
+    expanded, pushes = 0, 1
     
     while open_list:
         f_cost, r, c = heapq.heappop(open_list)
+        expanded += 1
         if (r, c) == end:
-            return g_cost[r, c] * resolution
+            path_length = g_cost[r, c] * resolution
+            break
 
         for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
             nr, nc = r + dr, c + dc
@@ -56,81 +74,253 @@ def calculate_astar_path(grid: np.ndarray, start: Tuple[int, int], end: Tuple[in
             if new_g < g_cost[nr, nc]:
                 g_cost[nr, nc] = new_g
                 heapq.heappush(open_list, (new_g + heuristic((nr, nc), end), nr, nc))
-    return np.inf
+                pushes += 1
+
+    count("astar_nodes_expanded", expanded)
+    count("astar_heap_pushes", pushes)
+    return path_length
 
 # --- グリッド生成関数 ---
 
-def create_occupancy_grid(room: Room, placed_furniture_list: List[PlacedFurniture]) -> np.ndarray:
-    rows, cols = int(room.depth / RESOLUTION), int(room.width / RESOLUTION)
-    grid = np.zeros((rows, cols), dtype=int)
+def axis_aligned_extents(item: PlacedFurniture) -> Optional[Tuple[float, float]]:
+    """4方向 (回転が90度の倍数) の家具の外接矩形の x, y 方向の半分の長さ。それ以外の向きは None"""
+    if item.rotation % 90 != 0:
+        return None
+    return (item.width / 2, item.depth / 2) if item.rotation % 180 == 0 else (item.depth / 2, item.width / 2)
+
+@lru_cache(maxsize=1024)
+def _rotation_trig(rotation: float) -> Tuple[float, float]:
+    """get_corners と同じ cos, sin (回転の角度ごとに使い回す)"""
+    angle_rad = np.deg2rad(rotation)
+    return float(np.cos(angle_rad)), float(np.sin(angle_rad))
+
+def item_corners(item: PlacedFurniture) -> List[Tuple[float, float]]:
+    """get_corners と同じ値の四隅。numpy のスカラー演算を使わないので、1家具ずつ何度も呼ぶ処理で使う"""
+    w, d = item.width / 2, item.depth / 2
+    cos_theta, sin_theta = _rotation_trig(item.rotation)
+    return [(item.x + (lx * cos_theta - ly * sin_theta), item.y + (lx * sin_theta + ly * cos_theta))
+            for lx, ly in ((w, d), (-w, d), (-w, -d), (w, -d))]
+
+def item_extent(item: PlacedFurniture) -> Tuple[float, float, float, float]:
+    """
+    家具の外接矩形 (min_x, max_x, min_y, max_y)。get_corners の四隅の最小・最大と同じ値
+    (四隅の x は x ± w cos ± d sin なので、最大・最小は x ± (|w cos| + |d sin|) になる)
+    """
+    w, d = item.width / 2, item.depth / 2
+    cos_theta, sin_theta = _rotation_trig(item.rotation)
+    hx = abs(w * cos_theta) + abs(d * sin_theta)
+    hy = abs(w * sin_theta) + abs(d * cos_theta)
+    return item.x - hx, item.x + hx, item.y - hy, item.y + hy
+
+def item_cell_bounds(item: PlacedFurniture, shape: Tuple[int, int], resolution: float = RESOLUTION) -> Tuple[int, int, int, int]:
+    """家具の外接矩形が占めるセル範囲 (min_r, max_r, min_c, max_c) をグリッド内にクリップして取得"""
+    rows, cols = shape
+    x0, x1, y0, y1 = item_extent(item)
+    min_x = max(0, int(x0 / resolution))
+    max_x = min(cols - 1, int(x1 / resolution))
+    min_y = max(0, int(y0 / resolution))
+    max_y = min(rows - 1, int(y1 / resolution))
+    return min_y, max_y, min_x, max_x
+
+def rasterize_item(item: PlacedFurniture, shape: Tuple[int, int], resolution: float = RESOLUTION) -> Tuple[int, int, np.ndarray]:
+    """回転した家具と重なるセルを外接矩形の範囲内だけで判定し、(開始行, 開始列, マスク) として取得"""
+    min_y, max_y, min_x, max_x = item_cell_bounds(item, shape, resolution)
+    if max_y < min_y or max_x < min_x:
+        return min_y, min_x, np.zeros((0, 0), dtype=bool)
+    half = axis_aligned_extents(item)
+    if half is not None:
+        # 4方向の家具は外接矩形と重なるセルがそのまま占有セルになる (下の判定と同じ結果)
+        hx, hy = half
+        mask = np.zeros((max_y - min_y + 1, max_x - min_x + 1), dtype=bool)
+        r0 = max(math.floor((item.y - hy + 1e-9) / resolution), min_y)
+        r1 = min(math.ceil((item.y + hy - 1e-9) / resolution), max_y + 1)
+        c0 = max(math.floor((item.x - hx + 1e-9) / resolution), min_x)
+        c1 = min(math.ceil((item.x + hx - 1e-9) / resolution), max_x + 1)
+        mask[r0 - min_y : max(r1, r0) - min_y, c0 - min_x : max(c1, c0) - min_x] = True
+        return min_y, min_x, mask
+
+    # セル中心の家具中心からの相対座標
+    dx = (np.arange(min_x, max_x + 1) + 0.5) * resolution - item.x
+    dy = (np.arange(min_y, max_y + 1) + 0.5) * resolution - item.y
+    angle_rad = math.radians(item.rotation)
+    cos_theta, sin_theta = math.cos(angle_rad), math.sin(angle_rad)
+    abs_cos, abs_sin = abs(cos_theta), abs(sin_theta)
+
+    # 分離軸判定: セル (正方形) と家具 (回転した長方形) の投影が4つの軸すべてで重なるセルを占有とする
+    # 辺が接しているだけのセルは含めない
+    half_cell = resolution / 2 - 1e-9
+    reach = half_cell * (abs_cos + abs_sin)  # セルを家具の軸に投影したときの半径
+    along_width = np.abs(np.add.outer(dy * sin_theta, dx * cos_theta)) < item.width / 2 + reach
+    along_depth = np.abs(np.subtract.outer(dy * cos_theta, dx * sin_theta)) < item.depth / 2 + reach
+    within_x = np.abs(dx) < (item.width * abs_cos + item.depth * abs_sin) / 2 + half_cell
+    within_y = np.abs(dy) < (item.width * abs_sin + item.depth * abs_cos) / 2 + half_cell
+    along_width &= along_depth
+    along_width &= within_x
+    along_width &= within_y[:, None]
+    return min_y, min_x, along_width
+
+def create_occupancy_grid(room: Room, placed_furniture_list: List[PlacedFurniture],
+                          resolution: float = RESOLUTION, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    占有グリッド (uint8, 1=家具あり) を作成する。
+    out に同じ形状の uint8 配列を渡すと、新たに確保せずそこへ書き込む。
+    """
+    rows, cols = int(room.depth / resolution), int(room.width / resolution)
+    if out is None:
+        grid = np.zeros((rows, cols), dtype=np.uint8)
+    else:
+        if out.shape != (rows, cols) or out.dtype != np.uint8:
+            raise ValueError(f"out は形状 {(rows, cols)} の uint8 配列である必要があります")
+        grid = out
+        grid.fill(0)
+
+    footprint_cells = 0
     for item in placed_furniture_list:
-        corners = item.get_corners()
-        min_x = max(0, int(np.min([c[0] for c in corners]) / RESOLUTION))
-        max_x = min(cols - 1, int(np.max([c[0] for c in corners]) / RESOLUTION))
-        min_y = max(0, int(np.min([c[1] for c in corners]) / RESOLUTION))
-        max_y = min(rows - 1, int(np.max([c[1] for c in corners]) / RESOLUTION))
-        grid[min_y : max_y + 1, min_x : max_x + 1] = 1
+        r0, c0, mask = rasterize_item(item, grid.shape, resolution)
+        grid[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] |= mask
+        footprint_cells += mask.size
+
+    count("grid_cells", grid.size)
+    count("footprint_cells_tested", footprint_cells)
     return grid
 
+# --- 距離場 (複数始点ダイクストラ) ---
+
+def world_to_cell(pos: List[float], shape: Tuple[int, int], resolution: float = RESOLUTION) -> Tuple[int, int]:
+    """ワールド座標 (x, y) をセル (row, col) に変換 (壁上の点もグリッド内に収める)"""
+    rows, cols = shape
+    r = min(max(int(pos[1] / resolution), 0), rows - 1)
+    c = min(max(int(pos[0] / resolution), 0), cols - 1)
+    return r, c
+
+def calculate_distance_field(grid: np.ndarray, sources: List[Tuple[int, int]], resolution: float = RESOLUTION,
+                             initial_distances: Optional[List[float]] = None) -> np.ndarray:
+    """
+    全ての始点からの最短経路長 (m) を全セルについて一度に計算する (8近傍, A*と同じ斜め移動コスト)。
+    initial_distances を渡すと、各始点をその距離 (セル単位) から始める。
+    """
+    rows, cols = grid.shape
+    # 外周を障害物で囲み、範囲チェックなしで隣接セルを参照できるようにする
+    stride = cols + 2
+    free = np.zeros((rows + 2, cols + 2), dtype=bool)
+    free[1:-1, 1:-1] = grid == 0
+    free_flat = free.ravel().tolist()
+    dist = [np.inf] * len(free_flat)
+
+    open_list = []
+    for k, (r, c) in enumerate(sources):
+        if not (0 <= r < rows and 0 <= c < cols):
+            continue
+        idx = (r + 1) * stride + (c + 1)
+        d0 = initial_distances[k] if initial_distances is not None else 0.0
+        if free_flat[idx] and dist[idx] > d0:
+            dist[idx] = d0
+            open_list.append((d0, idx))
+    heapq.heapify(open_list)
+
+    steps = [(dr * stride + dc, DIAGONAL_COST if dr != 0 and dc != 0 else 1.0)
+             for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]]
+    heappop, heappush = heapq.heappop, heapq.heappush
+    stale = 0  # 既により短い距離で確定していたため読み飛ばした要素の数
+    while open_list:
+        d, idx = heappop(open_list)
+        if d > dist[idx]:
+            stale += 1
+            continue
+        for offset, move_cost in steps:
+            n = idx + offset
+            if not free_flat[n]:
+                continue
+            new_d = d + move_cost
+            if new_d < dist[n]:
+                dist[n] = new_d
+                heappush(open_list, (new_d, n))
+
+    field = np.array(dist).reshape(rows + 2, cols + 2)[1:-1, 1:-1] * resolution
+    # 展開したノード数は到達できたセル数に等しく、ヒープへの追加回数はそれに読み飛ばした数を足したもの
+    # (ループ内で毎回数えるより安い)
+    expanded = int(np.isfinite(field).sum())
+    count("distance_field_nodes_expanded", expanded)
+    count("distance_field_heap_pushes", expanded + stale)
+    return field
+
+def door_cells(room: Room, shape: Tuple[int, int], resolution: float = RESOLUTION) -> List[Tuple[int, int]]:
+    """ドアの位置のセル"""
+    return [world_to_cell(d_pos, shape, resolution) for d_pos in room.door_positions]
+
+def create_door_distance_field(room: Room, grid: np.ndarray, resolution: float = RESOLUTION) -> np.ndarray:
+    """全てのドアを始点とした距離場を作成"""
+    return calculate_distance_field(grid, door_cells(room, grid.shape, resolution), resolution)
+
+def lookup_window_distance(distance_field: np.ndarray, min_y: int, max_y: int, min_x: int, max_x: int) -> float:
+    """セル範囲の外周1マス以内で最も近い通行可能セルまでの距離 (m) を距離場から取得"""
+    window = distance_field[max(min_y - 1, 0) : max_y + 2, max(min_x - 1, 0) : max_x + 2]
+    return float(window.min()) if window.size else np.inf
+
+def lookup_item_distance(distance_field: np.ndarray, item: PlacedFurniture, resolution: float = RESOLUTION) -> float:
+    """家具の外周1マス以内で最も近い通行可能セルまでの距離 (m) を距離場から取得"""
+    return lookup_window_distance(distance_field, *item_cell_bounds(item, distance_field.shape, resolution))
+
 # --- スコアリング関数 ---
 
-def score_circulation(room: Room, placed_furniture_list: List[PlacedFurniture], grid: np.ndarray) -> float:
+def score_circulation(room: Room, placed_furniture_list: List[PlacedFurniture], grid: np.ndarray,
+                      distance_field: Optional[np.ndarray] = None, resolution: float = RESOLUTION) -> float:
     target_items = [f for f in placed_furniture_list if f.category in ['Bed', 'Desk', 'Sofa']]
+    if not target_items:
+        return 0.5
+
+    # ドアからの距離場は1回だけ計算し、各家具は参照のみで評価する
+    if distance_field is None:
+        distance_field = create_door_distance_field(room, grid, resolution)
+
     scores = []
-    
+    max_len = room.width + room.depth + 1.0
     for item in target_items:
-        best_path = np.inf
-        for d_pos in room.door_positions:
-            start = (int(d_pos[1] / RESOLUTION), int(d_pos[0] / RESOLUTION))
-            end = (int(item.y / RESOLUTION), int(item.x / RESOLUTION))
-            path_len = calculate_astar_path(grid, start, end)
-            best_path = min(best_path, path_len)
-        
+        best_path = lookup_item_distance(distance_field, item, resolution)
         if best_path != np.inf:
-            max_len = room.width + room.depth + 1.0
             scores.append(1.0 - np.clip(best_path / max_len, 0.0, 1.0))
 
     return float(np.mean(scores)) if scores else 0.5
 
-def score_aesthetics(room: Room, placed_furniture_list: List[PlacedFurniture]) -> float:
-    scores = []
+def score_desk_aesthetics(room: Room, desk: PlacedFurniture) -> float:
+    """デスク評価 (窓に対して横向き、ドアを背にしない)"""
+    desk_pos = np.array([desk.x, desk.y])
+    facing = get_furniture_facing_vector(desk, 'Front')
+
+    # 最も条件の良い窓を探す
+    win_score = 0.0
+    for w_pos in room.window_positions:
+        w_dir = desk_pos - np.array(w_pos)
+        norm = (np.linalg.norm(facing) * np.linalg.norm(w_dir))
+        dot = np.dot(facing, w_dir) / norm if norm != 0 else 0
+        win_score = max(win_score, 1.0 - abs(dot))
+
+    # 最も条件の良いドアを探す (背後が壁=ドアから遠い/向きが逆)
+    wall_score = 0.0
+    for d_pos in room.door_positions:
+        d_dir = np.array(d_pos) - desk_pos
+        d_dir_u = d_dir / np.linalg.norm(d_dir) if np.linalg.norm(d_dir) != 0 else np.array([0,1])
+        wall_score = max(wall_score, 1.0 - abs(np.dot(facing, d_dir_u)))
+
+    return 0.5 * win_score + 0.5 * wall_score
+
+def score_bed_aesthetics(room: Room, bed: PlacedFurniture) -> float:
+    """ベッド評価 (コマンドポジション: ドアが見えるが直線上ではない)"""
+    bed_pos = np.array([bed.x, bed.y])
+    # 頭の位置（正面の逆）がドアの方を向いているか
+    facing_back = -get_furniture_facing_vector(bed, 'Front') 
     
-    # デスク評価
-    for desk in [f for f in placed_furniture_list if f.category == 'Desk']:
-        desk_pos = np.array([desk.x, desk.y])
-        facing = get_furniture_facing_vector(desk, 'Front')
-
-        # 最も条件の良い窓を探す
-        win_score = 0.0
-        for w_pos in room.window_positions:
-            w_dir = desk_pos - np.array(w_pos)
-            norm = (np.linalg.norm(facing) * np.linalg.norm(w_dir))
-            dot = np.dot(facing, w_dir) / norm if norm != 0 else 0
-            win_score = max(win_score, 1.0 - abs(dot))
-
-        # 最も条件の良いドアを探す (背後が壁=ドアから遠い/向きが逆)
-        wall_score = 0.0
-        for d_pos in room.door_positions:
-            d_dir = np.array(d_pos) - desk_pos
-            d_dir_u = d_dir / np.linalg.norm(d_dir) if np.linalg.norm(d_dir) != 0 else np.array([0,1])
-            wall_score = max(wall_score, 1.0 - abs(np.dot(facing, d_dir_u)))
-
-        scores.append(0.5 * win_score + 0.5 * wall_score)
-        
-    # ベッド評価 (コマンドポジション: ドアが見えるが直線上ではない)
-    for bed in [f for f in placed_furniture_list if f.category == 'Bed']:
-        bed_pos = np.array([bed.x, bed.y])
-        # 頭の位置（正面の逆）がドアの方を向いているか
-        facing_back = -get_furniture_facing_vector(bed, 'Front') 
-        
-        best_bed_score = 0.0
-        for d_pos in room.door_positions:
-            d_vec = np.array(d_pos) - bed_pos
-            d_vec_u = d_vec / np.linalg.norm(d_vec) if np.linalg.norm(d_vec) != 0 else np.array([0, 1])
-            dot = np.dot(facing_back, d_vec_u)
-            best_bed_score = max(best_bed_score, 1.0 if dot > 0.7 else 0.5)
-        scores.append(best_bed_score)
-            
+    best_bed_score = 0.0
+    for d_pos in room.door_positions:
+        d_vec = np.array(d_pos) - bed_pos
+        d_vec_u = d_vec / np.linalg.norm(d_vec) if np.linalg.norm(d_vec) != 0 else np.array([0, 1])
+        dot = np.dot(facing_back, d_vec_u)
+        best_bed_score = max(best_bed_score, 1.0 if dot > 0.7 else 0.5)
+    return best_bed_score
+
+def score_aesthetics(room: Room, placed_furniture_list: List[PlacedFurniture]) -> float:
+    scores = [score_desk_aesthetics(room, f) for f in placed_furniture_list if f.category == 'Desk']
+    scores += [score_bed_aesthetics(room, f) for f in placed_furniture_list if f.category == 'Bed']
     return float(np.mean(scores)) if scores else 0.5
 
 def score_zoning(placed_furniture_list: List[PlacedFurniture]) -> float:
@@ -141,18 +331,31 @@ def score_zoning(placed_furniture_list: List[PlacedFurniture]) -> float:
     min_dist = np.min([np.linalg.norm(np.array([b.x, b.y]) - np.array([d.x, d.y])) for b in beds for d in desks])
     return float(np.clip(min_dist / 2.0, 0.0, 1.0))
 
+def weighted_total(circulation, zoning, aesthetics):
+    """総合点 (重み付け)。/api/diagnose_layout と最適化で共通の重み。スカラーでも配列でもよい (採光は含めず、詳細として別に返す)"""
+    return (circulation * 0.4) + (zoning * 0.3) + (aesthetics * 0.3)
+
+def is_inside_room(room: Room, item: PlacedFurniture) -> bool:
+    x0, x1, y0, y1 = item_extent(item)
+    return 0 <= x0 and x1 <= room.width and 0 <= y0 and y1 <= room.depth
+
+def furniture_overlap(item: PlacedFurniture, other: PlacedFurniture) -> bool:
+    """2つの家具 (回転した長方形) が重なっているか"""
+    corners = furniture_corners([item, other])
+    return bool(penetration_depths(corners[0], corners[1]) > OVERLAP_TOLERANCE)
+
 def check_hard_constraints(room: Room, placed_furniture_list: List[PlacedFurniture]) -> Tuple[bool, List[str]]:
     warnings, is_valid = [], True
+    # 重なりは候補ペアを絞り込んでから分離軸判定で調べる
+    overlaps = {}
+    for pair in find_overlaps(furniture_corners(placed_furniture_list)):
+        overlaps.setdefault(pair.i, []).append(pair.j)
+
     for i, item in enumerate(placed_furniture_list):
-        for x, y in item.get_corners():
-            if not (0 <= x <= room.width and 0 <= y <= room.depth):
-                warnings.append(f"{item.name}が部屋からはみ出しています。")
-                is_valid = False
-                break
-        for j, other in enumerate(placed_furniture_list):
-            if i >= j: continue
-            dist = np.linalg.norm(np.array([item.x, item.y]) - np.array([other.x, other.y]))
-            if dist < (item.width + item.depth + other.width + other.depth) / 4:
-                warnings.append(f"{item.name}と{other.name}が重なっています。")
-                is_valid = False
+        if not is_inside_room(room, item):
+            warnings.append(f"{item.name}が部屋からはみ出しています。")
+            is_valid = False
+        for j in overlaps.get(i, []):
+            warnings.append(f"{item.name}と{placed_furniture_list[j].name}が重なっています。")
+            is_valid = False
     return is_valid, warnings
\ No newline at end of file
@@ -0,0 +1,206 @@
+import math
+import time
+import uuid
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from backend.models import RoomInput, PlacedFurnitureInput, PlacedFurniture, SessionOperation
+from backend.diagnosis import build_room
+from backend.annealing import IncrementalLayoutState
+from backend.live import summarize_state, diagnose_state
+from backend.optimizer import suggest_spots
+
+# サーバー側で保持するレイアウトセッション。
+# 部屋と家具を一度だけ送ってもらい、以降は家具の移動・回転・追加・削除の差分だけを受け取る。
+# 占有グリッド・重なり表・家具ごとの点数・クリアランス用のラベルグリッドを保持し、差分が影響する部分だけを更新する。
+# ドアからの距離場の作り直しは応答の後に行い (refresh)、次の差分までに最新にしておく。
+
+SESSION_TTL = 600.0  # 最後の操作からこの時間 (秒) が過ぎたセッションは破棄する
+SESSION_MEMORY_LIMIT = 256 * 1024 * 1024  # 全セッションの推定メモリ使用量の上限 (バイト)。超えたら使われていない順に破棄する
+HIERARCHICAL_FIELD_BYTES = 60  # 階層的な距離場 (広い間取り) のセルあたりのおおよそのバイト数 (グリッドの複製・クラスタのグラフと距離場)
+ITEM_OVERHEAD = 2048  # 家具1つあたりの配列以外の保持分 (家具のオブジェクト・各種リスト・クリアランスの区域) のおおよそのバイト数
+
+class LayoutSession:
+    """1つのレイアウトの採点状態。操作は lock を取ってから行う"""
+    def __init__(self, session_id: str, room_input: RoomInput, furniture_inputs: List[PlacedFurnitureInput]):
+        self.id = session_id
+        # クリアランス用のラベルグリッドと標本点のセルはレイアウト状態 (ClearanceState) が差分更新する
+        self.state = IncrementalLayoutState(build_room(room_input), [PlacedFurniture(f) for f in furniture_inputs])
+        self.version = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.memory = self.estimate_memory()
+
+    # --- 差分の適用 ---
+
+    def _validate(self, ops: List[SessionOperation]):
+        """
+        差分を順に適用したときに家具の番号と値が有効かを先に確かめる (途中まで適用されるのを防ぐ)。
+        NaN や無限大の座標はグリッドのセルに変換できず、適用の途中で失敗するため先に断る。
+        """
+        count = len(self.state.items)
+        for n, op in enumerate(ops):
+            if op.op == "add":
+                if op.item is None:
+                    raise ValueError(f"ops[{n}]: add には item が必要です。")
+                item = op.item
+                if not all(math.isfinite(v) for v in (item.width, item.depth, item.x, item.y, item.rotation)) \
+                        or item.width <= 0 or item.depth <= 0:
+                    raise ValueError(f"ops[{n}]: 家具の寸法は正の値、位置と角度は有限の値である必要があります。")
+                count += 1
+                continue
+            if op.index is None or not 0 <= op.index < count:
+                raise ValueError(f"ops[{n}]: 家具の番号 {op.index} が範囲外です (0〜{count - 1})。")
+            if op.op == "move" and not all(math.isfinite(v) for v in (op.x, op.y, op.rotation) if v is not None):
+                raise ValueError(f"ops[{n}]: 位置と角度は有限の値である必要があります。")
+            if op.op == "remove":
+                count -= 1
+
+    def apply(self, ops: List[SessionOperation]):
+        """差分を順に適用する。不正な差分が1つでもあれば ValueError で、何も適用しない"""
+        self._validate(ops)
+        state = self.state
+        for op in ops:
+            if op.op == "move":
+                k = op.index
+                x, y, rotation = (float(v) for v in state.poses[k])
+                x = x if op.x is None else op.x
+                y = y if op.y is None else op.y
+                rotation = rotation if op.rotation is None else op.rotation
+                if (x, y, rotation) == tuple(state.poses[k]):
+                    continue
+                state.move(k, x, y, rotation)
+                state.commit()
+            elif op.op == "add":
+                state.add(PlacedFurniture(op.item))
+            else:
+                state.remove(op.index)
+        if any(op.op != "move" for op in ops):
+            self.memory = self.estimate_memory()
+        self.version += 1
+
+    def refresh(self):
+        """前回の作り直し以降にグリッドが変わっていれば、ドアからの距離場を作り直す"""
+        if self.state.pending_grid_changes:
+            self.state.refresh_distance_field()
+
+    # --- 結果 ---
+
+    def summary(self) -> Dict:
+        return {"id": self.id, "version": self.version, **summarize_state(self.state)}
+
+    def layout(self) -> List[Dict]:
+        return [
+            {"name": f.name, "category": f.category, "width": f.width, "depth": f.depth, "height": f.height,
+             "x": f.x, "y": f.y, "rotation": f.rotation}
+            for f in self.state.items
+        ]
+
+    def diagnose(self) -> Dict:
+        self.refresh()
+        return diagnose_state(self.state)
+
+    def suggest_spots(self, index: int, num_spots: int = 5) -> List[Dict]:
+        """家具 index の置き場所の候補。保持している占有グリッドから配置可能マップを作る"""
+        if not 0 <= index < len(self.state.items):
+            raise ValueError(f"家具の番号 {index} が範囲外です (0〜{len(self.state.items) - 1})。")
+        r0, c0, mask = self.state.footprints[index]
+        occupied = self.state.coverage.astype(np.int32)
+        occupied[r0 : r0 + mask.shape[0], c0 : c0 + mask.shape[1]] -= mask
+        return suggest_spots(self.state.room, self.state.furniture_set, self.state.poses, index, num_spots,
+                             self.state.clearance_state.clearance, occupied > 0)
+
+    def estimate_memory(self) -> int:
+        """
+        保持している配列の合計バイト数に、家具ごとの Python オブジェクトの分を足した推定値
+        (部屋ごとに共有する採光の光線情報は含めない)
+        """
+        state = self.state
+        clearance_state = state.clearance_state
+        total = _array_bytes(state, clearance_state, clearance_state.clearance, state.daylight_state, state.furniture_set)
+        if not isinstance(state.distance_field, np.ndarray):
+            total += state.coverage.size * HIERARCHICAL_FIELD_BYTES
+        return int(total + ITEM_OVERHEAD * len(state.items))
+
+def _array_bytes(*objects) -> int:
+    """
+    オブジェクトの属性が持つ配列 (リスト・辞書の要素と、占有セル (r0, c0, mask) の mask を含む) の合計バイト数。
+    ビューは元の配列の大きさで1回だけ数える
+    """
+    seen, total = set(), 0
+    for obj in filter(None, objects):
+        for value in vars(obj).values():
+            values = value.values() if isinstance(value, dict) else value if isinstance(value, list) else (value,)
+            for v in values:
+                if isinstance(v, tuple) and len(v) == 3 and isinstance(v[2], np.ndarray):
+                    v = v[2]
+                if not isinstance(v, np.ndarray):
+                    continue
+                if isinstance(v.base, np.ndarray):
+                    v = v.base
+                if id(v) not in seen:
+                    seen.add(id(v))
+                    total += v.nbytes
+    return total
+
+class SessionStore:
+    """
+    セッションを使われた順に保持する。最後の操作から ttl 秒が過ぎたものと、
+    推定メモリ使用量の合計が memory_limit を超えた分 (最も長く使われていないものから) を破棄する。
+    """
+    def __init__(self, ttl: float = SESSION_TTL, memory_limit: int = SESSION_MEMORY_LIMIT):
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        self.sessions: "OrderedDict[str, LayoutSession]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+            self.expired += 1
+        # 作成したばかりのセッション (末尾) は残す
+        while len(self.sessions) > 1 and self.memory() > self.memory_limit:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+
+    def memory(self) -> int:
+        return sum(s.memory for s in self.sessions.values())
+
+    def create(self, room_input: RoomInput, furniture_inputs: List[PlacedFurnitureInput]) -> LayoutSession:
+        # 状態の構築はロックの外で行う (他のセッションの操作を待たせない)
+        session = LayoutSession(uuid.uuid4().hex, room_input, furniture_inputs)
+        with self._lock:
+            self.sessions[session.id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[LayoutSession]:
+        """セッションを取り出し、最近使ったものとして記録する。期限切れ・破棄済みなら None"""
+        with self._lock:
+            self._evict()
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "memory_bytes": self.memory(),
+                "memory_limit": self.memory_limit,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
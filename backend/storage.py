@@ -0,0 +1,229 @@
+import json
+import sqlite3
+import threading
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 部屋・家具・レイアウト案・知見の永続化 (SQLite)。
+# テーブル定義は 部屋情報テーブル.txt / 家具情報テーブル.txt / レイアウト案テーブル.txt / 知見テーブル.txt に従う。
+# WALモードで開くため、書き込み中も読み取りは待たされない。接続はスレッドごとに1つ持つ。
+
+DEFAULT_DB_PATH = "layout_advisor.db"
+WRITE_BATCH_SIZE = 1000  # 一括書き込みで1トランザクションにまとめる行数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    name TEXT,
+    width REAL NOT NULL,
+    depth REAL NOT NULL,
+    height REAL,
+    door_position TEXT NOT NULL DEFAULT '[]',   -- JSON: [[x, y], ...]
+    window_position TEXT NOT NULL DEFAULT '[]'  -- JSON: [[x, y], ...]
+);
+CREATE INDEX IF NOT EXISTS idx_rooms_user_id ON rooms (user_id);
+
+CREATE TABLE IF NOT EXISTS furniture (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    width REAL NOT NULL,
+    depth REAL NOT NULL,
+    height REAL,
+    is_fixed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_furniture_user_id ON furniture (user_id);
+
+CREATE TABLE IF NOT EXISTS layout_proposals (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms (id) ON DELETE CASCADE,
+    proposal_number INTEGER NOT NULL,
+    furniture_layout TEXT NOT NULL,  -- JSON: placed_furniture_list
+    score REAL NOT NULL,
+    reasoning TEXT
+);
+-- 部屋ごとの上位案をスコア順にたどるための索引と、全体の上位案のための索引
+CREATE INDEX IF NOT EXISTS idx_proposals_room_score ON layout_proposals (room_id, score DESC, id);
+CREATE INDEX IF NOT EXISTS idx_proposals_score ON layout_proposals (score DESC, id);
+
+CREATE TABLE IF NOT EXISTS knowledge (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    clearance_type TEXT,
+    min_distance REAL NOT NULL,
+    direction TEXT,
+    justification TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_knowledge_category ON knowledge (category);
+"""
+
+def _batches(rows: Iterable, size: int) -> Iterable[List]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class LayoutStorage:
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 自動コミットにし、トランザクションは _transaction で明示的に張る
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WALでは NORMAL でも破損しない (電源断時に直近のコミットが失われうるのみ)
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connection())
+
+    def close(self):
+        """このスレッドの接続を閉じる"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- 部屋 ---
+
+    def add_room(self, width: float, depth: float, door_positions: List[List[float]], window_positions: List[List[float]],
+                 user_id: Optional[int] = None, name: Optional[str] = None, height: Optional[float] = None) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO rooms (user_id, name, width, depth, height, door_position, window_position) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, name, width, depth, height, json.dumps(door_positions), json.dumps(window_positions))
+            )
+            return cursor.lastrowid
+
+    def get_room(self, room_id: int) -> Optional[Dict]:
+        row = self._connection().execute("SELECT * FROM rooms WHERE id = ?", (room_id,)).fetchone()
+        if row is None:
+            return None
+        room = dict(row)
+        room["door_positions"] = json.loads(room.pop("door_position"))
+        room["window_positions"] = json.loads(room.pop("window_position"))
+        return room
+
+    def list_rooms(self, user_id: int) -> List[Dict]:
+        rows = self._connection().execute("SELECT id FROM rooms WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return [self.get_room(row["id"]) for row in rows]
+
+    # --- 家具 ---
+
+    def add_furniture(self, items: Sequence[Dict]) -> List[int]:
+        """家具をまとめて登録し、登録順のIDを返す"""
+        with self._transaction() as conn:
+            return [
+                conn.execute(
+                    "INSERT INTO furniture (user_id, name, category, width, depth, height, is_fixed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (f.get("user_id"), f["name"], f["category"], f["width"], f["depth"], f.get("height"), int(bool(f.get("is_fixed", False))))
+                ).lastrowid
+                for f in items
+            ]
+
+    def get_furniture(self, furniture_ids: Sequence[int]) -> Dict[int, Dict]:
+        """IDから家具を引く (見つからないIDは結果に含まれない)"""
+        ids = list(dict.fromkeys(furniture_ids))
+        if not ids:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT * FROM furniture WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {row["id"]: {**dict(row), "is_fixed": bool(row["is_fixed"])} for row in rows}
+
+    def list_furniture(self, user_id: int) -> List[Dict]:
+        rows = self._connection().execute("SELECT * FROM furniture WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return [{**dict(row), "is_fixed": bool(row["is_fixed"])} for row in rows]
+
+    # --- レイアウト案 ---
+
+    def add_proposals(self, room_id: int, proposals: Iterable[Tuple[List[Dict], float, Optional[str]]],
+                      batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """
+        (家具配置, スコア, 根拠) の列をレイアウト案として書き込み、書き込んだ件数を返す。
+        batch_size 件ごとに1トランザクションの executemany で書くため、数千件でも行ごとのコミットが発生しない。
+        提案番号は部屋ごとの連番を続きから振る。
+        """
+        written = 0
+        for batch in _batches(proposals, batch_size):
+            with self._transaction() as conn:
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(proposal_number), 0) FROM layout_proposals WHERE room_id = ?", (room_id,)
+                ).fetchone()[0]
+                conn.executemany(
+                    "INSERT INTO layout_proposals (room_id, proposal_number, furniture_layout, score, reasoning) VALUES (?, ?, ?, ?, ?)",
+                    [(room_id, start + n, json.dumps(layout, ensure_ascii=False), float(score), reasoning)
+                     for n, (layout, score, reasoning) in enumerate(batch, start=1)]
+                )
+            written += len(batch)
+        return written
+
+    def top_proposals(self, room_id: Optional[int] = None, limit: int = 20,
+                      after: Optional[Tuple[float, int]] = None) -> Tuple[List[Dict], Optional[Tuple[float, int]]]:
+        """
+        スコアの高い順にレイアウト案を返す (room_id を省略すると全部屋から)。
+        after に前のページの最後の (score, id) を渡すと続きを返す (索引をたどるだけなので、深いページでも速い)。
+        戻り値: (案のリスト, 次のページの after。続きがなければ None)
+        """
+        conditions, params = [], []
+        if room_id is not None:
+            conditions.append("room_id = ?")
+            params.append(room_id)
+        if after is not None:
+            conditions.append("(score < ? OR (score = ? AND id > ?))")
+            params += [after[0], after[0], after[1]]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT * FROM layout_proposals {where} ORDER BY score DESC, id LIMIT ?", params + [limit + 1]
+        ).fetchall()
+
+        proposals = [{**dict(row), "furniture_layout": json.loads(row["furniture_layout"])} for row in rows[:limit]]
+        next_after = (proposals[-1]["score"], proposals[-1]["id"]) if len(rows) > limit else None
+        return proposals, next_after
+
+    # --- 知見 ---
+
+    def add_knowledge(self, rules: Iterable[Dict], batch_size: int = WRITE_BATCH_SIZE) -> int:
+        written = 0
+        for batch in _batches(rules, batch_size):
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO knowledge (category, clearance_type, min_distance, direction, justification) VALUES (?, ?, ?, ?, ?)",
+                    [(r["category"], r.get("clearance_type"), r["min_distance"], r.get("direction"), r.get("justification")) for r in batch]
+                )
+            written += len(batch)
+        return written
+
+    def list_knowledge(self, categories: Optional[Sequence[str]] = None) -> List[Dict]:
+        if categories is None:
+            rows = self._connection().execute("SELECT * FROM knowledge ORDER BY id").fetchall()
+        else:
+            categories = list(categories)
+            rows = self._connection().execute(
+                f"SELECT * FROM knowledge WHERE category IN ({','.join('?' * len(categories))}) ORDER BY id", categories
+            ).fetchall() if categories else []
+        return [dict(row) for row in rows]
+
+class _Transaction:
+    """BEGIN IMMEDIATE で書き込みトランザクションを張り、例外時はロールバックする"""
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
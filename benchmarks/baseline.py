@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import platform
+from datetime import datetime, timezone
+import numpy as np
+from typing import Dict, List
+
+# ベンチマーク結果 (JSON) の保存と、保存済みのベースラインとの比較。
+# 結果は {"meta": {...}, "results": {名前: 値}} の形式で、値はすべて小さいほど良い指標 (ミリ秒など)。
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+DEFAULT_TOLERANCE = 0.5  # ベースラインからこの割合を超えて遅くなったら性能劣化とみなす (共有マシンでは同じコードでも4割ほど揺らぐ)
+MIN_DELTA = 0.05  # これ未満の差 (ミリ秒) は計測誤差として無視する (ごく短い処理の揺らぎ対策)
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": str(os.cpu_count()),
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+def save_results(path: str, results: Dict[str, float], meta: Dict = None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": {**environment(), **(meta or {})}, "results": results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+def load_results(path: str) -> Dict[str, float]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+def median_results(rounds: List[Dict[str, float]]) -> Dict[str, float]:
+    """同じベンチマークを複数回まとめて実行した結果の項目ごとの中央値 (一時的な負荷の影響を抑える)"""
+    return {name: float(np.median([r[name] for r in rounds if name in r])) for name in rounds[0]}
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float = DEFAULT_TOLERANCE,
+            min_delta: float = MIN_DELTA) -> List[str]:
+    """ベースラインより tolerance を超えて悪化した項目を説明文のリストで返す (新規・削除された項目は無視)"""
+    regressions = []
+    for name in sorted(results.keys() & baseline.keys()):
+        before, after = baseline[name], results[name]
+        if before > 0 and after > before * (1.0 + tolerance) + min_delta:
+            regressions.append(f"{name}: {before:.3f} -> {after:.3f} (+{(after / before - 1.0) * 100:.0f}%)")
+    return regressions
+
+def report(results: Dict[str, float], baseline: Dict[str, float] = None):
+    """結果の一覧を表示 (ベースラインがあれば比率も)"""
+    width = max(len(name) for name in results)
+    for name in sorted(results):
+        line = f"{name:<{width}}  {results[name]:10.3f}"
+        if baseline and baseline.get(name):
+            line += f"  ({results[name] / baseline[name]:.2f}x)"
+        print(line)
+
+def finish(results: Dict[str, float], baseline_path: str, save: bool, tolerance: float, meta: Dict = None) -> int:
+    """
+    コマンドラインの共通処理。ベースラインと比較して劣化があれば 1 を返す。
+    save が真ならベースラインを今回の結果で置き換える (比較はしない)。
+    """
+    if save:
+        save_results(baseline_path, results, meta)
+        report(results)
+        print(f"ベースラインを保存しました: {baseline_path}")
+        return 0
+
+    baseline = load_results(baseline_path) if os.path.exists(baseline_path) else None
+    report(results, baseline)
+    if baseline is None:
+        print(f"ベースラインがありません ({baseline_path})。--save で作成してください。")
+        return 0
+
+    regressions = compare(results, baseline, tolerance)
+    if regressions:
+        print(f"性能劣化を検出しました (許容 +{tolerance * 100:.0f}%):")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    print("ベースラインとの差は許容範囲内です。")
+    return 0
@@ -0,0 +1,146 @@
+"""
+APIのエンドツーエンド負荷試験。uvicorn で main:app をローカルに起動し、合成リクエストを並行に送る。
+
+    python -m benchmarks.load                          # ベースラインと比較 (劣化があれば終了コード 1)
+    python -m benchmarks.load --save                   # ベースラインを更新
+    python -m benchmarks.load --concurrency 16 --requests 400 --scales small medium
+    python -m benchmarks.load --url http://127.0.0.1:8000   # 起動済みのサーバーに送る
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from benchmarks.synthetic import SCALES, generate_corpus
+from benchmarks.baseline import BASELINE_DIR, DEFAULT_TOLERANCE, finish
+
+BASELINE_PATH = f"{BASELINE_DIR}/load.json"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 30.0  # サーバーの起動を待つ最長時間 (秒)
+
+# --- サーバーの起動 ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port: int) -> subprocess.Popen:
+    """uvicorn main:app を子プロセスで起動し、応答するまで待つ"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"サーバーが起動できませんでした (終了コード {process.returncode})")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1.0).ok:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("サーバーの起動がタイムアウトしました")
+
+# --- 負荷の生成 ---
+
+def replay(base_url: str, corpus: List[Dict], num_requests: int, concurrency: int) -> Tuple[np.ndarray, Dict[str, int], float]:
+    """
+    corpus を巡回しながら num_requests 件を concurrency 並列で送る。
+    戻り値: (成功したリクエストの応答時間 (ms), 結果の内訳, 全体の所要時間 (秒))
+    """
+    local = threading.local()
+    url = f"{base_url}/api/diagnose_layout"
+
+    def send(n: int) -> Tuple[float, str]:
+        # 接続はスレッドごとに使い回す
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.post(url, json=corpus[n % len(corpus)], timeout=60)
+        except requests.RequestException:
+            return time.perf_counter() - start, "error"
+        elapsed = time.perf_counter() - start
+        if response.status_code == 503:
+            return elapsed, "rejected"
+        if not response.ok:
+            return elapsed, "error"
+        return elapsed, "degraded" if response.json().get("degraded") else "ok"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(send, range(num_requests)))
+    wall = time.perf_counter() - start
+
+    counts = {kind: 0 for kind in ["ok", "degraded", "rejected", "error"]}
+    for _, kind in outcomes:
+        counts[kind] += 1
+    latencies = np.array([t for t, kind in outcomes if kind in ("ok", "degraded")]) * 1000.0
+    return latencies, counts, wall
+
+def summarize(latencies: np.ndarray, num_requests: int, wall: float) -> Dict[str, float]:
+    """ベースラインに保存する指標 (いずれも小さいほど良い)"""
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.inf,) * 3
+    return {
+        "latency_p50_ms": float(p50),
+        "latency_p95_ms": float(p95),
+        "latency_p99_ms": float(p99),
+        "wall_ms_per_request": wall * 1000.0 / num_requests,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="起動済みのサーバーのURL (省略時はローカルに起動)")
+    parser.add_argument("--requests", type=int, default=200, help="送信するリクエスト数")
+    parser.add_argument("--corpus-size", type=int, help="異なるレイアウトの数 (省略時は全件異なる。小さくするとキャッシュに当たる)")
+    parser.add_argument("--concurrency", type=int, help="同時に送るリクエスト数 (省略時はサーバーの受け付け上限)")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium", "large"], choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=10, help="計測前に送るリクエスト数")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save", action="store_true", help="今回の結果をベースラインとして保存")
+    args = parser.parse_args()
+
+    # ウォームアップ用のレイアウトは本番のコーパスと重ならない seed で作る (キャッシュに当てない)
+    corpus = generate_corpus(args.corpus_size or args.requests, args.scales, seed=args.seed)
+    warmup_corpus = generate_corpus(max(args.warmup, 1), args.scales, seed=args.seed + 1_000_000)
+
+    process: Optional[subprocess.Popen] = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        process = start_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        if args.concurrency is None:
+            # 受け付け上限を超えて送ると 503 ばかりを計測することになるため、既定では上限ちょうどにする
+            args.concurrency = requests.get(f"{base_url}/api/executor_stats", timeout=5).json()["capacity"]
+        if args.warmup:
+            replay(base_url, warmup_corpus, args.warmup, args.concurrency)
+        latencies, counts, wall = replay(base_url, corpus, args.requests, args.concurrency)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print(f"{args.requests} リクエスト / 並列数 {args.concurrency}: {args.requests / wall:.1f} req/s  内訳 {counts}")
+    results = summarize(latencies, args.requests, wall)
+    status = finish(results, args.baseline, args.save, args.tolerance, meta={
+        "unit": "ms", "requests": args.requests, "concurrency": args.concurrency,
+        "scales": args.scales, "seed": args.seed, "throughput_rps": round(args.requests / wall, 2), "outcomes": counts
+    })
+    # 失敗したリクエストがあれば、性能に関係なく失敗として扱う
+    return 1 if counts["error"] else status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+"""
+採点処理のマイクロベンチマーク。
+
+    python -m benchmarks.micro                # ベースラインと比較 (劣化があれば終了コード 1)
+    python -m benchmarks.micro --save         # ベースラインを更新
+    python -m benchmarks.micro --scales small medium --rounds 5 --tolerance 0.5
+
+各項目は全体を --rounds 回繰り返して計測し、その中央値をベースラインと比べる。
+"""
+import time
+import argparse
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.scoring import (
+    create_occupancy_grid,
+    create_door_distance_field,
+    calculate_astar_path,
+    score_circulation,
+    score_aesthetics,
+    score_zoning,
+    check_hard_constraints
+)
+from backend.daylight import score_daylight
+from backend.batch_scoring import FurnitureSet, encode_layout
+from backend.rules import get_rules
+from backend.placement import PlacementMap
+from backend.optimizer import ROTATIONS
+from backend.annealing import SimulatedAnnealingOptimizer
+from benchmarks.synthetic import SCALES, generate_case
+from benchmarks.baseline import BASELINE_DIR, DEFAULT_TOLERANCE, finish, median_results
+
+BASELINE_PATH = f"{BASELINE_DIR}/micro.json"
+MIN_SAMPLE_TIME = 0.02  # 1サンプルの最短計測時間 (秒)。短い処理は複数回まとめて計る
+
+def measure(fn: Callable[[], object], repeat: int = 7) -> float:
+    """fn 1回あたりの所要時間 (ミリ秒)。他の処理の割り込みに左右されにくいよう、サンプルの最小値を使う"""
+    # 1サンプルが MIN_SAMPLE_TIME 以上になるように呼び出し回数を決める
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_TIME:
+            break
+        number *= 10 if elapsed < MIN_SAMPLE_TIME / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples) * 1000.0
+
+def astar_endpoints(distance_field: np.ndarray) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """ドアに最も近い通行可能セルから、到達可能な最も遠いセルまで (A*の最悪に近いケース)"""
+    finite = np.where(np.isfinite(distance_field), distance_field, -1.0)
+    if finite.max() < 0:
+        return (0, 0), (0, 0)
+    start = np.unravel_index(np.argmin(np.where(finite >= 0, finite, np.inf)), finite.shape)
+    end = np.unravel_index(np.argmax(finite), finite.shape)
+    return tuple(int(v) for v in start), tuple(int(v) for v in end)
+
+ANNEAL_STEPS = 256  # 焼きなましの計測で1回に試す移動の数 (結果は1移動あたりの時間にする)
+
+def annealing_steps(room, items, seed: int) -> Callable[[], None]:
+    """
+    焼きなましのステップ (1つの家具の移動・差分採点・取り消し) を ANNEAL_STEPS 回。
+    移動は SimulatedAnnealingOptimizer の提案をあらかじめ作っておき、毎回同じ順に試す。
+    """
+    optimizer = SimulatedAnnealingOptimizer(room, items, seed=seed)
+    state, rng = optimizer.state, np.random.default_rng(seed)
+    moves = [(k, optimizer._propose(k, rng.random(), rng.normal(size=2), float(rng.choice(ROTATIONS)), 0.5))
+             for k in rng.integers(0, len(items), size=ANNEAL_STEPS).tolist()]
+    def run():
+        for k, pose in moves:
+            state.move(k, *pose)
+            state.fitness
+            state.undo()
+    return run
+
+def benchmark_scale(scale: str, seed: int, repeat: int) -> Dict[str, float]:
+    room_input, furniture_inputs = generate_case(scale, seed)
+    room = build_room(room_input)
+    items = [PlacedFurniture(item) for item in furniture_inputs]
+    grid = create_occupancy_grid(room, items)
+    start, end = astar_endpoints(create_door_distance_field(room, grid))
+    furniture_set, pose = FurnitureSet(items), encode_layout(items)
+    clearance = get_rules().compile(room, furniture_set)
+
+    cases: List[Tuple[str, Callable[[], object]]] = [
+        ("create_occupancy_grid", lambda: create_occupancy_grid(room, items)),
+        ("calculate_astar_path", lambda: calculate_astar_path(grid, start, end)),
+        ("score_circulation", lambda: score_circulation(room, items, grid)),
+        ("score_aesthetics", lambda: score_aesthetics(room, items)),
+        ("score_zoning", lambda: score_zoning(items)),
+        ("score_daylight", lambda: score_daylight(room, items)),
+        ("placement_map", lambda: PlacementMap(room, furniture_set, pose, 0, ROTATIONS, clearance)),
+        ("check_hard_constraints", lambda: check_hard_constraints(room, items)),
+    ]
+    results = {f"{name}[{scale}]": measure(fn, repeat) for name, fn in cases}
+    # 1移動あたりの時間 (1000 / 値 が1秒あたりの移動回数)
+    results[f"anneal_step[{scale}]"] = measure(annealing_steps(room, items, seed), repeat) / ANNEAL_STEPS
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--rounds", type=int, default=3, help="全体を繰り返す回数 (項目ごとに中央値を取る)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save", action="store_true", help="今回の結果をベースラインとして保存")
+    args = parser.parse_args()
+
+    rounds = []
+    for _ in range(max(args.rounds, 1)):
+        results = {}
+        for scale in args.scales:
+            results.update(benchmark_scale(scale, args.seed, args.repeat))
+        rounds.append(results)
+    return finish(median_results(rounds), args.baseline, args.save, args.tolerance,
+                  meta={"unit": "ms", "seed": args.seed, "scales": args.scales, "rounds": args.rounds})
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""
+階層的な経路探索 (backend.pathfinding) の精度と速度のベンチマーク。
+
+    python -m benchmarks.pathfinding               # 精度の確認とベースラインとの比較 (どちらかが不合格なら終了コード 1)
+    python -m benchmarks.pathfinding --save        # ベースラインを更新
+    python -m benchmarks.pathfinding --scales large --queries 50
+
+精度は、正確な最短経路長 (グリッド全体のダイクストラ) に対する相対誤差で測る。
+階層的探索の経路長は実在する経路なので、正確な値より短くなることはない (短ければ不合格)。
+"""
+import argparse
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.scoring import (
+    calculate_astar_path,
+    calculate_distance_field,
+    create_occupancy_grid,
+    lookup_window_distance
+)
+from backend.pathfinding import ClusterGraph
+from backend.annealing import IncrementalLayoutState
+from benchmarks.synthetic import generate_case
+from benchmarks.baseline import BASELINE_DIR, DEFAULT_TOLERANCE, finish
+from benchmarks.micro import measure
+
+BASELINE_PATH = f"{BASELINE_DIR}/pathfinding.json"
+SCALES = ["large", "xlarge"]  # 階層的探索が有効になる規模
+ACCURACY_TOLERANCE = 0.15  # 正確な経路長に対する相対誤差の許容値
+
+def query_pairs(grid: np.ndarray, rng: np.random.Generator, n: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """通行可能なセルの組を n 個 (始点から終点に到達できるものに限る)"""
+    free = np.argwhere(grid == 0)
+    pairs = []
+    while len(pairs) < n:
+        a, b = (tuple(int(v) for v in free[i]) for i in rng.integers(len(free), size=2))
+        if a != b:
+            pairs.append((a, b))
+    return pairs
+
+def relative_errors(exact: List[float], approx: List[float]) -> List[float]:
+    """相対誤差の一覧。到達可否が食い違うか、正確な値より短い場合は inf とする"""
+    errors = []
+    for e, a in zip(exact, approx):
+        if e == np.inf or a == np.inf:
+            errors.append(0.0 if e == a else np.inf)
+        elif a < e - 1e-9:
+            errors.append(np.inf)
+        else:
+            errors.append(a / e - 1.0 if e > 0 else 0.0)
+    return errors
+
+def benchmark_scale(scale: str, seed: int, queries: int, repeat: int) -> Tuple[Dict[str, float], Dict[str, List[float]]]:
+    room_input, furniture_inputs = generate_case(scale, seed)
+    room = build_room(room_input)
+    items = [PlacedFurniture(item) for item in furniture_inputs]
+    grid = create_occupancy_grid(room, items)
+    graph = ClusterGraph(grid)
+    rng = np.random.default_rng(seed)
+    pairs = query_pairs(grid, rng, queries)
+
+    # 精度: 2点間の経路長と、ドアからの距離場の家具ごとの参照値
+    exact = [float(calculate_distance_field(grid, [a])[b]) for a, b in pairs]
+    errors = {"query": relative_errors(exact, [graph.path_length(a, b) for a, b in pairs])}
+
+    flat_state = IncrementalLayoutState(room, items, hierarchical=False)
+    hier_state = IncrementalLayoutState(room, items, hierarchical=True)
+    errors["door_field"] = relative_errors([flat_state.path_lengths[k] for k in flat_state.targets],
+                                           [hier_state.path_lengths[k] for k in hier_state.targets])
+
+    # 速度: 2点間の問い合わせ (同じ組を順に) と、家具1つを動かした後の距離場の作り直し
+    def run_queries(fn: Callable[[Tuple[int, int], Tuple[int, int]], float]) -> Callable[[], None]:
+        def run():
+            for a, b in pairs:
+                fn(a, b)
+        return run
+
+    def move_and_refresh(state: IncrementalLayoutState) -> Callable[[], None]:
+        k = state.targets[0]
+        poses = [tuple(state.poses[k]), (float(state.poses[k][0]) + 0.3, float(state.poses[k][1]), float(state.poses[k][2]))]
+        step = [0]
+        def run():
+            step[0] ^= 1
+            state.move(k, *poses[step[0]])
+            state.commit()
+            state.refresh_distance_field()
+        return run
+
+    cases = [
+        ("cluster_graph_build", lambda: ClusterGraph(grid)),
+        ("flat_astar_queries", run_queries(lambda a, b: calculate_astar_path(grid, a, b))),
+        ("hierarchical_queries", run_queries(graph.path_length)),
+        ("flat_door_field_refresh", move_and_refresh(flat_state)),
+        ("hierarchical_door_field_refresh", move_and_refresh(hier_state)),
+    ]
+    return {f"{name}[{scale}]": measure(fn, repeat) for name, fn in cases}, errors
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=SCALES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--accuracy-tolerance", type=float, default=ACCURACY_TOLERANCE)
+    parser.add_argument("--save", action="store_true", help="今回の結果をベースラインとして保存")
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for scale in args.scales:
+        timings, errors = benchmark_scale(scale, args.seed, args.queries, args.repeat)
+        results.update(timings)
+        for kind, values in errors.items():
+            worst = max(values) if values else 0.0
+            print(f"{kind}[{scale}]: 相対誤差 平均 {np.mean(values) * 100:.1f}% / 最大 {worst * 100:.1f}% ({len(values)} 件)")
+            if worst > args.accuracy_tolerance:
+                print(f"  精度が許容値 ({args.accuracy_tolerance * 100:.0f}%) を超えています")
+                failed = True
+
+    status = finish(results, args.baseline, args.save, args.tolerance,
+                    meta={"unit": "ms", "seed": args.seed, "scales": args.scales, "queries": args.queries})
+    return 1 if failed else status
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,82 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from backend.models import RoomInput, PlacedFurnitureInput
+
+# ベンチマーク用の合成データ生成。seed が同じなら常に同じ部屋と家具配置を生成する。
+
+# 規模ごとの (部屋の一辺の範囲 (m), 家具の数)
+SCALES: Dict[str, Tuple[Tuple[float, float], int]] = {
+    "small": ((3.0, 4.0), 5),
+    "medium": ((6.0, 8.0), 20),
+    "large": ((12.0, 15.0), 60),
+    "xlarge": ((25.0, 30.0), 200),
+}
+
+# カテゴリごとの (幅の範囲, 奥行きの範囲, 高さ) (m)
+FURNITURE_CATALOG = {
+    "Bed": ((0.9, 1.6), (1.9, 2.1), 0.5),
+    "Desk": ((0.9, 1.4), (0.5, 0.7), 0.7),
+    "Sofa": ((1.4, 2.2), (0.8, 0.95), 0.8),
+    "Shelf": ((0.6, 1.2), (0.3, 0.45), 1.8),
+    "Chair": ((0.45, 0.6), (0.45, 0.6), 0.9),
+    "Table": ((0.8, 1.6), (0.6, 0.9), 0.7),
+}
+CATEGORY_WEIGHTS = np.array([0.15, 0.15, 0.1, 0.25, 0.2, 0.15])
+
+MAX_PLACEMENT_TRIES = 30  # 重ならない位置を探す試行回数 (見つからなければ重なったまま置く)
+
+def generate_room(rng: np.random.Generator, width: float, depth: float) -> RoomInput:
+    """壁際にドア1〜2個・窓1〜3個を持つ部屋"""
+    def wall_point():
+        side = rng.integers(4)
+        t = float(rng.uniform(0.1, 0.9))
+        return [[t * width, 0.0], [t * width, depth], [0.0, t * depth], [width, t * depth]][side]
+
+    doors = [[round(v, 2) for v in wall_point()] for _ in range(int(rng.integers(1, 3)))]
+    windows = [[round(v, 2) for v in wall_point()] for _ in range(int(rng.integers(1, 4)))]
+    return RoomInput(width=width, depth=depth, door_positions=doors, window_positions=windows)
+
+def generate_furniture(rng: np.random.Generator, room: RoomInput, num_items: int) -> List[PlacedFurnitureInput]:
+    """
+    部屋の中に num_items 個の家具を置く。ベッドとデスクを必ず1つずつ含める。
+    できるだけ重ならない位置を選ぶが、部屋が狭ければ重なりも残る (ハード制約違反の経路も計測するため)。
+    """
+    categories = ["Bed", "Desk"] + list(rng.choice(list(FURNITURE_CATALOG), size=max(num_items - 2, 0), p=CATEGORY_WEIGHTS))
+    placed: List[Tuple[float, float, float, float]] = []  # 外接矩形 (x0, y0, x1, y1)
+    items = []
+    for i, category in enumerate(categories[:num_items]):
+        (w_lo, w_hi), (d_lo, d_hi), height = FURNITURE_CATALOG[category]
+        width, depth = round(float(rng.uniform(w_lo, w_hi)), 2), round(float(rng.uniform(d_lo, d_hi)), 2)
+        for _ in range(MAX_PLACEMENT_TRIES):
+            rotation = float(rng.choice([0.0, 90.0, 180.0, 270.0]))
+            hx, hy = (width / 2, depth / 2) if rotation in (0.0, 180.0) else (depth / 2, width / 2)
+            x = round(float(rng.uniform(hx, max(hx, room.width - hx))), 2)
+            y = round(float(rng.uniform(hy, max(hy, room.depth - hy))), 2)
+            box = (x - hx, y - hy, x + hx, y + hy)
+            if not any(box[0] < b[2] and b[0] < box[2] and box[1] < b[3] and b[1] < box[3] for b in placed):
+                break
+        placed.append(box)
+        items.append(PlacedFurnitureInput(
+            name=f"{category}{i}", category=category, width=width, depth=depth, height=height,
+            x=x, y=y, rotation=rotation
+        ))
+    return items
+
+def generate_case(scale: str, seed: int = 0) -> Tuple[RoomInput, List[PlacedFurnitureInput]]:
+    """規模 scale の部屋と家具配置を1組生成"""
+    (side_lo, side_hi), num_items = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    width, depth = round(float(rng.uniform(side_lo, side_hi)), 1), round(float(rng.uniform(side_lo, side_hi)), 1)
+    room = generate_room(rng, width, depth)
+    return room, generate_furniture(rng, room, num_items)
+
+def generate_corpus(num_requests: int, scales: List[str], seed: int = 0) -> List[Dict]:
+    """負荷試験用の /api/diagnose_layout リクエストボディ (規模を順に巡回する)"""
+    corpus = []
+    for n in range(num_requests):
+        room, items = generate_case(scales[n % len(scales)], seed=seed + n)
+        corpus.append({
+            "room": room.model_dump(),
+            "placed_furniture_list": [item.model_dump() for item in items],
+        })
+    return corpus
@@ -1,87 +1,524 @@
 # main.py (最終修正版)
-from fastapi import FastAPI, HTTPException
-from backend.models import DiagnosisRequest, Room, PlacedFurniture
-from backend.scoring import (
-    create_occupancy_grid,
-    score_circulation,
-    score_zoning,
-    score_aesthetics,
-    check_hard_constraints # check_hard_constraints は backend/scoring.py に定義されています
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from backend.models import (
+    RoomInput,
+    PlacedFurnitureInput,
+    DiagnosisRequest,
+    OptimizationRequest,
+    OptimizationJobRequest,
+    RoomCreateRequest,
+    FurnitureCreateRequest,
+    FurniturePlacement,
+    StoredDiagnosisRequest,
+    StoredOptimizationRequest,
+    SessionPatchRequest,
+    SpotSuggestionRequest,
+    ProposalInput,
+    Room,
+    PlacedFurniture
 )
+from backend.diagnosis import build_room, BatchDiagnoser, BatchLineError
+from backend.cache import DiagnosisCache
+from backend.executor import (
+    ScoringExecutor,
+    Overloaded,
+    DeadlineExceeded,
+    diagnose_in_worker,
+    diagnose_coarse,
+    shutdown_process_pool
+)
+from backend.optimizer import GeneticLayoutOptimizer, suggest_spots
+from backend.batch_scoring import FurnitureSet, encode_layout
+from backend.instrumentation import DiagnosisMetrics, server_timing, debug_info
+from backend.storage import DEFAULT_DB_PATH, LayoutStorage
+from backend.rules import load_rules
+from backend.jobs import FINISHED, JobManager
+from backend.sessions import SessionStore
+
+# 診断結果のキャッシュ (占有グリッド・距離場はワーカープロセスごとにキャッシュする)
+diagnosis_cache = DiagnosisCache()
+
+# 診断の段階ごとの所要時間と仕事量の集計 (/metrics で公開)
+diagnosis_metrics = DiagnosisMetrics()
+
+# 部屋・家具・レイアウト案の保存先
+storage = LayoutStorage(DEFAULT_DB_PATH)
+
+# 採点処理はプロセスプールで実行し、受け付け数と計算時間に上限を設ける
+scoring_executor = ScoringExecutor()
+
+# 時間のかかるレイアウト探索は非同期のジョブとして実行する (途中経過は SSE で配信)
+job_manager = JobManager()
+SSE_POLL_INTERVAL = 0.25  # ジョブの状態の変化を確認する間隔 (秒)
+SSE_KEEPALIVE = 15.0  # 変化がなくてもこの間隔で空のコメントを送り、接続を保つ (秒)
+
+# 画面操作ごとの差分を受け取るレイアウトセッション (一定時間使われないものとメモリの上限を超えた分は破棄する)
+session_store = SessionStore()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # クリアランス規則はプロセスプールを作る前に読み込む (ワーカーには起動時に渡す)
+    load_rules(storage)
+    await run_in_threadpool(scoring_executor.warm_up)
+    # 前回の停止時に未完了だったジョブは保存した状態から再開する
+    job_manager.start()
+    yield
+    await run_in_threadpool(job_manager.stop)
+    shutdown_process_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# --- 死活監視 ---
 
-app = FastAPI()
+@app.get("/api/health")
+def health():
+    """起動完了 (プロセスプールの準備後) に応答する。フロントエンドの起動待ちに使う"""
+    return {"status": "ok", "workers": scoring_executor.max_workers}
 
 # --- 診断用APIエンドポイント ---
 
 @app.post("/api/diagnose_layout")
-def diagnose_layout(request: DiagnosisRequest):
+async def diagnose_layout(request: DiagnosisRequest, response: Response, debug: bool = False):
+    """
+    レイアウトを診断する。段階ごとの所要時間は Server-Timing ヘッダで返し、/metrics に集計する。
+    ?debug=true を付けると、所要時間と仕事量 (探索ノード数・セル数・判定ペア数) を応答の debug フィールドにも含める。
+    """
+    started = time.perf_counter()
+    outcome, timings = "error", None
     try:
         # 1. 入力データを内部モデルに変換
-        room = Room(
-            width=request.room.width,
-            depth=request.room.depth,
-            door_positions=request.room.door_positions,   # リストを渡す
-            window_positions=request.room.window_positions # リストを渡す
-        )
-        
+        room = build_room(request.room)
         placed_items = [PlacedFurniture(item) for item in request.placed_furniture_list]
+        result, outcome, timings = await score_layout(room, placed_items)
+
+    except Overloaded as e:
+        outcome = "rejected"
+        raise overloaded_error(e)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        # エラー時に is_valid や warnings が定義されていない可能性を考慮
+        response_detail = f"内部エラー: {e}"
+        raise HTTPException(status_code=500, detail=response_detail)
+    finally:
+        diagnosis_metrics.observe(outcome, time.perf_counter() - started, timings)
+
+    # 4. 計測値を返す (キャッシュから返した場合は段階の記録がない)
+    timings = timings or {"stages": {}, "counters": {}}
+    total = time.perf_counter() - started
+    response.headers["Server-Timing"] = server_timing(timings, total)
+    if debug:
+        result = {**result, "debug": {**debug_info(timings, total), "outcome": outcome}}
+    return result
+
+async def score_layout(room: Room, placed_items: List[PlacedFurniture]) -> Tuple[Dict, str, Optional[Dict]]:
+    """
+    キャッシュ → プロセスプール → (締め切り超過時) 粗いグリッドの順に診断する。
+    戻り値: (診断結果, 結果の種類 ok/cached/degraded, 段階ごとの計測値)
+    """
+    # 2. 同じ (量子化して同一の) レイアウトを診断済みならキャッシュから返す
+    key, result = diagnosis_cache.get_result(room, placed_items)
+    if result is not None:
+        return result, "cached", None
+
+    # 3. プロセスプールで診断する。締め切りに間に合わなければ粗いグリッドでの概算を返す (キャッシュしない)
+    #    概算にも同時実行数の上限があり、溢れたら Overloaded (503) になる
+    try:
+        result, timings = await scoring_executor.run(diagnose_in_worker, room, placed_items)
+    except DeadlineExceeded:
+        result, timings = await scoring_executor.run_fallback(diagnose_coarse, room, placed_items)
+        return result, "degraded", timings
+    diagnosis_cache.put_result(key, result)
+    return result, "ok", timings
+
+# --- 一括診断APIエンドポイント (NDJSON) ---
+
+async def _iter_lines(chunks):
+    """受信中のリクエストボディを1行ずつ取り出す (ボディ全体をメモリに載せない)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    リクエストボディを受信しながら応答を返すストリーミング応答。
+    StreamingResponse は切断検知のため receive を並行して読むので、ボディの受信と競合してしまう。
+    切断はボディの読み取り側 (request.stream) で検知される。
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/api/diagnose_batch")
+async def diagnose_batch(request: Request):
+    """
+    NDJSON で受け取った多数のレイアウトを順に診断し、終わったものから NDJSON で返す。
+    入力の各行は {"room": {...}} (以降の行で共有する部屋) か、
+    {"placed_furniture_list": [...]} (必要なら "room" も含める)。
+    各行は単体の診断と同じくキャッシュ → プロセスプール (受け付け上限・締め切りつき) → 粗いグリッドの順に診断する。
+    受け付け上限に達していれば応答を始める前に 503 で断り、途中で溢れた行は retry_after 付きのエラー行を返す。
+    """
+    try:
+        scoring_executor.check_capacity()
+    except Overloaded as e:
+        raise overloaded_error(e)
+
+    async def stream_results():
+        diagnoser = BatchDiagnoser()
+        async for line in _iter_lines(request.stream()):
+            if not line.strip():
+                continue
+            try:
+                parsed = diagnoser.read_line(line)
+            except BatchLineError as e:
+                yield json.dumps({"index": e.index, "error": str(e)}, ensure_ascii=False) + "\n"
+                continue
+            if parsed is not None:
+                yield await diagnose_batch_line(*parsed)
+
+    return DuplexStreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def diagnose_batch_line(index: int, room: Room, placed_items: List[PlacedFurniture]) -> str:
+    """一括診断の1行を診断し、結果の NDJSON 行を返す"""
+    started = time.perf_counter()
+    outcome, timings = "error", None
+    try:
+        result, outcome, timings = await score_layout(room, placed_items)
+        result = {"index": index, **result}
+    except Overloaded as e:
+        outcome = "rejected"
+        result = {"index": index, "error": f"Overloaded: {e}", "retry_after": e.retry_after}
+    except Exception as e:
+        result = {"index": index, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        diagnosis_metrics.observe(outcome, time.perf_counter() - started, timings)
+    return json.dumps(result, ensure_ascii=False) + "\n"
+
+@app.get("/api/cache_stats")
+def cache_stats():
+    """キャッシュのヒット・ミス数と使用量"""
+    return diagnosis_cache.stats()
+
+@app.get("/api/executor_stats")
+def executor_stats():
+    """プロセスプールの受け付け状況 (実行中・拒否・締め切り超過の件数)"""
+    return scoring_executor.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus 形式の集計値 (診断の段階別ヒストグラム・プロセスプールとキャッシュの状態)"""
+    executor = scoring_executor.stats()
+    cache = diagnosis_cache.stats()["results"]
+    sessions = session_store.stats()
+    gauges = {
+        "layout_executor_in_flight": executor["in_flight"],
+        "layout_executor_capacity": executor["capacity"],
+        "layout_executor_rejected": executor["rejected"],
+        "layout_executor_timed_out": executor["timed_out"],
+        "layout_executor_fallback_in_flight": executor["fallback_in_flight"],
+        "layout_executor_fallback_rejected": executor["fallback_rejected"],
+        "layout_cache_hits": cache["hits"],
+        "layout_cache_misses": cache["misses"],
+        "layout_sessions": sessions["sessions"],
+        "layout_sessions_memory_bytes": sessions["memory_bytes"],
+    }
+    return PlainTextResponse(diagnosis_metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+# --- レイアウト提案APIエンドポイント (遺伝的アルゴリズム) ---
+
+@app.post("/api/optimize_layout")
+def optimize_layout(request: OptimizationRequest):
+    try:
+        room = build_room(request.room)
+        placed_items = [PlacedFurniture(item) for item in request.placed_furniture_list]
+
+        # 適応度の評価は診断と同じプロセスプールで並列に行う (受け付け枠も共有する)
+        with scoring_executor.slot():
+            optimizer = GeneticLayoutOptimizer(room, placed_items, population_size=request.population_size, seed=request.seed)
+            proposals = optimizer.run(
+                max_generations=request.max_generations,
+                time_budget=request.time_budget,
+                num_proposals=request.num_proposals
+            )
 
-        # 2. 【重要】ハード制約チェックを実行し、is_validとwarningsを定義
-        is_valid, warnings = check_hard_constraints(room, placed_items)
-        
-        # 3. スコアリング（採点）の実行
-        grid = create_occupancy_grid(room, placed_items)
-        
-        circulation_score = score_circulation(room, placed_items, grid)
-        zoning_score = score_zoning(placed_items)
-        aesthetics_score = score_aesthetics(room, placed_items)
-        
-        # 総合点 (重み付け)
-        total_score = (circulation_score * 0.4) + (zoning_score * 0.3) + (aesthetics_score * 0.3)
-        total_score_100 = round(total_score * 100, 1)
-
-        # 4. 診断コメントの生成 (LLMの代わりとなるロジック)
-        advice = ["診断結果です。"]
-        
-        # 【重要】物理的な重なりがある場合の処理を最優先
-        if not is_valid:
-             advice.insert(0, f"【重大】物理的制約違反が{len(warnings)}件あります: {'; '.join(warnings)}")
-             total_score_100 = 10.0 # 物理エラー時はスコアを10点に固定
-        else:
-             # is_validな場合のみ、点数に基づいた評価を行う
-             if total_score_100 < 50:
-                 advice.append("全体的に再配置が必要です。主要家具間の距離を見直しましょう。")
-             elif total_score_100 < 75:
-                 advice.append("合格点ですが、微調整で快適性が向上します。")
-             else:
-                 advice.append("非常に優れた配置です！快適な空間が実現されています。")
-
-             # 個別スコアに基づいたアドバイスもここで追加 (以前のロジック)
-             if circulation_score < 0.5:
-                 advice.append("動線が悪いです。家具が部屋の移動を妨げています。")
-             
-             if zoning_score < 0.5:
-                 advice.append("ゾーンが分離されていません。仕事場と休息の場をもう少し離しましょう。")
-                 
-             if aesthetics_score < 0.5:
-                 advice.append("家具の向きを見直しましょう。机は窓に背を向けず、ベッドからはドアが見える位置が理想です。")
-
-        # 5. 結果を返す
         return {
-            "total_score": total_score_100,
-            "details": {
-                "circulation": round(circulation_score, 2),
-                "zoning": round(zoning_score, 2),
-                "aesthetics": round(aesthetics_score, 2)
-            },
-            "is_valid": is_valid, 
-            "warnings": warnings, 
-            "advice": " ".join(advice)
+            "proposals": proposals,
+            "generations": optimizer.generation,
+            "evaluations": optimizer.evaluations
         }
 
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         import traceback
         traceback.print_exc()
-        # エラー時に is_valid や warnings が定義されていない可能性を考慮
-        response_detail = f"内部エラー: {e}"
-        raise HTTPException(status_code=500, detail=response_detail)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"内部エラー: {e}")
+
+# --- 家具の置き場所の提案 ---
+
+@app.post("/api/suggest_spots")
+def suggest_furniture_spots(request: SpotSuggestionRequest):
+    """他の家具を動かさずに、指定した家具を置ける位置を配置可能マップから求め、総合点の高い順に返す"""
+    if not 0 <= request.index < len(request.placed_furniture_list):
+        raise HTTPException(status_code=422, detail=f"家具の番号 {request.index} が範囲外です。")
+    try:
+        room = build_room(request.room)
+        placed_items = [PlacedFurniture(item) for item in request.placed_furniture_list]
+        with scoring_executor.slot():
+            spots = suggest_spots(room, FurnitureSet(placed_items), encode_layout(placed_items), request.index, request.num_spots)
+        return {"name": placed_items[request.index].name, "spots": spots}
+
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"内部エラー: {e}")
+
+# --- レイアウトセッション (差分による診断) ---
+
+def get_session_or_404(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"セッション {session_id} が見つかりません (期限切れの可能性があります)。")
+    return session
+
+@app.post("/api/sessions")
+def create_session(request: DiagnosisRequest):
+    """部屋と家具を登録してセッションを作り、現在の採点結果を返す。以降は PATCH で差分だけを送る"""
+    session = session_store.create(request.room, request.placed_furniture_list)
+    with session.lock:
+        return session.summary()
+
+@app.patch("/api/sessions/{session_id}")
+def patch_session(session_id: str, request: SessionPatchRequest, background_tasks: BackgroundTasks):
+    """
+    家具の移動・回転 (move)・追加 (add)・削除 (remove) を適用し、採点結果だけを返す。
+    動線は直前の距離場で概算し、距離場の作り直しは応答を返した後に行う (次の差分では最新の距離場を使う)。
+    """
+    session = get_session_or_404(session_id)
+    with session.lock:
+        try:
+            session.apply(request.ops)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        result = session.summary()
+    background_tasks.add_task(refresh_session, session)
+    return result
+
+def refresh_session(session):
+    with session.lock:
+        session.refresh()
+
+@app.get("/api/sessions/{session_id}")
+def get_session(session_id: str):
+    """現在の採点結果と家具の配置"""
+    session = get_session_or_404(session_id)
+    with session.lock:
+        session.refresh()
+        return {**session.summary(), "placed_furniture_list": session.layout()}
+
+@app.get("/api/sessions/{session_id}/diagnosis")
+def diagnose_session(session_id: str):
+    """保持している占有グリッドと距離場を使った詳しい診断 (アドバイス付き)"""
+    session = get_session_or_404(session_id)
+    with session.lock:
+        return session.diagnose()
+
+@app.get("/api/sessions/{session_id}/spots/{index}")
+def suggest_session_spots(session_id: str, index: int, num_spots: int = 5):
+    """セッションの家具 index を置ける位置 (保持している占有グリッドを使う)"""
+    session = get_session_or_404(session_id)
+    with session.lock:
+        try:
+            spots = session.suggest_spots(index, num_spots)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"version": session.version, "name": session.state.items[index].name, "spots": spots}
+
+@app.delete("/api/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"セッション {session_id} が見つかりません。")
+    return {"deleted": session_id}
+
+@app.get("/api/session_stats")
+def session_stats():
+    """保持しているセッションの数と推定メモリ使用量"""
+    return session_store.stats()
+
+# --- 非同期のレイアウト探索ジョブ ---
+
+def get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブ {job_id} が見つかりません。")
+    return job
+
+@app.post("/api/jobs", status_code=202)
+def submit_job(request: OptimizationJobRequest):
+    """
+    レイアウト探索をジョブとして受け付け、すぐにジョブIDを返す。
+    途中経過は GET /api/jobs/{id}/events (SSE) か GET /api/jobs/{id} で取得する。
+    """
+    job = job_manager.submit(request)
+    return {"id": job.id, "status": job.status}
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": job_manager.list_jobs()}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """ジョブの状態・最新の途中経過 (その時点の最良案)・最終結果"""
+    return get_job_or_404(job_id).to_dict()
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    get_job_or_404(job_id)
+    return job_manager.cancel(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    ジョブの状態を Server-Sent Events で配信する。接続時と変化のたびに最新の状態を送り、
+    終了 (done / cancelled / failed) を送ったら接続を閉じる。イベント名は進行中なら progress、終了時は状態名。
+    """
+    job = get_job_or_404(job_id)
+
+    async def stream_events():
+        sent_version, last_sent = -1, time.monotonic()
+        while not await request.is_disconnected():
+            if job.version != sent_version:
+                sent_version = job.version
+                status = job.status
+                event = status if status in FINISHED else "progress"
+                yield f"id: {sent_version}\nevent: {event}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                last_sent = time.monotonic()
+                if status in FINISHED:
+                    return
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    return StreamingResponse(stream_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- 保存済みの部屋・家具・レイアウト案 ---
+
+def proposal_reasoning(result: Dict) -> str:
+    details = result["details"]
+    text = f"動線 {details['circulation']:.2f} / ゾーニング {details['zoning']:.2f} / 美観 {details['aesthetics']:.2f} / 採光 {details['daylight']:.2f}"
+    if result.get("warnings"):
+        text += " / " + " ".join(result["warnings"])
+    return text
+
+def load_stored_layout(room_id: int, placements: List[FurniturePlacement]) -> Tuple[RoomInput, List[PlacedFurnitureInput]]:
+    """保存済みの部屋と家具IDの配置から、診断用の入力データを組み立てる"""
+    room = storage.get_room(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail=f"部屋 {room_id} が見つかりません。")
+    furniture = storage.get_furniture([p.furniture_id for p in placements])
+    missing = sorted({p.furniture_id for p in placements} - furniture.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"家具 {missing} が見つかりません。")
+
+    room_input = RoomInput(width=room["width"], depth=room["depth"],
+                           door_positions=room["door_positions"], window_positions=room["window_positions"])
+    items = [
+        PlacedFurnitureInput(name=furniture[p.furniture_id]["name"], category=furniture[p.furniture_id]["category"],
+                             width=furniture[p.furniture_id]["width"], depth=furniture[p.furniture_id]["depth"],
+                             height=furniture[p.furniture_id]["height"], x=p.x, y=p.y, rotation=p.rotation)
+        for p in placements
+    ]
+    return room_input, items
+
+@app.post("/api/rooms")
+def create_room(request: RoomCreateRequest):
+    room_id = storage.add_room(request.width, request.depth, request.door_positions, request.window_positions,
+                               user_id=request.user_id, name=request.name, height=request.height)
+    return {"id": room_id}
+
+@app.get("/api/rooms/{room_id}")
+def get_room(room_id: int):
+    room = storage.get_room(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail=f"部屋 {room_id} が見つかりません。")
+    return room
+
+@app.post("/api/furniture")
+def create_furniture(request: List[FurnitureCreateRequest]):
+    """家具をまとめて登録し、リクエストの順にIDを返す"""
+    return {"ids": storage.add_furniture([item.model_dump() for item in request])}
+
+@app.post("/api/rooms/{room_id}/diagnose")
+async def diagnose_stored_layout(room_id: int, request: StoredDiagnosisRequest):
+    """保存済みの部屋と家具 (IDで指定) の配置を診断する。save=true なら結果をレイアウト案として保存する"""
+    room_input, items = await run_in_threadpool(load_stored_layout, room_id, request.placements)
+    started = time.perf_counter()
+    outcome, timings = "error", None
+    try:
+        result, outcome, timings = await score_layout(build_room(room_input), [PlacedFurniture(item) for item in items])
+    except Overloaded as e:
+        outcome = "rejected"
+        raise overloaded_error(e)
+    finally:
+        diagnosis_metrics.observe(outcome, time.perf_counter() - started, timings)
+
+    if request.save:
+        layout = [item.model_dump() for item in items]
+        await run_in_threadpool(storage.add_proposals, room_id, [(layout, result["total_score"], proposal_reasoning(result))])
+    return result
+
+@app.post("/api/rooms/{room_id}/optimize")
+def optimize_stored_layout(room_id: int, request: StoredOptimizationRequest):
+    """保存済みの部屋と家具でレイアウト案を探索し、得られた案をまとめて保存する"""
+    room_input, items = load_stored_layout(room_id, request.placements)
+    result = optimize_layout(OptimizationRequest(
+        room=room_input, placed_furniture_list=items, num_proposals=request.num_proposals,
+        population_size=request.population_size, max_generations=request.max_generations,
+        time_budget=request.time_budget, seed=request.seed
+    ))
+    result["saved"] = storage.add_proposals(room_id, (
+        (p["placed_furniture_list"], p["total_score"], proposal_reasoning(p)) for p in result["proposals"]
+    ))
+    return result
+
+@app.post("/api/rooms/{room_id}/proposals")
+def import_proposals(room_id: int, request: List[ProposalInput]):
+    """採点済みのレイアウト案をまとめて保存する (一定件数ごとに1トランザクションで書き込む)"""
+    if storage.get_room(room_id) is None:
+        raise HTTPException(status_code=404, detail=f"部屋 {room_id} が見つかりません。")
+    written = storage.add_proposals(room_id, (
+        ([item.model_dump() for item in p.placed_furniture_list], p.score, p.reasoning) for p in request
+    ))
+    return {"written": written}
+
+@app.get("/api/rooms/{room_id}/proposals")
+def list_top_proposals(room_id: int, limit: int = 20, after_score: Optional[float] = None, after_id: Optional[int] = None):
+    """
+    スコアの高い順にレイアウト案を返す。
+    続きは応答の next (after_score, after_id) をそのままクエリに付けて取得する。
+    """
+    if storage.get_room(room_id) is None:
+        raise HTTPException(status_code=404, detail=f"部屋 {room_id} が見つかりません。")
+    after = (after_score, after_id) if after_score is not None and after_id is not None else None
+    proposals, next_after = storage.top_proposals(room_id, limit=min(max(limit, 1), 500), after=after)
+    return {
+        "proposals": proposals,
+        "next": {"after_score": next_after[0], "after_id": next_after[1]} if next_after else None
+    }
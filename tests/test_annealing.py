@@ -0,0 +1,85 @@
+import time
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.annealing import IncrementalLayoutState, SimulatedAnnealingOptimizer
+from backend.batch_scoring import FurnitureSet, score_population
+from backend.optimizer import VIOLATION_PENALTY
+from backend.daylight import score_daylight
+from backend.rules import CLEARANCE_PENALTY, create_label_grid, get_rules
+from backend.scoring import create_occupancy_grid, score_aesthetics, score_circulation, score_zoning, weighted_total
+from benchmarks.synthetic import generate_case, generate_furniture, generate_room
+
+def _full_scores(state):
+    """現在の配置を最初から採点し直した値"""
+    items = state.placed_furniture()
+    furniture_set = FurnitureSet(items)
+    result = score_population(state.room, furniture_set, state.poses[None])
+    hard, soft = get_rules().compile(state.room, furniture_set).count(state.poses, create_label_grid(state.room, items))
+    return {
+        "circulation": score_circulation(state.room, items, create_occupancy_grid(state.room, items)),
+        "zoning": score_zoning(items),
+        "aesthetics": score_aesthetics(state.room, items),
+        "daylight": score_daylight(state.room, items),
+        "violations": int(result["out_of_room"][0].sum() + result["overlaps"][0].sum()) + hard,
+        "soft_violations": soft,
+    }
+
+def _snapshot(state):
+    return (state.poses.copy(), state.coverage.copy(), list(state.path_lengths), state.zoning, state.aesthetics,
+            state.daylight, state.violations, state.fitness)
+
+@pytest.mark.parametrize("scale", ["small", "medium"])
+def test_incremental_state_matches_full_rescore(scale):
+    """移動・取り消し・確定を繰り返しても、差分更新した各スコアが最初から採点し直した値と一致する"""
+    room_input, furniture = generate_case(scale, 0)
+    room = build_room(room_input)
+    state = IncrementalLayoutState(room, [PlacedFurniture(f) for f in furniture], hierarchical=False)
+    rng = np.random.default_rng(0)
+    for step in range(120):
+        k = int(rng.integers(len(state.items)))
+        before = _snapshot(state)
+        state.move(k, float(rng.uniform(0, room.width)), float(rng.uniform(0, room.depth)), float(rng.choice([0, 90, 180, 270, 30])),
+                   defer=True)
+        if rng.random() < 0.5:
+            # 後回しにした更新を途中まで (0〜2段階) 進めてから取り消す
+            for _ in range(int(rng.integers(3))):
+                state.settle_next()
+            state.undo()
+            after = _snapshot(state)
+            assert all(np.array_equal(a, b) for a, b in zip(before[:3], after[:3]))
+            assert before[3:] == after[3:]
+        else:
+            state.commit()
+
+        # 動線は古い距離場で参照するため、作り直してから比べる
+        if step % 20 == 19:
+            state.refresh_distance_field()
+        full = _full_scores(state)
+        assert np.array_equal(state.coverage > 0, create_occupancy_grid(room, state.placed_furniture()) > 0)
+        assert state.zoning == full["zoning"]
+        assert state.aesthetics == pytest.approx(full["aesthetics"])
+        assert state.daylight == pytest.approx(full["daylight"])
+        assert (state.violations, state.soft_violations) == (full["violations"], full["soft_violations"])
+        if step % 20 == 19:
+            assert state.circulation == pytest.approx(full["circulation"])
+            assert state.fitness == pytest.approx(weighted_total(full["circulation"], full["zoning"], full["aesthetics"])
+                                                  - VIOLATION_PENALTY * full["violations"] - CLEARANCE_PENALTY * full["soft_violations"])
+
+MIN_MOVES_PER_SECOND = 10000  # 4×5m の部屋・家具10個で、焼きなましが1コアあたりに試せる移動回数の下限
+
+def test_annealing_throughput():
+    """4×5m の部屋・家具10個で、焼きなましが1秒あたり MIN_MOVES_PER_SECOND 回以上の移動を試せる"""
+    rng = np.random.default_rng(0)
+    room_input = generate_room(rng, 4.0, 5.0)
+    items = [PlacedFurniture(f) for f in generate_furniture(rng, room_input, 10)]
+    room = build_room(room_input)
+    rates = []
+    # 他のプロセスの負荷に左右されにくいよう、CPU時間で測って短い計測5回のうち最良の値で判定する
+    for _ in range(5):
+        optimizer = SimulatedAnnealingOptimizer(room, items, seed=0)
+        start = time.process_time()
+        optimizer.run(max_steps=10000)
+        rates.append(optimizer.steps / (time.process_time() - start))
+    assert max(rates) >= MIN_MOVES_PER_SECOND
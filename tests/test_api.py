@@ -0,0 +1,73 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+import main
+from backend.models import OptimizationJobRequest, OptimizationRequest, PlacedFurniture
+from backend.cache import DiagnosisCache
+from backend.diagnosis import build_room, run_diagnosis
+from backend.executor import ScoringExecutor
+from backend.storage import LayoutStorage
+from benchmarks.synthetic import generate_case
+
+@pytest.fixture
+def client(monkeypatch):
+    # lifespan (ジョブの再開・ワーカーの先行起動) は実行しない
+    monkeypatch.setattr(main, "scoring_executor", ScoringExecutor(max_workers=1, max_queue=0))
+    monkeypatch.setattr(main, "diagnosis_cache", DiagnosisCache())
+    return TestClient(main.app)
+
+def _batch_body(room_input, layouts):
+    lines = [{"room": room_input.model_dump()}] + [{"placed_furniture_list": [f.model_dump() for f in furniture]} for furniture in layouts]
+    lines.insert(2, {"placed_furniture_list": "壊れた行"})
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+
+def test_diagnose_batch_goes_through_executor(client):
+    """一括診断の各行は受け付け制御つきの実行器で診断され、読めない行はその行だけエラーになる"""
+    layouts = [generate_case("small", seed)[1] for seed in range(3)]
+    room_input = generate_case("small", 0)[0]
+    response = client.post("/api/diagnose_batch", content=_batch_body(room_input, layouts))
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert "error" in results[1]
+    room = build_room(room_input)
+    for result, furniture in zip([results[0]] + results[2:], layouts):
+        expected = run_diagnosis(room, [PlacedFurniture(f) for f in furniture])
+        assert result["total_score"] == pytest.approx(expected["total_score"])
+    assert main.scoring_executor.stats()["finished"] == len(layouts)
+
+def test_diagnose_batch_rejects_when_overloaded(client):
+    """受け付け上限に達していれば、一括診断も応答を始める前に 503 + Retry-After で断る"""
+    main.scoring_executor.in_flight = main.scoring_executor.capacity
+    room_input, furniture = generate_case("small", 0)
+    response = client.post("/api/diagnose_batch", content=_batch_body(room_input, [furniture]))
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+@pytest.mark.parametrize("field,value", [("time_budget", 60.0), ("max_generations", 1000), ("population_size", 500),
+                                         ("num_proposals", 0), ("time_budget", 0.0)])
+def test_sync_optimization_is_bounded(client, field, value):
+    """同期の探索は規模の上限を超える (または不正な) 値を 422 で断る"""
+    room_input, furniture = generate_case("small", 0)
+    body = {"room": room_input.model_dump(), "placed_furniture_list": [f.model_dump() for f in furniture], field: value}
+    assert client.post("/api/optimize_layout", json=body).status_code == 422
+
+def test_job_request_allows_larger_search():
+    """非同期の探索ジョブは同期の探索より大きな規模を受け付けるが、上限はある"""
+    room_input, furniture = generate_case("small", 0)
+    base = {"room": room_input.model_dump(), "placed_furniture_list": [f.model_dump() for f in furniture]}
+    request = OptimizationJobRequest(**base, time_budget=300.0, max_generations=10000, population_size=500)
+    assert request.time_budget == 300.0
+    with pytest.raises(ValidationError):
+        OptimizationRequest(**base, time_budget=300.0)
+    with pytest.raises(ValidationError):
+        OptimizationJobRequest(**base, time_budget=3600.0)
+
+def test_proposals_of_unknown_room_is_404(client, monkeypatch, tmp_path):
+    """存在しない部屋のレイアウト案の一覧は空のリストではなく 404 を返す"""
+    monkeypatch.setattr(main, "storage", LayoutStorage(str(tmp_path / "layout.db")))
+    room_id = main.storage.add_room(4.0, 5.0, [[0.0, 1.0]], [[2.0, 0.0]])
+    assert client.get(f"/api/rooms/{room_id}/proposals").json() == {"proposals": [], "next": None}
+    assert client.get(f"/api/rooms/{room_id + 1}/proposals").status_code == 404
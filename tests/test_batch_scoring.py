@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.scoring import score_aesthetics, score_zoning, check_hard_constraints
+from backend.batch_scoring import FurnitureSet, encode_layout, hard_constraint_warnings, score_population
+from benchmarks.synthetic import generate_case
+
+def _population(room, furniture_set, pose, rng, count):
+    """現在の配置のまわりのランダムな配置 (任意の角度・部屋からのはみ出しを含む)"""
+    poses = np.repeat(pose[None], count, axis=0)
+    poses[..., 0] = rng.uniform(-0.5, room.width + 0.5, size=poses.shape[:2])
+    poses[..., 1] = rng.uniform(-0.5, room.depth + 0.5, size=poses.shape[:2])
+    poses[..., 2] = np.where(rng.random(poses.shape[:2]) < 0.5, rng.choice([0.0, 90.0, 180.0, 270.0], size=poses.shape[:2]),
+                             rng.uniform(0.0, 360.0, size=poses.shape[:2]))
+    poses[0] = pose
+    return poses
+
+@pytest.mark.parametrize("scale,seed", [("small", 0), ("small", 1), ("medium", 0), ("medium", 2)])
+def test_score_population_matches_scalar_functions(scale, seed):
+    """母集団の一括採点は、1レイアウトずつの採点関数と完全に同じ値になる"""
+    room_input, furniture = generate_case(scale, seed)
+    room = build_room(room_input)
+    items = [PlacedFurniture(f) for f in furniture]
+    furniture_set = FurnitureSet(items)
+    poses = _population(room, furniture_set, encode_layout(items), np.random.default_rng(seed), 40)
+
+    result = score_population(room, furniture_set, poses)
+    for n, pose in enumerate(poses):
+        layout = furniture_set.to_placed_furniture(pose)
+        is_valid, warnings = check_hard_constraints(room, layout)
+        assert result["zoning"][n] == score_zoning(layout)
+        assert result["aesthetics"][n] == score_aesthetics(room, layout)
+        assert result["is_valid"][n] == is_valid
+        assert hard_constraint_warnings(furniture_set, result["out_of_room"][n], result["overlaps"][n]) == warnings
@@ -0,0 +1,59 @@
+import pytest
+from backend.models import PlacedFurniture, PlacedFurnitureInput, Room
+from backend.cache import DiagnosisCache, LRUCache, _quantize, diagnosis_key, layout_key
+
+def _item(name, category, x, y, rotation=0.0):
+    return PlacedFurniture(PlacedFurnitureInput(name=name, category=category, width=1.0, depth=0.5, x=x, y=y, rotation=rotation))
+
+def _room(doors=((0.0, 1.0),), windows=((2.0, 0.0), (0.0, 2.5))):
+    return Room(4.0, 5.0, [list(d) for d in doors], [list(w) for w in windows])
+
+@pytest.mark.parametrize("value,expected", [(0.0, 0), (0.099, 0), (0.1, 1), (0.25, 2), (-0.01, -1), (-0.1, -1)])
+def test_quantize_floors_to_cell(value, expected):
+    """量子化は四捨五入ではなく、値を含むセルの番号 (切り捨て) になる。負の値も同じ"""
+    assert _quantize(value, 0.1) == expected
+
+def test_key_is_shared_within_a_cell():
+    """同じセル内の移動はキャッシュに当たり、セルをまたぐと別のキーになる"""
+    room = _room()
+    base = [_item("ベッド", "Bed", 1.01, 2.0), _item("机", "Desk", 3.0, 4.0)]
+    same_cell = [_item("ベッド", "Bed", 1.09, 2.0), _item("机", "Desk", 3.0, 4.0)]
+    next_cell = [_item("ベッド", "Bed", 1.11, 2.0), _item("机", "Desk", 3.0, 4.0)]
+    assert diagnosis_key(room, base) == diagnosis_key(room, same_cell)
+    assert diagnosis_key(room, base) != diagnosis_key(room, next_cell)
+
+def test_keys_do_not_depend_on_order():
+    """家具やドア・窓の並び順を変えても同じキーになるが、名称やカテゴリが違えば診断結果のキーは変わる"""
+    items = [_item("ベッド", "Bed", 1.0, 2.0), _item("机", "Desk", 3.0, 4.0, 90.0), _item("棚", "Shelf", 0.5, 0.5)]
+    room = _room()
+    reordered_room = _room(windows=((0.0, 2.5), (2.0, 0.0)))
+    assert diagnosis_key(room, items) == diagnosis_key(reordered_room, items[::-1])
+    assert layout_key(room, items) == layout_key(reordered_room, items[::-1])
+
+    renamed = [_item("ソファ", "Sofa", 1.0, 2.0)] + items[1:]
+    assert diagnosis_key(room, renamed) != diagnosis_key(room, items)
+    # 占有グリッドと距離場は形状と配置だけで決まるので、中間データは共有する
+    assert layout_key(room, renamed) == layout_key(room, items)
+
+def test_lru_eviction_and_stats():
+    """容量を超えると最も長く使われていない要素から捨て、ヒット・ミス・追い出しを数える"""
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a が最近使われた要素になる
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+def test_cached_result_is_not_shared():
+    """キャッシュから返した結果に項目を追加しても、キャッシュ内の結果は変わらない"""
+    cache = DiagnosisCache()
+    room, items = _room(), [_item("ベッド", "Bed", 1.0, 2.0)]
+    key, result = cache.get_result(room, items)
+    assert result is None
+    cache.put_result(key, {"total_score": 80.0})
+    _, result = cache.get_result(room, items)
+    result["debug"] = {}
+    assert cache.get_result(room, items)[1] == {"total_score": 80.0}
+    assert cache.stats()["results"]["hits"] == 2
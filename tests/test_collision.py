@@ -0,0 +1,49 @@
+import math
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture, PlacedFurnitureInput
+from backend.collision import OVERLAP_TOLERANCE, find_overlaps, furniture_corners, overlapping, penetration_depths
+
+def _item(width, depth, x, y, rotation=0.0):
+    return PlacedFurniture(PlacedFurnitureInput(name="棚", category="Shelf", width=width, depth=depth, x=x, y=y, rotation=rotation))
+
+def _pairs(items):
+    return [(p.i, p.j) for p in find_overlaps(furniture_corners(items))]
+
+@pytest.mark.parametrize("rotation", [0.0, 30.0, 45.0])
+def test_thin_items_side_by_side_do_not_overlap(rotation):
+    """平行に並んだ薄い家具は、斜めで外接矩形が大きく重なっていても重なりとしない"""
+    angle = math.radians(rotation)
+    normal = (-math.sin(angle), math.cos(angle))
+    items = [_item(2.0, 0.05, 2.0 + normal[0] * 0.06 * k, 2.0 + normal[1] * 0.06 * k, rotation) for k in range(3)]
+    corners = furniture_corners(items)
+    assert _pairs(items) == []
+    assert not overlapping(corners[:-1], corners[1:]).any()
+
+def test_rotated_items_that_overlap():
+    """45度回転した正方形の角が隣の家具に食い込んでいれば、外接矩形の判定では分からない浅い重なりも検出する"""
+    items = [_item(1.0, 1.0, 0.0, 0.0, 45.0), _item(1.0, 1.0, 1.2, 0.0)]
+    corners = furniture_corners(items)
+    assert _pairs(items) == [(0, 1)]
+    assert find_overlaps(corners)[0].depth == pytest.approx(math.sqrt(0.5) - 0.7)
+    assert overlapping(corners[0], corners[1])
+
+@pytest.mark.parametrize("rotation", [0.0, 30.0, 90.0])
+def test_touching_edges_do_not_overlap(rotation):
+    """辺で接しているだけの家具は重なりとしない"""
+    angle = math.radians(rotation)
+    items = [_item(1.0, 0.6, 1.0, 1.0, rotation), _item(1.0, 0.6, 1.0 + math.cos(angle), 1.0 + math.sin(angle), rotation)]
+    corners = furniture_corners(items)
+    assert penetration_depths(corners[0], corners[1]) <= OVERLAP_TOLERANCE
+    assert _pairs(items) == []
+    assert not overlapping(corners[0], corners[1])
+
+def test_penetration_depth_is_minimum_separation():
+    """貫通深さは重なりを解消する最小移動量で、2つの家具を入れ替えても同じ"""
+    items = [_item(2.0, 1.0, 0.0, 0.0), _item(1.0, 1.0, 1.3, 0.2)]
+    corners = furniture_corners(items)
+    assert penetration_depths(corners[0], corners[1]) == pytest.approx(0.2)
+    assert penetration_depths(corners[1], corners[0]) == penetration_depths(corners[0], corners[1])
+    # 1ペアずつでも一括でも同じ値
+    batch = penetration_depths(np.stack([corners[0], corners[1]]), np.stack([corners[1], corners[0]]))
+    assert np.array_equal(batch, np.full(2, penetration_depths(corners[0], corners[1])))
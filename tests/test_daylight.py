@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture, Room
+from backend.diagnosis import build_room
+from backend.batch_scoring import FurnitureSet, encode_layout
+from backend.daylight import (DAYLIGHT_RESOLUTION, MAX_RAY_SAMPLES, DaylightState, get_daylight_field,
+                              score_daylight, score_daylight_batch)
+from benchmarks.synthetic import generate_furniture, generate_room
+
+def test_small_room_keeps_default_resolution():
+    """標本点が上限に収まる部屋は既定の解像度のまま"""
+    room = Room(15.0, 15.0, [[0.0, 1.0]], [[7.5, 0.0], [0.0, 7.5], [15.0, 5.0]])
+    assert get_daylight_field(room).resolution == DAYLIGHT_RESOLUTION
+
+def test_large_room_uses_coarser_field():
+    """30×30m・窓3つの部屋では粗いグリッドで標本点を上限内に抑え、単体・一括・差分更新の採点が一致する"""
+    room = Room(30.0, 30.0, [[0.0, 1.0]], [[15.0, 0.0], [0.0, 15.0], [30.0, 10.0]])
+    field = get_daylight_field(room)
+    assert field.resolution > DAYLIGHT_RESOLUTION
+    assert len(field.ray_cells) <= MAX_RAY_SAMPLES
+
+    rng = np.random.default_rng(0)
+    room_input = generate_room(rng, 30.0, 30.0)
+    room = build_room(room_input)
+    items = [PlacedFurniture(f) for f in generate_furniture(rng, room_input, 30)]
+    expected = score_daylight(room, items)
+    assert score_daylight_batch(room, FurnitureSet(items), encode_layout(items)[None])[0] == pytest.approx(expected)
+    assert DaylightState(room, items).score == pytest.approx(expected)
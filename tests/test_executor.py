@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.executor import Overloaded, ScoringExecutor, get_process_pool, shutdown_process_pool
+from backend.optimizer import GeneticLayoutOptimizer, evaluate_population
+from backend.rules import DEFAULT_RULES, ClearanceRules, get_rules, set_rules
+from benchmarks.synthetic import generate_case
+
+@pytest.fixture
+def restore_rules():
+    rules = get_rules()
+    yield
+    set_rules(rules)
+    shutdown_process_pool()
+
+def test_workers_use_rules_loaded_after_pool_start(restore_rules):
+    """プールのワーカーを起動した後に規則を読み込んでも、ワーカーと本体プロセスの採点が一致する"""
+    get_process_pool().submit(int).result()
+    set_rules(ClearanceRules(DEFAULT_RULES + [
+        {"category": "Bed", "clearance_type": "動線", "min_distance": 0.8, "direction": "All", "justification": "テスト用"},
+        {"category": "Chair", "clearance_type": "動線", "min_distance": 0.6, "direction": "Back", "justification": "テスト用"},
+    ]))
+
+    room_input, furniture = generate_case("small", 2)
+    room = build_room(room_input)
+    optimizer = GeneticLayoutOptimizer(room, [PlacedFurniture(f) for f in furniture], population_size=40, seed=0, workers=2)
+    for _ in range(3):
+        optimizer.step()
+    fitness, scores = optimizer._evaluate(optimizer.population)
+    expected_fitness, expected_scores = evaluate_population(room, optimizer.furniture_set, optimizer.population)
+    assert np.array_equal(fitness, expected_fitness)
+    assert np.array_equal(scores, expected_scores)
+
+def test_fallback_is_bounded():
+    """締め切り超過時の代替処理は fallback_capacity 件までしか同時に実行しない"""
+    executor = ScoringExecutor(max_workers=1, fallback_capacity=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run_fallback(release.wait, 5.0))
+        while executor.fallback_in_flight == 0:
+            await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await executor.run_fallback(int)
+        release.set()
+        assert await first
+        assert await executor.run_fallback(int) == 0
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["fallback_rejected"] == 1 and stats["fallback_in_flight"] == 0
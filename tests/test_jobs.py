@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import queue
+import threading
+import pytest
+from fastapi.testclient import TestClient
+import main
+from backend import jobs
+from backend.jobs import FINISHED, JobManager, _run_job
+from backend.models import OptimizationJobRequest
+from backend.optimizer import GeneticLayoutOptimizer
+from backend.rules import get_rules
+from benchmarks.synthetic import generate_case
+
+def _request(**options):
+    room_input, furniture = generate_case("small", 0)
+    return OptimizationJobRequest(room=room_input, placed_furniture_list=furniture, population_size=20, seed=0, **options)
+
+def _wait(predicate, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "時間内に状態が変わりませんでした"
+        time.sleep(0.05)
+
+def _run_in_process(request, checkpoint_path):
+    """_run_job をこのプロセス内で実行し、送られた (種類, 内容) の列を返す"""
+    messages = queue.Queue()
+    _run_job(request.model_dump_json(), checkpoint_path, get_rules(), messages, threading.Event(), threading.Event())
+    return [messages.get() for _ in range(messages.qsize())]
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs"))
+    manager.start()
+    yield manager
+    for job in list(manager.jobs.values()):
+        manager.cancel(job.id)
+    manager.stop()
+
+class Killed(BaseException):
+    """ワーカープロセスの強制終了の代わり (例外処理で捕まらない)"""
+
+def test_resume_from_checkpoint_after_kill(tmp_path, monkeypatch):
+    """途中で強制終了しても、保存した世代から再開した探索は中断しなかった探索と同じ結果になる"""
+    request = _request(max_generations=8, time_budget=600.0)
+    expected = _run_in_process(request, str(tmp_path / "uninterrupted.ckpt"))[-1]
+
+    checkpoint_path = str(tmp_path / "job.ckpt")
+    monkeypatch.setattr(jobs, "CHECKPOINT_INTERVAL", 0.0)
+    step = GeneticLayoutOptimizer.step
+    def killed_step(optimizer):
+        if optimizer.generation == 4:
+            raise Killed
+        step(optimizer)
+    monkeypatch.setattr(GeneticLayoutOptimizer, "step", killed_step)
+    with pytest.raises(Killed):
+        _run_in_process(request, checkpoint_path)
+    assert os.path.exists(checkpoint_path)
+
+    monkeypatch.setattr(GeneticLayoutOptimizer, "step", step)
+    messages = _run_in_process(request, checkpoint_path)
+    kind, progress = messages[0]
+    assert kind == "progress" and progress["generation"] == 4
+    assert messages[-1] == expected
+
+def test_resume_after_server_stop(manager):
+    """サーバーの停止時に実行中のジョブは状態を保存し、次の起動で保存した世代から再開する"""
+    job = manager.submit(_request(max_generations=20000, time_budget=600.0))
+    _wait(lambda: job.status == "running" and job.progress is not None)
+    manager.stop()
+    assert os.path.exists(manager._path(job.id, "ckpt"))
+
+    restarted = JobManager(manager.directory)
+    restarted.start()
+    try:
+        resumed = restarted.get(job.id)
+        assert resumed.resumed == 1
+        _wait(lambda: resumed.status == "running" and resumed.progress is not None)
+        assert resumed.progress["generation"] >= job.progress["generation"]
+    finally:
+        restarted.cancel(job.id)
+        _wait(lambda: resumed.status in FINISHED)
+        restarted.stop()
+
+def test_cancel(manager):
+    """待機中のジョブはその場で、実行中のジョブは次の世代の前に取り消され、途中状態は消える"""
+    running = manager.submit(_request(max_generations=20000, time_budget=600.0))
+    waiting = manager.submit(_request(max_generations=20000, time_budget=600.0))
+    assert manager.cancel(waiting.id).status == "cancelled"
+
+    _wait(lambda: running.status == "running" and running.progress is not None)
+    manager.cancel(running.id)
+    _wait(lambda: running.status in FINISHED, timeout=jobs.STOP_GRACE + 10.0)
+    assert running.status == "cancelled"
+    assert not os.path.exists(manager._path(running.id, "ckpt"))
+
+def test_events_are_ordered(manager, monkeypatch):
+    """SSE は途中経過を世代の順に送り、最後に終了のイベントを1回だけ送って閉じる"""
+    monkeypatch.setattr(main, "job_manager", manager)
+    client = TestClient(main.app)
+    job_id = client.post("/api/jobs", json=json.loads(_request(max_generations=60).model_dump_json())).json()["id"]
+
+    # 終了のイベントを送ると接続が閉じるので、応答全体を読んでから分解する
+    events = []
+    for message in filter(None, client.get(f"/api/jobs/{job_id}/events").text.split("\n\n")):
+        fields = dict(line.split(": ", 1) for line in message.split("\n") if not line.startswith(":"))
+        if fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+
+    assert [e[1] for e in events[:-1]] == ["progress"] * (len(events) - 1)
+    assert events[-1][1] == "done" and events[-1][2]["result"]["generations"] == 60
+    assert [e[0] for e in events] == sorted(set(e[0] for e in events))
+    generations = [e[2]["progress"]["generation"] for e in events if e[2]["progress"] is not None]
+    assert generations == sorted(generations)
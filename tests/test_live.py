@@ -0,0 +1,48 @@
+import math
+import numpy as np
+import pytest
+from backend.live import LiveLayoutScorer
+from benchmarks.synthetic import generate_case
+
+def _moved(furniture, rng):
+    moved = [f.model_copy() for f in furniture]
+    for f in moved[:3]:
+        f.x, f.y = f.x + float(rng.uniform(-0.5, 0.5)), f.y + float(rng.uniform(-0.5, 0.5))
+    return moved
+
+def test_distance_field_is_refreshed_only_on_request():
+    """操作ごとには距離場を作り直さず、refresh() や詳しい診断で作り直すと作り直した状態と同じ点数になる"""
+    room_input, furniture = generate_case("small", 0)
+    scorer = LiveLayoutScorer(refresh_interval=math.inf)
+    scorer.update(room_input, furniture)
+    field = scorer.state.distance_field
+
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        furniture = _moved(furniture, rng)
+        scorer.update(room_input, furniture)
+    assert scorer.state.distance_field is field and scorer.state.pending_grid_changes > 0
+
+    assert scorer.refresh()
+    assert not scorer.refresh()
+    assert scorer.summary() == LiveLayoutScorer().update(room_input, furniture)
+
+def test_distance_field_is_refreshed_on_schedule():
+    """refresh_interval を過ぎた操作では距離場を作り直す"""
+    room_input, furniture = generate_case("small", 1)
+    scorer = LiveLayoutScorer(refresh_interval=0.0)
+    scorer.update(room_input, furniture)
+    furniture = _moved(furniture, np.random.default_rng(1))
+    assert scorer.update(room_input, furniture) == LiveLayoutScorer().update(room_input, furniture)
+    assert scorer.state.pending_grid_changes == 0
+
+def test_diagnose_uses_fresh_distance_field():
+    """詳しい診断は距離場を最新にしてから行う"""
+    room_input, furniture = generate_case("small", 2)
+    scorer = LiveLayoutScorer(refresh_interval=math.inf)
+    scorer.update(room_input, furniture)
+    furniture = _moved(furniture, np.random.default_rng(2))
+    scorer.update(room_input, furniture)
+    fresh = LiveLayoutScorer()
+    fresh.update(room_input, furniture)
+    assert scorer.diagnose()["total_score"] == pytest.approx(fresh.diagnose()["total_score"])
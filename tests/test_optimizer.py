@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room, run_diagnosis
+from backend.optimizer import VIOLATION_PENALTY, GeneticLayoutOptimizer, describe_layout, evaluate_population, suggest_spots
+from backend.rules import CLEARANCE_PENALTY, get_rules
+from backend.scoring import weighted_total
+from benchmarks.synthetic import generate_case
+
+@pytest.mark.parametrize("seed", range(5))
+def test_valid_proposals_stay_valid(seed):
+    """GA が違反なしと評価した案は、describe_layout で採点し直しても違反なしになる"""
+    room_input, furniture = generate_case("small", seed)
+    room = build_room(room_input)
+    optimizer = GeneticLayoutOptimizer(room, [PlacedFurniture(f) for f in furniture], population_size=30, seed=seed, workers=1)
+    for _ in range(15):
+        optimizer.step()
+
+    poses = np.array(optimizer._pick_diverse(3, 0.5))
+    fitness, scores = evaluate_population(room, optimizer.furniture_set, poses)
+    ranked_valid = fitness > weighted_total(*scores.T) - VIOLATION_PENALTY / 2
+    assert ranked_valid.any()
+    for proposal, valid in zip(optimizer.proposals(3), ranked_valid):
+        if valid:
+            assert proposal["is_valid"], proposal["warnings"]
+            assert proposal["total_score"] == round(float(weighted_total(*scores[proposal["rank"] - 1])) * 100, 1)
+
+def _spot_layout(furniture_set, pose, index, spot):
+    pose = pose.copy()
+    pose[index] = [spot["x"], spot["y"], spot["rotation"]]
+    return furniture_set.to_placed_furniture(pose)
+
+@pytest.mark.parametrize("overlap", [False, True])
+def test_suggest_spots_match_describe_layout(overlap):
+    """置き場所の提案の点数は、その位置に置いた配置を describe_layout で採点した結果と一致する"""
+    room_input, furniture = generate_case("small", 1)
+    room = build_room(room_input)
+    optimizer = GeneticLayoutOptimizer(room, [PlacedFurniture(f) for f in furniture], population_size=30, seed=1, workers=1)
+    for _ in range(15):
+        optimizer.step()
+    furniture_set = optimizer.furniture_set
+    pose = optimizer.archive_poses[0].copy()
+    index = next(i for i, c in enumerate(furniture_set.categories) if c in ("Desk", "Bed", "Sofa"))
+    if overlap:
+        # 他の家具どうしを重ねて、提案する家具と関係のない違反を作る
+        a, b = [i for i in range(len(furniture_set)) if i != index][:2]
+        pose[b] = pose[a]
+
+    spots = suggest_spots(room, furniture_set, pose, index)
+    assert spots
+    for spot in spots:
+        described = describe_layout(room, _spot_layout(furniture_set, pose, index, spot))
+        assert spot["is_valid"] == described["is_valid"] == (not overlap)
+        assert spot["total_score"] == described["total_score"]
+        assert spot["details"] == pytest.approx(described["details"], abs=0.011)
+    if overlap:
+        # 違反が残っていても動線は採点して順位付けに使う
+        assert any(spot["details"]["circulation"] > 0 for spot in spots)
+
+@pytest.mark.parametrize("seed", [0, 7, 9])
+def test_total_score_keeps_baseline_weights(seed):
+    """総合点は 動線0.4・ゾーニング0.3・美観0.3 の重みのままで、採光は詳細として別に返す"""
+    room_input, furniture = generate_case("small", seed)
+    room = build_room(room_input)
+    items = [PlacedFurniture(f) for f in furniture]
+    soft_violations = get_rules().check(room, items)[2]
+    for result in (run_diagnosis(room, items), describe_layout(room, items)):
+        details = result["details"]
+        assert result["is_valid"] and "daylight" in details
+        expected = (0.4 * details["circulation"] + 0.3 * details["zoning"] + 0.3 * details["aesthetics"]
+                    - CLEARANCE_PENALTY * soft_violations)
+        # 詳細の値は小数2桁に丸めてあるので、その分の誤差を許す
+        assert result["total_score"] == pytest.approx(expected * 100, abs=1.0)
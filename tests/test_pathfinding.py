@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from backend.models import PlacedFurniture
+from backend.diagnosis import build_room
+from backend.scoring import calculate_distance_field, create_occupancy_grid, door_cells, lookup_window_distance
+from backend.pathfinding import ClusterGraph, HierarchicalDistanceField
+from backend.annealing import IncrementalLayoutState
+from benchmarks.pathfinding import ACCURACY_TOLERANCE, relative_errors
+from benchmarks.synthetic import generate_case
+
+def _windows(shape, rng, count):
+    """ランダムなセル範囲 (min_y, max_y, min_x, max_x)。グリッドの端に掛かるものを含む"""
+    rows, cols = shape
+    windows = []
+    for _ in range(count):
+        r, c = int(rng.integers(rows)), int(rng.integers(cols))
+        windows.append((r, min(r + int(rng.integers(1, 12)), rows - 1), c, min(c + int(rng.integers(1, 12)), cols - 1)))
+    return windows
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_hierarchical_field_within_tolerance_of_exact_field(seed):
+    """階層的な距離場の参照値は、正確な距離場より短くならず、許容誤差に収まり、到達可否も一致する"""
+    room_input, furniture = generate_case("large", seed)
+    room = build_room(room_input)
+    grid = create_occupancy_grid(room, [PlacedFurniture(f) for f in furniture])
+    sources = door_cells(room, grid.shape)
+    exact_field = calculate_distance_field(grid, sources)
+    field = HierarchicalDistanceField(ClusterGraph(grid), sources)
+
+    windows = _windows(grid.shape, np.random.default_rng(seed), 300)
+    exact = [lookup_window_distance(exact_field, *w) for w in windows]
+    errors = relative_errors(exact, [field.window_min(*w) for w in windows])
+    assert max(errors) <= ACCURACY_TOLERANCE
+
+def test_refreshed_field_matches_fresh_field():
+    """家具を動かして作り直した距離場 (クラスタの使い回しあり) は、新しく作った距離場と同じ経路長になる"""
+    room_input, furniture = generate_case("large", 0)
+    room = build_room(room_input)
+    state = IncrementalLayoutState(room, [PlacedFurniture(f) for f in furniture], hierarchical=True)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        for _ in range(10):
+            k = int(rng.integers(len(state.items)))
+            x, y, rotation = state.poses[k]
+            state.move(k, float(x + rng.uniform(-1, 1)), float(y + rng.uniform(-1, 1)), float(rotation))
+            state.commit()
+        state.refresh_distance_field()
+        fresh = IncrementalLayoutState(room, state.placed_furniture(), hierarchical=True)
+        assert [state.path_lengths[k] for k in state.targets] == pytest.approx([fresh.path_lengths[k] for k in fresh.targets])
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from backend.models import RoomInput, PlacedFurnitureInput, PlacedFurniture
+from backend.diagnosis import build_room, run_diagnosis
+from backend.annealing import IncrementalLayoutState
+from backend.batch_scoring import FurnitureSet, encode_layout
+from backend.optimizer import evaluate_population
+from backend.placement import PlacementMap
+from backend.rules import CLEARANCE_PENALTY, ClearanceRules, create_label_grid, get_rules
+from benchmarks.synthetic import generate_case
+
+def _full_clearance(state):
+    items = state.placed_furniture()
+    compiled = get_rules().compile(state.room, FurnitureSet(items))
+    labels = create_label_grid(state.room, items)
+    return compiled, compiled.evaluate(state.poses, labels), labels
+
+@pytest.mark.parametrize("scale", ["small", "medium"])
+def test_clearance_state_matches_full_evaluation(scale):
+    """移動・取り消し・追加・削除の後も、差分更新したクリアランス違反が全体の判定と一致する"""
+    room_input, furniture = generate_case(scale, 0)
+    room = build_room(room_input)
+    state = IncrementalLayoutState(room, [PlacedFurniture(f) for f in furniture], hierarchical=False)
+    rng = np.random.default_rng(0)
+    for _ in range(150):
+        u = rng.random()
+        if u < 0.03 and len(state.items) > 2:
+            state.remove(int(rng.integers(len(state.items))))
+        elif u < 0.06:
+            state.add(PlacedFurniture(furniture[int(rng.integers(len(furniture)))]))
+        else:
+            k = int(rng.integers(len(state.items)))
+            state.move(k, float(rng.uniform(0, room.width)), float(rng.uniform(0, room.depth)), float(rng.choice([0, 90, 180, 270, 45])))
+            if rng.random() < 0.5:
+                state.undo()
+            else:
+                state.commit()
+        compiled, (zones, blockers), labels = _full_clearance(state)
+        tracked = state.clearance_state
+        assert (tracked.hard, tracked.soft) == compiled.violations(zones)
+        assert np.array_equal(tracked.labels, labels)
+        assert all(np.array_equal(a, b) for a, b in zip(tracked.hits(), (zones, blockers)))
+
+def _desk_and(category, x=2.0, y=2.9):
+    room = build_room(RoomInput(width=4.0, depth=5.0, door_positions=[[2.0, 0.0]], window_positions=[[2.0, 5.0]]))
+    items = [
+        PlacedFurniture(PlacedFurnitureInput(name="デスク", category="Desk", width=1.2, depth=0.6, x=2.0, y=3.6, rotation=180.0)),
+        PlacedFurniture(PlacedFurnitureInput(name="椅子", category=category, width=0.45, depth=0.45, x=x, y=y)),
+    ]
+    return room, items
+
+def test_chair_may_stand_in_front_of_desk():
+    """デスクの前の椅子はクリアランス違反にならない (診断・最適化の採点・差分更新のどれでも)"""
+    room, items = _desk_and("Chair")
+    result = run_diagnosis(room, items)
+    assert result["is_valid"] and result["warnings"] == [] and result["total_score"] != 10.0
+
+    furniture_set = FurnitureSet(items)
+    fitness, _ = evaluate_population(room, furniture_set, encode_layout(items)[None])
+    state = IncrementalLayoutState(room, items)
+    assert (state.violations, state.soft_violations) == (0, 0)
+    assert fitness[0] == pytest.approx(state.fitness)
+
+    # 配置可能マップでも、椅子はデスクの前に置け、デスクは前に椅子があっても置ける
+    for index in (0, 1):
+        spots = PlacementMap(room, furniture_set, encode_layout(items), index, [0.0, 90.0, 180.0, 270.0]).candidates()
+        assert any(np.abs(spots[:, :2] - encode_layout(items)[index, :2]).max(axis=1) < 0.1)
+
+def test_ergonomic_clearance_is_soft():
+    """人間工学的なスペースの不足は警告と減点だけで、配置は有効なまま"""
+    room, with_chair = _desk_and("Chair")
+    _, with_stool = _desk_and("Stool")
+    chair, stool = run_diagnosis(room, with_chair), run_diagnosis(room, with_stool)
+    assert stool["is_valid"] and len(stool["warnings"]) == 1
+    assert stool["total_score"] == pytest.approx(chair["total_score"] - CLEARANCE_PENALTY * 100, abs=0.11)
+    state = IncrementalLayoutState(room, with_stool)
+    assert (state.violations, state.soft_violations) == (0, 1)
+
+def test_door_swing_is_hard():
+    """ドアの開閉スペースに入った家具はハード制約の違反になる"""
+    room, items = _desk_and("Chair", x=2.0, y=0.3)
+    result = run_diagnosis(room, items)
+    assert not result["is_valid"] and result["total_score"] == 10.0
+    assert IncrementalLayoutState(room, items).violations == 1
+
+def test_invalid_knowledge_rows_are_skipped():
+    """解釈できない知見テーブルの行は読み飛ばし、残りの規則は使う"""
+    rules = ClearanceRules([
+        {"category": "Desk", "min_distance": 0.6, "direction": "斜め"},
+        {"category": "Desk", "min_distance": "広め", "direction": "Front"},
+        {"category": "Desk", "min_distance": -1.0, "direction": "Front"},
+        {"min_distance": 0.5},
+        {"category": "Shelf", "min_distance": 0.5, "direction": "前"},
+    ])
+    assert len(rules.rules) == 1
+    assert list(rules.item_clearances) == ["Shelf"]
@@ -0,0 +1,109 @@
+import gc
+import json
+import tracemalloc
+import pytest
+from fastapi.testclient import TestClient
+import main
+from backend import sessions
+from backend.models import SessionOperation
+from backend.sessions import LayoutSession, SessionStore
+from benchmarks.synthetic import generate_case
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "session_store", SessionStore())
+    return TestClient(main.app)
+
+def _body(scale="small", seed=0):
+    room_input, furniture = generate_case(scale, seed)
+    return {"room": room_input.model_dump(), "placed_furniture_list": [f.model_dump() for f in furniture]}
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "move", "index": 0, "x": 1.0}, {"op": "remove", "index": 99}],
+    [{"op": "move", "index": 0, "x": 1.0}, {"op": "add"}],
+    [{"op": "move", "index": 0, "x": 1.0}, {"op": "move", "index": 1, "x": float("nan")}],
+    [{"op": "remove", "index": 0}, {"op": "move", "index": 4, "y": 1.0}],  # 削除で番号が詰まった後の範囲外
+])
+def test_invalid_patch_applies_nothing(client, ops):
+    """不正な差分が1つでもあれば 422 を返し、手前の有効な差分も適用しない"""
+    created = client.post("/api/sessions", json=_body()).json()
+    before = client.get(f"/api/sessions/{created['id']}").json()
+    # NaN は JSON の標準にないため、json.dumps で直接書き込んで送る
+    response = client.patch(f"/api/sessions/{created['id']}", content=json.dumps({"ops": ops}),
+                            headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    assert client.get(f"/api/sessions/{created['id']}").json() == before
+
+def test_unknown_session_is_404(client):
+    assert client.patch("/api/sessions/unknown", json={"ops": []}).status_code == 404
+    assert client.get("/api/sessions/unknown").status_code == 404
+
+def test_patch_matches_fresh_session(client):
+    """追加・移動・削除をまとめて適用した結果は、同じ配置で作り直したセッションと同じ点数になる"""
+    body = _body("small", 1)
+    session_id = client.post("/api/sessions", json=body).json()["id"]
+    new_item = {**body["placed_furniture_list"][0], "name": "追加した棚", "x": 1.0, "y": 1.0}
+    ops = [{"op": "add", "item": new_item}, {"op": "move", "index": len(body["placed_furniture_list"]), "rotation": 90.0},
+           {"op": "remove", "index": 0}]
+    patched = client.patch(f"/api/sessions/{session_id}", json={"ops": ops}).json()
+    assert patched["version"] == 1
+
+    current = client.get(f"/api/sessions/{session_id}").json()
+    fresh = client.post("/api/sessions", json={"room": body["room"], "placed_furniture_list": current["placed_furniture_list"]}).json()
+    assert {k: current[k] for k in ("total_score", "details", "warnings")} == {k: fresh[k] for k in ("total_score", "details", "warnings")}
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_expired_sessions_are_dropped(monkeypatch):
+    """最後の操作から ttl 秒を過ぎたセッションは破棄し、使われたセッションは残す"""
+    clock = _Clock()
+    monkeypatch.setattr(sessions.time, "monotonic", clock)
+    store = SessionStore(ttl=10.0)
+    room_input, furniture = generate_case("small", 0)
+    old = store.create(room_input, furniture)
+    clock.now = 5.0
+    recent = store.create(room_input, furniture)
+    clock.now = 11.0
+    assert store.get(recent.id) is recent
+    assert store.get(old.id) is None
+    assert store.stats()["expired"] == 1
+
+def test_least_recently_used_session_is_evicted_over_memory_limit():
+    """推定メモリ使用量の合計が上限を超えると、最も長く使われていないセッションから破棄する"""
+    room_input, furniture = generate_case("small", 0)
+    one = LayoutSession("probe", room_input, furniture).memory
+    store = SessionStore(memory_limit=int(one * 2.5))
+    first = store.create(room_input, furniture)
+    second = store.create(room_input, furniture)
+    assert store.get(first.id) is first  # first を最近使ったものにする
+    third = store.create(room_input, furniture)
+    assert [s.id for s in store.sessions.values()] == [first.id, third.id]
+    assert store.get(second.id) is None
+    stats = store.stats()
+    assert stats["evicted"] == 1 and stats["memory_bytes"] <= stats["memory_limit"]
+
+@pytest.mark.parametrize("scale", ["small", "medium", "large"])
+def test_memory_estimate_tracks_allocations(scale):
+    """セッションの推定メモリ使用量は、実際に確保したメモリと大きく違わず、家具の追加・削除に追従する"""
+    room_input, furniture = generate_case(scale, 0)
+    LayoutSession("warm", room_input, furniture)  # 部屋ごとに共有するキャッシュを先に作る
+    gc.collect()
+    tracemalloc.start()
+    try:
+        session = LayoutSession("measured", room_input, furniture)
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert 0.75 <= session.memory / allocated <= 1.33
+
+    before = session.memory
+    session.apply([SessionOperation(op="add", item=furniture[0])])
+    assert session.memory > before
+    session.apply([SessionOperation(op="remove", index=len(furniture))])
+    assert session.memory == pytest.approx(before, rel=0.05)
@@ -0,0 +1,65 @@
+import sqlite3
+import pytest
+from backend.storage import LayoutStorage
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = LayoutStorage(str(tmp_path / "layout.db"))
+    yield storage
+    storage.close()
+
+def _room(storage):
+    return storage.add_room(4.0, 5.0, [[0.0, 1.0]], [[2.0, 0.0]], user_id=1, name="寝室")
+
+def _proposals(scores):
+    return [([{"name": "ベッド", "x": float(n)}], score, f"案{n}") for n, score in enumerate(scores)]
+
+def _all_pages(storage, room_id, limit):
+    pages, after = [], None
+    while True:
+        proposals, after = storage.top_proposals(room_id, limit=limit, after=after)
+        pages.append([p["id"] for p in proposals])
+        if after is None:
+            return pages
+
+def test_proposals_are_listed_by_score_then_id(storage):
+    """レイアウト案はスコアの高い順 (同点は登録順) に並び、提案番号は部屋ごとに続きから振られる"""
+    room_id, other_id = _room(storage), _room(storage)
+    assert storage.add_proposals(room_id, _proposals([50.0, 80.0, 80.0]), batch_size=2) == 3
+    storage.add_proposals(other_id, _proposals([99.0]))
+    storage.add_proposals(room_id, _proposals([60.0]))
+
+    proposals, after = storage.top_proposals(room_id)
+    assert after is None
+    assert [(p["score"], p["reasoning"]) for p in proposals] == [(80.0, "案1"), (80.0, "案2"), (60.0, "案0"), (50.0, "案0")]
+    assert sorted(p["proposal_number"] for p in proposals) == [1, 2, 3, 4]
+    assert proposals[0]["furniture_layout"] == [{"name": "ベッド", "x": 1.0}]
+    # room_id を省略すると全部屋から
+    assert storage.top_proposals(limit=1)[0][0]["score"] == 99.0
+
+def test_keyset_cursor_is_stable_across_inserts(storage):
+    """ページの途中で案が追加されても、続きのページに同じ案が重複したり抜けたりしない"""
+    room_id = _room(storage)
+    storage.add_proposals(room_id, _proposals([90.0, 70.0, 70.0, 70.0, 50.0, 30.0]))
+    first, after = storage.top_proposals(room_id, limit=3)
+    assert [p["score"] for p in first] == [90.0, 70.0, 70.0]
+
+    # カーソルより上位の案 (次のページには出ない) と下位の案 (次のページに出る) を追加する
+    storage.add_proposals(room_id, _proposals([95.0, 70.0, 40.0]))
+    rest = []
+    while after is not None:
+        page, after = storage.top_proposals(room_id, limit=2, after=after)
+        rest += page
+    assert [p["score"] for p in rest] == [70.0, 70.0, 50.0, 40.0, 30.0]
+    assert not {p["id"] for p in first} & {p["id"] for p in rest}
+    # 追加後に最初から読み直すと、全件が1回ずつ並ぶ
+    ids = [i for page in _all_pages(storage, room_id, 4) for i in page]
+    assert len(ids) == len(set(ids)) == 9
+
+def test_unknown_room(storage):
+    """存在しない部屋には案を保存できず (何も書き込まない)、一覧は空になる"""
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.add_proposals(12345, _proposals([80.0]))
+    assert storage.get_room(12345) is None
+    assert storage.top_proposals(12345) == ([], None)
+    assert storage.top_proposals() == ([], None)